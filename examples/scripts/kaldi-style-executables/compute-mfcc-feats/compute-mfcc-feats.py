@@ -3,6 +3,7 @@ from __future__ import division, print_function
 
 import sys
 
+from kaldi.feat.extract import extract_features
 from kaldi.feat.mfcc import Mfcc, MfccOptions
 from kaldi.matrix import Vector
 from kaldi.util.options import ParseOptions
@@ -76,6 +77,19 @@ def compute_mfcc_feats(wav_rspecifier, feats_wspecifier, opts, mfcc_opts):
     return num_success != 0
 
 
+def compute_mfcc_feats_parallel(wav_rspecifier, feats_wspecifier, opts,
+                                mfcc_opts):
+    num_utts, num_success = extract_features(
+        Mfcc(mfcc_opts), wav_rspecifier, feats_wspecifier, opts.num_threads,
+        opts.vtln_map, opts.utt2spk, opts.vtln_warp, opts.channel,
+        opts.min_duration, opts.subtract_mean)
+
+    print("Done {} out of {} utterances".format(num_success, num_utts),
+          file=sys.stderr)
+
+    return num_success != 0
+
+
 if __name__ == '__main__':
     usage = """Create MFCC feature files.
 
@@ -98,6 +112,7 @@ if __name__ == '__main__':
                     "0 -> left, 1 -> right)")
     po.register_float("min-duration", 0.0, "Minimum duration of segments "
                       "to process (in seconds).")
+    po.register_int("num-threads", 1, "Number of feature extraction threads.")
 
     opts = po.parse_args()
 
@@ -108,4 +123,8 @@ if __name__ == '__main__':
     wav_rspecifier = po.get_arg(1)
     feats_wspecifier = po.get_arg(2)
 
-    compute_mfcc_feats(wav_rspecifier, feats_wspecifier, opts, mfcc_opts)
+    if opts.num_threads > 1:
+        compute_mfcc_feats_parallel(wav_rspecifier, feats_wspecifier, opts,
+                                    mfcc_opts)
+    else:
+        compute_mfcc_feats(wav_rspecifier, feats_wspecifier, opts, mfcc_opts)
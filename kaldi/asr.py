@@ -10,6 +10,22 @@ this module cover only the most "typical" combinations.
 
 from __future__ import division
 
+import asyncio as _asyncio
+import collections as _collections
+from concurrent import futures as _futures
+import contextlib as _contextlib
+import copy as _copy
+import multiprocessing as _multiprocessing
+import os as _os
+import queue as _queue
+import shutil as _shutil
+import tempfile as _tempfile
+import threading as _threading
+import time as _time
+import traceback as _traceback
+
+import numpy as _numpy
+
 from . import cudamatrix as _cumatrix
 from . import decoder as _dec
 from . import fstext as _fst
@@ -22,14 +38,18 @@ from .gmm import am as _gmm_am
 from . import hmm as _hmm
 from .lat import functions as _lat_funcs
 from . import lm as _lm
+from . import matrix as _mat
 from .matrix import _kaldi_matrix
 from . import rnnlm as _rnnlm
 from . import nnet3 as _nnet3
 from . import online2 as _online2
 from .util import io as _util_io
+from .util import table as _util_table
 
 
-__all__ = ['Recognizer',
+__all__ = ['DecodingStats',
+           'TimingCollector',
+           'Recognizer',
            'FasterRecognizer',
            'LatticeFasterRecognizer',
            'LatticeBiglmFasterRecognizer',
@@ -51,7 +71,436 @@ __all__ = ['Recognizer',
            'NnetOnlineRecognizer',
            'NnetLatticeFasterOnlineRecognizer',
            'NnetLatticeFasterOnlineGrammarRecognizer',
-           'LatticeLmRescorer']
+           'NnetOnlineBatchScheduler',
+           'NnetLatticeFasterOnlineBatchRecognizer',
+           'OnlineSession',
+           'AsyncOnlineSession',
+           'RecognizerPool',
+           'LatticeLmRescorer',
+           'decode_sharded']
+
+
+_OUTPUTS = frozenset(["alignment", "best_path", "lattice", "likelihood", "text",
+                      "weight", "words"])
+_PARTIAL_OUTPUTS = _OUTPUTS - frozenset(["lattice"])
+_BEST_PATH_OUTPUTS = _PARTIAL_OUTPUTS
+
+
+def _num_frames_decoded(decoder, decodable):
+    """Returns the number of frames decoded after decoding a decodable.
+
+    Big-LM decoders do not report the number of frames decoded, in which
+    case all frames of the decodable are decoded.
+    """
+    if hasattr(decoder, "num_frames_decoded"):
+        return decoder.num_frames_decoded()
+    return decodable.num_frames_ready()
+
+
+def _get_output(recognizer, outputs=None, partial=False, use_final_probs=True,
+                timer=None, num_frames=None):
+    """Returns decoding output of a recognizer.
+
+    Only the requested outputs are computed. In particular, lattice retrieval
+    and determinization are skipped unless "lattice" output is requested, and
+    best path traceback is skipped unless any of the other outputs are
+    requested.
+
+    Args:
+        recognizer (Recognizer or OnlineRecognizer): The recognizer.
+        outputs (Iterable[str]): Keys of the outputs to compute. If ``None``,
+            all outputs available are computed.
+        partial (bool): Whether to return partial output. Partial best path is
+            not converted to a compact lattice and lattice output is not
+            available.
+        use_final_probs (bool): Whether to use final probabilities when
+            computing best path.
+        timer (_StageTimer): If provided, best path traceback and output
+            formatting are timed as the "output" (or "partial_output") stage,
+            lattice retrieval and determinization are timed as the
+            "determinize" stage, and the raw lattice size is recorded.
+        num_frames (int): Number of frames decoded, added to decoding
+            statistics. If ``None``, it is queried from the decoder.
+
+    Returns:
+        A dictionary representing decoding output.
+
+    Raises:
+        ValueError: If requested outputs are not available.
+        RuntimeError: If decoding fails.
+    """
+    if timer is None:
+        timer = _StageTimer()
+    valid_outputs = _PARTIAL_OUTPUTS if partial else _OUTPUTS
+    if outputs is None:
+        outputs, lattice_required = valid_outputs, False
+    else:
+        outputs = frozenset([outputs] if isinstance(outputs, str) else outputs)
+        unknown_outputs = outputs - valid_outputs
+        if unknown_outputs:
+            raise ValueError("Unknown outputs: {}"
+                             .format(", ".join(sorted(unknown_outputs))))
+        lattice_required = "lattice" in outputs
+
+    decoder = recognizer.decoder
+    if not (partial or recognizer.allow_partial or decoder.reached_final()):
+        raise RuntimeError("No final state was active on the last frame.")
+
+    if recognizer.acoustic_scale != 0.0:
+        scale = _fst_utils.acoustic_lattice_scale(
+            1.0 / recognizer.acoustic_scale)
+
+    output = {}
+    if not outputs.isdisjoint(_BEST_PATH_OUTPUTS):
+        with timer.stage("partial_output" if partial else "output"):
+            try:
+                best_path = decoder.get_best_path(use_final_probs)
+            except RuntimeError:
+                raise RuntimeError("Empty decoding output.")
+
+            ali, words, weight = _fst_utils.get_linear_symbol_sequence(
+                best_path)
+
+            if "alignment" in outputs:
+                output["alignment"] = ali
+            if "words" in outputs:
+                output["words"] = words
+            if "weight" in outputs:
+                output["weight"] = weight
+            if "likelihood" in outputs:
+                output["likelihood"] = - (weight.value1 + weight.value2)
+            if "text" in outputs:
+                if recognizer.symbols:
+                    output["text"] = " ".join(
+                        _fst.indices_to_symbols(recognizer.symbols, words))
+                else:
+                    output["text"] = " ".join(map(str, words))
+            if "best_path" in outputs:
+                if not partial:
+                    if recognizer.acoustic_scale != 0.0:
+                        _fst_utils.scale_lattice(scale, best_path)
+                    best_path = _fst_utils.convert_lattice_to_compact_lattice(
+                        best_path)
+                output["best_path"] = best_path
+
+    stats = None if partial else recognizer.stats
+    if "lattice" not in outputs and stats is None:
+        return output
+    if stats is not None and num_frames is None:
+        num_frames = decoder.num_frames_decoded()
+    with timer.stage("determinize"):
+        try:
+            lat = decoder.get_raw_lattice()
+        except AttributeError:
+            if lattice_required:
+                raise ValueError("Lattice output is not available since the "
+                                 "decoder does not generate lattices.")
+            if stats is not None:
+                stats.add(num_frames)
+            return output
+        timer.num_lattice_states = lat.num_states()
+        timer.num_lattice_arcs = lat.num_arcs()
+        if stats is not None:
+            stats.add(num_frames, lat)
+        if "lattice" not in outputs:
+            return output
+        if lat.num_states() == 0:
+            raise RuntimeError("Empty output lattice.")
+        lat.connect()
+
+        lat = recognizer._determinize_lattice(lat)
+
+        if recognizer.acoustic_scale != 0.0:
+            if isinstance(lat, _fst.CompactLatticeVectorFst):
+                _fst_utils.scale_compact_lattice(scale, lat)
+            else:
+                _fst_utils.scale_lattice(scale, lat)
+        output["lattice"] = lat
+
+    return output
+
+
+class DecodingStats(object):
+    """Decoding statistics accumulated over utterances.
+
+    If the :attr:`stats` attribute of a recognizer is set to an instance of
+    this class, the recognizer updates it after decoding each utterance.
+    Copies of the recognizer used for multi-threaded decoding update the same
+    instance. This class is thread-safe.
+
+    Kaldi decoders do not expose their internal token counts. Search effort is
+    instead measured with the size of the raw state-level lattice, whose
+    states and arcs correspond to the tokens and forward links that survived
+    pruning. Lattice statistics are collected only for lattice generating
+    decoders. Enabling statistics causes the raw lattice to be retrieved even
+    if "lattice" output is not requested.
+
+    Attributes:
+        num_utterances (int): Number of utterances decoded.
+        num_frames (int): Total number of frames decoded.
+        num_lattice_states (int): Total number of raw lattice states.
+        num_lattice_arcs (int): Total number of raw lattice arcs.
+        peak_frames (int): Maximum number of frames in an utterance.
+        peak_lattice_states (int): Maximum number of raw lattice states in an
+            utterance.
+        peak_lattice_arcs (int): Maximum number of raw lattice arcs in an
+            utterance.
+    """
+    def __init__(self):
+        self._lock = _threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Resets all statistics."""
+        with self._lock:
+            self.num_utterances = 0
+            self.num_frames = 0
+            self.num_lattice_states = 0
+            self.num_lattice_arcs = 0
+            self.peak_frames = 0
+            self.peak_lattice_states = 0
+            self.peak_lattice_arcs = 0
+
+    def add(self, num_frames, lattice=None):
+        """Adds statistics for an utterance.
+
+        Args:
+            num_frames (int): Number of frames decoded.
+            lattice (Lattice): Raw state-level lattice.
+        """
+        if lattice is not None:
+            num_states, num_arcs = lattice.num_states(), lattice.num_arcs()
+        else:
+            num_states, num_arcs = 0, 0
+        with self._lock:
+            self.num_utterances += 1
+            self.num_frames += num_frames
+            self.num_lattice_states += num_states
+            self.num_lattice_arcs += num_arcs
+            self.peak_frames = max(self.peak_frames, num_frames)
+            self.peak_lattice_states = max(self.peak_lattice_states,
+                                           num_states)
+            self.peak_lattice_arcs = max(self.peak_lattice_arcs, num_arcs)
+
+    def as_dict(self):
+        """Returns statistics as a dictionary."""
+        with self._lock:
+            return {
+                "num_utterances": self.num_utterances,
+                "num_frames": self.num_frames,
+                "num_lattice_states": self.num_lattice_states,
+                "num_lattice_arcs": self.num_lattice_arcs,
+                "peak_frames": self.peak_frames,
+                "peak_lattice_states": self.peak_lattice_states,
+                "peak_lattice_arcs": self.peak_lattice_arcs,
+            }
+
+
+class TimingCollector(object):
+    """Timing statistics collected from recognizers.
+
+    If the :attr:`timing` attribute of a recognizer is set to an instance of
+    this class, the recognizer measures the wall time spent in each stage of
+    decoding an utterance and passes a timing record to :meth:`collect` once
+    the final output of the utterance is produced. Copies of the recognizer
+    used for multi-threaded decoding report to the same instance. This class
+    is thread-safe.
+
+    A timing record is a dictionary with the following `(key, value)` pairs:
+
+    ==================== ============================= ==================
+    key                  value                         value type
+    ==================== ============================= ==================
+    "recognizer"         Name of the recognizer class  `str`
+    "stages"             Seconds spent in each stage   `Dict[str, float]`
+    "num_frames"         Number of frames decoded      `int`
+    "num_lattice_states" Number of raw lattice states  `int` or `None`
+    "num_lattice_arcs"   Number of raw lattice arcs    `int` or `None`
+    ==================== ============================= ==================
+
+    Stages are named as follows:
+
+    ================ ==========================================================
+    stage            measured time
+    ================ ==========================================================
+    "decodable"      Constructing the decodable object from the input
+    "compute"        Neural network computation done ahead of the search
+    "search"         Graph search, including any computation done on demand
+    "finalize"       Final pruning of online decoders
+    "determinize"    Lattice retrieval and determinization
+    "output"         Best path traceback and output formatting
+    "partial_output" Partial output traceback of online recognizers
+    "decode"         Time an utterance spent in a batch decoding pipeline
+    ================ ==========================================================
+
+    Only the stages a recognizer goes through are included in a record. Note
+    that acoustic scores are computed on demand while searching, hence the
+    "search" stage also includes feature and neural network computation,
+    except for recognizers that compute them ahead of the search. Search
+    effort is reported as the size of the raw state-level lattice (see
+    :class:`DecodingStats`), which is recorded only if the raw lattice is
+    retrieved, i.e. if "lattice" output is requested or decoding statistics
+    are collected.
+
+    The base implementation accumulates records into totals used for
+    computing real-time factors. Subclasses can override :meth:`collect` to
+    forward records elsewhere, e.g. to a monitoring system.
+
+    Args:
+        frame_shift (float): Seconds of audio per decoded frame. This should
+            include the frame subsampling factor of the acoustic model, e.g.
+            0.03 for chain models with the default 10ms frame shift.
+    """
+    def __init__(self, frame_shift=0.01):
+        self.frame_shift = frame_shift
+        self._lock = _threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Resets all statistics."""
+        with self._lock:
+            self.num_utterances = 0
+            self.num_frames = 0
+            self.num_lattice_states = 0
+            self.num_lattice_arcs = 0
+            self.stage_seconds = _collections.OrderedDict()
+            self.max_seconds = 0.0
+
+    def collect(self, record):
+        """Collects a timing record.
+
+        Args:
+            record (dict): Timing record of an utterance.
+        """
+        with self._lock:
+            self.num_utterances += 1
+            self.num_frames += record["num_frames"]
+            if record["num_lattice_states"] is not None:
+                self.num_lattice_states += record["num_lattice_states"]
+                self.num_lattice_arcs += record["num_lattice_arcs"]
+            for stage, seconds in record["stages"].items():
+                self.stage_seconds[stage] = (
+                    self.stage_seconds.get(stage, 0.0) + seconds)
+            self.max_seconds = max(self.max_seconds,
+                                   sum(record["stages"].values()))
+
+    @property
+    def audio_seconds(self):
+        """Seconds of audio decoded."""
+        return self.num_frames * self.frame_shift
+
+    def rtf(self, stage=None):
+        """Returns the real-time factor of a stage.
+
+        Args:
+            stage (str): The stage. If ``None``, the real-time factor of all
+                stages combined is returned.
+
+        Returns:
+            float: Seconds spent in the stage per second of audio decoded.
+        """
+        with self._lock:
+            if stage is None:
+                seconds = sum(self.stage_seconds.values())
+            else:
+                seconds = self.stage_seconds.get(stage, 0.0)
+            audio_seconds = self.audio_seconds
+        return seconds / audio_seconds if audio_seconds > 0 else 0.0
+
+    def as_dict(self):
+        """Returns statistics as a dictionary."""
+        with self._lock:
+            audio_seconds = self.audio_seconds
+            total_seconds = sum(self.stage_seconds.values())
+            stage_seconds = dict(self.stage_seconds)
+            summary = {
+                "num_utterances": self.num_utterances,
+                "num_frames": self.num_frames,
+                "num_lattice_states": self.num_lattice_states,
+                "num_lattice_arcs": self.num_lattice_arcs,
+                "audio_seconds": audio_seconds,
+                "seconds": total_seconds,
+                "max_seconds": self.max_seconds,
+                "stage_seconds": stage_seconds,
+            }
+        if audio_seconds > 0:
+            summary["rtf"] = total_seconds / audio_seconds
+            summary["stage_rtf"] = {stage: seconds / audio_seconds
+                                    for stage, seconds in stage_seconds.items()}
+        else:
+            summary["rtf"] = 0.0
+            summary["stage_rtf"] = {stage: 0.0 for stage in stage_seconds}
+        return summary
+
+
+class _StageTimer(object):
+    """Measures the wall time spent in the stages of decoding an utterance."""
+    def __init__(self):
+        self.stages = _collections.OrderedDict()
+        self.num_lattice_states = None
+        self.num_lattice_arcs = None
+
+    @_contextlib.contextmanager
+    def stage(self, name):
+        """Context manager adding the time spent in its body to a stage."""
+        start = _time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (self.stages.get(name, 0.0) +
+                                 _time.perf_counter() - start)
+
+    def record(self, recognizer, num_frames):
+        """Returns the timing record of the utterance."""
+        return {
+            "recognizer": type(recognizer).__name__,
+            "stages": dict(self.stages),
+            "num_frames": num_frames,
+            "num_lattice_states": self.num_lattice_states,
+            "num_lattice_arcs": self.num_lattice_arcs,
+        }
+
+
+class _LmDiffFst(object):
+    """On-demand FST representing the difference between two language models.
+
+    Big-LM decoders consult this FST for the LM score difference while
+    decoding. It caches the states it visits, hence it should not be shared
+    between decoders running in different threads. Use :meth:`copy` to create
+    a new one that shares the language models.
+
+    Args:
+        old_lm (StdFst): Old LM with negated scores.
+        new_lm (StdFst): New LM.
+    """
+    def __init__(self, old_lm, new_lm):
+        self.old_lm = old_lm
+        self.new_lm = new_lm
+        self._old_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(old_lm)
+        self._new_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(new_lm)
+        self._compose_lm = _fst_spec.StdComposeDeterministicOnDemandFst(
+            self._old_lm, self._new_lm)
+        self.fst = _fst_spec.StdCacheDeterministicOnDemandFst(self._compose_lm)
+
+    @classmethod
+    def from_files(cls, old_lm_rxfilename, new_lm_rxfilename):
+        """Constructs a new LM difference FST from given files.
+
+        Args:
+            old_lm_rxfilename (str): Extended filename for reading the old LM.
+            new_lm_rxfilename (str): Extended filename for reading the new LM.
+
+        Returns:
+            _LmDiffFst: A new LM difference FST.
+        """
+        old_lm = _fst.read_fst_kaldi(old_lm_rxfilename)
+        _fst_utils.apply_probability_scale(-1.0, old_lm)
+        new_lm = _fst.read_fst_kaldi(new_lm_rxfilename)
+        return cls(old_lm, new_lm)
+
+    def copy(self):
+        """Returns a new LM difference FST sharing the language models."""
+        return _LmDiffFst(self.old_lm, self.new_lm)
 
 
 class Recognizer(object):
@@ -72,6 +521,70 @@ class Recognizer(object):
         self.allow_partial = allow_partial
         self.acoustic_scale = acoustic_scale
 
+    # Decoding statistics are collected if this is set to a DecodingStats.
+    stats = None
+
+    # Timing records are reported if this is set to a TimingCollector.
+    timing = None
+
+    # Big-LM recognizers constructed with from_files set this attribute so
+    # that they can be copied for multi-threaded decoding.
+    _lm_diff = None
+
+    # Recognizers constructed with from_files set this attribute to the
+    # decoder options, since not all decoders can return their options.
+    _decoder_opts = None
+
+    # Copies used by decode_batch. These are kept across calls so that their
+    # decoders, and the memory pools decoders keep internally, are reused.
+    _workers = None
+
+    def _clone(self, reuse=None):
+        """Returns a copy of the recognizer with a new decoder.
+
+        The copy shares the decoding graph and the models with this recognizer
+        but has its own decoder, hence the two can be used in different
+        threads at the same time.
+
+        Args:
+            reuse (Recognizer): A copy previously returned by this method. If
+                provided, its decoder is reused after updating the decoder
+                options.
+
+        Returns:
+            A new recognizer.
+
+        Raises:
+            ValueError: If the decoder can not be copied.
+        """
+        if self._decoder_opts is not None:
+            opts = self._decoder_opts
+        elif hasattr(self.decoder, "get_options"):
+            opts = self.decoder.get_options()
+        else:
+            raise ValueError("Recognizers with {} decoders can be copied only "
+                             "if they are constructed with from_files."
+                             .format(type(self.decoder).__name__))
+        recognizer = _copy.copy(self)
+        recognizer._workers = None
+        if reuse is not None:
+            recognizer.decoder = reuse.decoder
+            recognizer.decoder.set_options(opts)
+            recognizer._lm_diff = reuse._lm_diff
+            return recognizer
+        decoder_type = type(self.decoder)
+        graph = self.decoder._fst
+        if hasattr(self.decoder, "_lm_diff_fst"):
+            if self._lm_diff is None:
+                raise ValueError("Big-LM recognizers can be copied only if "
+                                 "they are constructed with from_files.")
+            recognizer._lm_diff = self._lm_diff.copy()
+            recognizer.decoder = decoder_type(graph, opts,
+                                              recognizer._lm_diff.fst)
+        else:
+            recognizer.decoder = decoder_type(graph, opts)
+        return recognizer
+
     def _make_decodable(self, loglikes):
         """Constructs a new decodable object from input log-likelihoods.
 
@@ -106,7 +619,7 @@ class Recognizer(object):
         else:
             return lattice
 
-    def decode(self, input):
+    def decode(self, input, outputs=None):
         """Decodes input.
 
         Output is a dictionary with the following `(key, value)` pairs:
@@ -133,71 +646,92 @@ class Recognizer(object):
         separated symbols. The "weight" output is a lattice weight consisting of
         (graph-score, acoustic-score).
 
+        If `outputs` is provided, only the requested outputs are computed.
+        For instance, lattice determinization is skipped unless "lattice"
+        output is requested.
+
         Args:
             input (object): Input to decode.
+            outputs (Iterable[str]): Keys of the outputs to compute. If
+                ``None``, all outputs available are computed.
 
         Returns:
             A dictionary representing decoding output.
 
         Raises:
+            ValueError: If requested outputs are not available.
             RuntimeError: If decoding fails.
         """
-        self.decoder.decode(self._make_decodable(input))
-
-        if not (self.allow_partial or self.decoder.reached_final()):
-            raise RuntimeError("No final state was active on the last frame.")
-
-        try:
-            best_path = self.decoder.get_best_path()
-        except RuntimeError:
-            raise RuntimeError("Empty decoding output.")
-
-        ali, words, weight = _fst_utils.get_linear_symbol_sequence(best_path)
-
-        if self.symbols:
-            text = " ".join(_fst.indices_to_symbols(self.symbols, words))
-        else:
-            text = " ".join(map(str, words))
-
-        likelihood = - (weight.value1 + weight.value2)
+        timer = _StageTimer()
+        with timer.stage("decodable"):
+            decodable = self._make_decodable(input)
+        with timer.stage("search"):
+            self.decoder.decode(decodable)
+        num_frames = _num_frames_decoded(self.decoder, decodable)
+        output = _get_output(self, outputs, timer=timer, num_frames=num_frames)
+        if self.timing is not None:
+            self.timing.collect(timer.record(self, num_frames))
+        return output
+
+    def decode_batch(self, inputs, num_threads=1, outputs=None):
+        """Decodes a sequence of inputs using multiple threads.
+
+        Each decoding thread uses its own copy of the recognizer. Copies share
+        the decoding graph and the models with this recognizer but have their
+        own decoders. Outputs are generated in the order inputs are provided.
+        Each output is a dictionary like the ones returned by :meth:`decode`.
+
+        Inputs are consumed lazily; at most a few inputs per thread are
+        pending at any time. Decoders of the copies are kept for reuse in
+        subsequent calls, hence this method should not be called again before
+        the previous generator is exhausted or closed.
 
-        if self.acoustic_scale != 0.0:
-            scale = _fst_utils.acoustic_lattice_scale(1.0 / self.acoustic_scale)
-            _fst_utils.scale_lattice(scale, best_path)
-        best_path = _fst_utils.convert_lattice_to_compact_lattice(best_path)
-
-        try:
-            lat = self.decoder.get_raw_lattice()
-        except AttributeError:
-            return {
-                "alignment": ali,
-                "best_path": best_path,
-                "likelihood": likelihood,
-                "text": text,
-                "weight": weight,
-                "words": words,
-            }
-        if lat.num_states() == 0:
-            raise RuntimeError("Empty output lattice.")
-        lat.connect()
+        Args:
+            inputs (Iterable[Tuple[str, object]]): Inputs to decode as
+                `(key, input)` pairs.
+            num_threads (int): Number of decoding threads.
+            outputs (Iterable[str]): Keys of the outputs to compute. If
+                ``None``, all outputs available are computed.
 
-        lat = self._determinize_lattice(lat)
+        Yields:
+            `(key, output)` pairs.
 
-        if self.acoustic_scale != 0.0:
-            if isinstance(lat, _fst.CompactLatticeVectorFst):
-                _fst_utils.scale_compact_lattice(scale, lat)
+        Raises:
+            ValueError: If the number of threads is not positive or the
+                recognizer can not be copied.
+            RuntimeError: If decoding fails.
+        """
+        if num_threads < 1:
+            raise ValueError("num_threads should be positive.")
+        if self._workers is None:
+            self._workers = []
+        for i in range(num_threads):
+            if i < len(self._workers):
+                self._workers[i] = self._clone(self._workers[i])
             else:
-                _fst_utils.scale_lattice(scale, lat)
+                self._workers.append(self._clone())
+        workers = _queue.Queue()
+        for worker in self._workers[:num_threads]:
+            workers.put(worker)
 
-        return {
-            "alignment": ali,
-            "best_path": best_path,
-            "lattice": lat,
-            "likelihood": likelihood,
-            "text": text,
-            "weight": weight,
-            "words": words,
-        }
+        def decode(input):
+            worker = workers.get()
+            try:
+                return worker.decode(input, outputs)
+            finally:
+                workers.put(worker)
+
+        max_pending = 2 * num_threads
+        pending = _collections.deque()
+        with _futures.ThreadPoolExecutor(num_threads) as executor:
+            for key, input in inputs:
+                pending.append((key, executor.submit(decode, input)))
+                if len(pending) > max_pending:
+                    key, future = pending.popleft()
+                    yield key, future.result()
+            while pending:
+                key, future = pending.popleft()
+                yield key, future.result()
 
 
 class FasterRecognizer(Recognizer):
@@ -225,7 +759,8 @@ class FasterRecognizer(Recognizer):
 
     @classmethod
     def from_files(cls, graph_rxfilename, symbols_filename=None,
-                   allow_partial=True, acoustic_scale=0.1, decoder_opts=None):
+                   allow_partial=True, acoustic_scale=0.1, decoder_opts=None,
+                   mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -237,11 +772,14 @@ class FasterRecognizer(Recognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (FasterDecoderOptions): Configuration options for the
                 decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             FasterRecognizer: A new recognizer.
         """
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.FasterDecoderOptions()
         decoder = _dec.FasterDecoder(graph, decoder_opts)
@@ -249,7 +787,9 @@ class FasterRecognizer(Recognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(decoder, symbols, allow_partial, acoustic_scale)
+        recognizer = cls(decoder, symbols, allow_partial, acoustic_scale)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class LatticeFasterRecognizer(Recognizer):
@@ -277,7 +817,8 @@ class LatticeFasterRecognizer(Recognizer):
 
     @classmethod
     def from_files(cls, graph_rxfilename, symbols_filename=None,
-                   allow_partial=True, acoustic_scale=0.1, decoder_opts=None):
+                   allow_partial=True, acoustic_scale=0.1, decoder_opts=None,
+                   mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -289,11 +830,14 @@ class LatticeFasterRecognizer(Recognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (LatticeFasterDecoderOptions): Configuration options
                 for the decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             LatticeFasterRecognizer: A new recognizer.
         """
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeFasterDecoder(graph, decoder_opts)
@@ -301,7 +845,9 @@ class LatticeFasterRecognizer(Recognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(decoder, symbols, allow_partial, acoustic_scale)
+        recognizer = cls(decoder, symbols, allow_partial, acoustic_scale)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class LatticeBiglmFasterRecognizer(Recognizer):
@@ -330,7 +876,7 @@ class LatticeBiglmFasterRecognizer(Recognizer):
     @classmethod
     def from_files(cls, graph_rxfilename, old_lm_rxfilename, new_lm_rxfilename,
                    symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -344,29 +890,27 @@ class LatticeBiglmFasterRecognizer(Recognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (LatticeFasterDecoderOptions): Configuration
                 options for the decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             LatticeBiglmFasterRecognizer: A new recognizer.
         """
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
-        self.old_lm = _fst.read_fst_kaldi(old_lm_rxfilename)
-        _fst_utils.apply_probability_scale(-1.0, self.old_lm)
-        self.new_lm = _fst.read_fst_kaldi(new_lm_rxfilename)
-        self._old_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.old_lm)
-        self._new_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.new_lm)
-        self._compose_lm = _fst_spec.StdComposeDeterministicOnDemandFst(
-            self._old_lm, self._new_lm)
-        self._cache_compose_lm = _fst_spec.StdCacheDeterministicOnDemandFst(
-            self._compose_lm)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
+        lm_diff = _LmDiffFst.from_files(old_lm_rxfilename, new_lm_rxfilename)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeBiglmFasterDecoder(graph, decoder_opts,
-                                                 self._cache_compose_lm)
+                                                 lm_diff.fst)
         if symbols_filename is None:
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(decoder, symbols, allow_partial, acoustic_scale)
+        recognizer = cls(decoder, symbols, allow_partial, acoustic_scale)
+        recognizer._lm_diff = lm_diff
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class MappedRecognizer(Recognizer):
@@ -452,7 +996,7 @@ class MappedFasterRecognizer(MappedRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -466,12 +1010,15 @@ class MappedFasterRecognizer(MappedRecognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (FasterDecoderOptions): Configuration options for the
                 decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             MappedFasterRecognizer: A new recognizer object.
         """
         transition_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.FasterDecoderOptions()
         decoder = _dec.FasterDecoder(graph, decoder_opts)
@@ -479,8 +1026,10 @@ class MappedFasterRecognizer(MappedRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, decoder, symbols,
-                   allow_partial, acoustic_scale)
+        recognizer = cls(transition_model, decoder, symbols,
+                         allow_partial, acoustic_scale)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class MappedLatticeFasterRecognizer(MappedRecognizer):
@@ -505,7 +1054,7 @@ class MappedLatticeFasterRecognizer(MappedRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -519,12 +1068,15 @@ class MappedLatticeFasterRecognizer(MappedRecognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (LatticeFasterDecoderOptions): Configuration options
                 for the decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             MappedFasterRecognizer: A new recognizer object.
         """
         transition_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeFasterDecoder(graph, decoder_opts)
@@ -532,8 +1084,10 @@ class MappedLatticeFasterRecognizer(MappedRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, decoder, symbols,
-                   allow_partial, acoustic_scale)
+        recognizer = cls(transition_model, decoder, symbols,
+                         allow_partial, acoustic_scale)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class MappedLatticeBiglmFasterRecognizer(MappedRecognizer):
@@ -558,7 +1112,7 @@ class MappedLatticeBiglmFasterRecognizer(MappedRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename, old_lm_rxfilename,
                    new_lm_rxfilename, symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -574,31 +1128,29 @@ class MappedLatticeBiglmFasterRecognizer(MappedRecognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (LatticeFasterDecoderOptions): Configuration
                 options for the decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             MappedLatticeBiglmFasterRecognizer: A new recognizer.
         """
         transition_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
-        self.old_lm = _fst.read_fst_kaldi(old_lm_rxfilename)
-        _fst_utils.apply_probability_scale(-1.0, self.old_lm)
-        self.new_lm = _fst.read_fst_kaldi(new_lm_rxfilename)
-        self._old_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.old_lm)
-        self._new_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.new_lm)
-        self._compose_lm = _fst_spec.StdComposeDeterministicOnDemandFst(
-            self._old_lm, self._new_lm)
-        self._cache_compose_lm = _fst_spec.StdCacheDeterministicOnDemandFst(
-            self._compose_lm)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
+        lm_diff = _LmDiffFst.from_files(old_lm_rxfilename, new_lm_rxfilename)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeBiglmFasterDecoder(graph, decoder_opts,
-                                                 self._cache_compose_lm)
+                                                 lm_diff.fst)
         if symbols_filename is None:
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, decoder, symbols,
-                   allow_partial, acoustic_scale)
+        recognizer = cls(transition_model, decoder, symbols,
+                         allow_partial, acoustic_scale)
+        recognizer._lm_diff = lm_diff
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class GmmRecognizer(Recognizer):
@@ -692,7 +1244,7 @@ class GmmFasterRecognizer(GmmRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new GMM recognizer from given files.
 
         Args:
@@ -705,12 +1257,15 @@ class GmmFasterRecognizer(GmmRecognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (FasterDecoderOptions): Configuration options for the
                 decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             A new GMM recognizer object.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.FasterDecoderOptions()
         decoder = _dec.FasterDecoder(graph, decoder_opts)
@@ -718,8 +1273,10 @@ class GmmFasterRecognizer(GmmRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, acoustic_scale)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, acoustic_scale)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class GmmLatticeFasterRecognizer(GmmRecognizer):
@@ -746,7 +1303,7 @@ class GmmLatticeFasterRecognizer(GmmRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new GMM recognizer from given files.
 
         Args:
@@ -759,12 +1316,15 @@ class GmmLatticeFasterRecognizer(GmmRecognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (LatticeFasterDecoderOptions): Configuration options
                 for the decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             A new GMM recognizer object.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeFasterDecoder(graph, decoder_opts)
@@ -772,8 +1332,10 @@ class GmmLatticeFasterRecognizer(GmmRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, acoustic_scale)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, acoustic_scale)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class GmmLatticeBiglmFasterRecognizer(GmmRecognizer):
@@ -800,7 +1362,7 @@ class GmmLatticeBiglmFasterRecognizer(GmmRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename, old_lm_rxfilename,
                    new_lm_rxfilename, symbols_filename=None, allow_partial=True,
-                   acoustic_scale=0.1, decoder_opts=None):
+                   acoustic_scale=0.1, decoder_opts=None, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -815,31 +1377,29 @@ class GmmLatticeBiglmFasterRecognizer(GmmRecognizer):
             acoustic_scale (float): Acoustic score scale.
             decoder_opts (LatticeFasterDecoderOptions): Configuration
                 options for the decoder.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             GmmLatticeBiglmFasterRecognizer: A new recognizer.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
-        self.old_lm = _fst.read_fst_kaldi(old_lm_rxfilename)
-        _fst_utils.apply_probability_scale(-1.0, self.old_lm)
-        self.new_lm = _fst.read_fst_kaldi(new_lm_rxfilename)
-        self._old_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.old_lm)
-        self._new_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.new_lm)
-        self._compose_lm = _fst_spec.StdComposeDeterministicOnDemandFst(
-            self._old_lm, self._new_lm)
-        self._cache_compose_lm = _fst_spec.StdCacheDeterministicOnDemandFst(
-            self._compose_lm)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
+        lm_diff = _LmDiffFst.from_files(old_lm_rxfilename, new_lm_rxfilename)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeBiglmFasterDecoder(graph, decoder_opts,
-                                                 self._cache_compose_lm)
+                                                 lm_diff.fst)
         if symbols_filename is None:
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, acoustic_scale)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, acoustic_scale)
+        recognizer._lm_diff = lm_diff
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class NnetRecognizer(Recognizer):
@@ -883,6 +1443,33 @@ class NnetRecognizer(Recognizer):
         super(NnetRecognizer, self).__init__(decoder, symbols, allow_partial,
                                              self.decodable_opts.acoustic_scale)
 
+    def _clone(self, reuse=None):
+        """Returns a copy of the recognizer with a new decoder.
+
+        The copy shares the decoding graph and the models with this recognizer
+        but has its own decoder and nnet3 compiler, hence the two can be used
+        in different threads at the same time.
+
+        Args:
+            reuse (NnetRecognizer): A copy previously returned by this method.
+                If provided, its decoder and compiler are reused.
+
+        Returns:
+            A new recognizer.
+
+        Raises:
+            ValueError: If the decoder can not be copied.
+        """
+        recognizer = super(NnetRecognizer, self)._clone(reuse)
+        if reuse is not None:
+            recognizer.compiler = reuse.compiler
+        else:
+            recognizer.compiler = (
+                _nnet3.CachingOptimizingCompiler.new_with_optimize_opts(
+                    self.acoustic_model.get_nnet(),
+                    self.decodable_opts.optimize_config))
+        return recognizer
+
     @staticmethod
     def read_model(model_rxfilename):
         """Reads model from an extended filename."""
@@ -969,7 +1556,7 @@ class NnetFasterRecognizer(NnetRecognizer):
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
                    decoder_opts=None, decodable_opts=None,
-                   online_ivector_period=10):
+                   online_ivector_period=10, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -985,12 +1572,15 @@ class NnetFasterRecognizer(NnetRecognizer):
                 for simple nnet3 am decodable objects.
             online_ivector_period (int): Onlne ivector period. Relevant only if
                 online ivectors are used.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             NnetFasterRecognizer: A new recognizer.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.FasterDecoderOptions()
         decoder = _dec.FasterDecoder(graph, decoder_opts)
@@ -998,8 +1588,10 @@ class NnetFasterRecognizer(NnetRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, decodable_opts, online_ivector_period)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, decodable_opts, online_ivector_period)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class NnetLatticeFasterRecognizer(NnetRecognizer):
@@ -1031,7 +1623,7 @@ class NnetLatticeFasterRecognizer(NnetRecognizer):
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
                    decoder_opts=None, decodable_opts=None,
-                   online_ivector_period=10):
+                   online_ivector_period=10, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -1047,12 +1639,15 @@ class NnetLatticeFasterRecognizer(NnetRecognizer):
                 for simple nnet3 am decodable objects.
             online_ivector_period (int): Onlne ivector period. Relevant only if
                 online ivectors are used.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             NnetLatticeFasterRecognizer: A new recognizer.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeFasterDecoder(graph, decoder_opts)
@@ -1060,8 +1655,10 @@ class NnetLatticeFasterRecognizer(NnetRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, decodable_opts, online_ivector_period)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, decodable_opts, online_ivector_period)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class NnetLatticeFasterBatchRecognizer(object):
@@ -1112,6 +1709,15 @@ class NnetLatticeFasterBatchRecognizer(object):
         else:
             self._get_output = self.decoder.get_raw_output
         self.online_ivector_period = online_ivector_period
+        self._frame_subsampling_factor = compute_opts.frame_subsampling_factor
+        self._accepted = _collections.deque()
+
+    # Timing records are reported if this is set to a TimingCollector. The
+    # "decode" stage of a record is the time from accepting an input to
+    # returning its output, including the time the utterance waited for
+    # computation and search threads. Lattice sizes are those of the output
+    # lattices.
+    timing = None
 
     @staticmethod
     def read_model(model_rxfilename):
@@ -1125,7 +1731,8 @@ class NnetLatticeFasterBatchRecognizer(object):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True, decoder_opts=None,
-                   compute_opts=None, num_threads=1, online_ivector_period=10):
+                   compute_opts=None, num_threads=1, online_ivector_period=10,
+                   mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -1142,12 +1749,15 @@ class NnetLatticeFasterBatchRecognizer(object):
             num_threads (int): Number of processing threads.
             online_ivector_period (int): Onlne ivector period. Relevant only if
                 online ivectors are used.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             NnetLatticeFasterBatchRecognizer: A new recognizer.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if symbols_filename is None:
             symbols = None
         else:
@@ -1186,6 +1796,9 @@ class NnetLatticeFasterBatchRecognizer(object):
             features = input
         if features.num_rows == 0:
             raise ValueError("Empty feature matrix.")
+        if self.timing is not None:
+            num_frames = -(-features.num_rows // self._frame_subsampling_factor)
+            self._accepted.append((key, num_frames, _time.perf_counter()))
         self.decoder.accept_input(key, features, ivector, online_ivectors,
                                   self.online_ivector_period)
 
@@ -1225,8 +1838,32 @@ class NnetLatticeFasterBatchRecognizer(object):
             ValueError: If there is no output to return.
         """
         key, lat, text = self._get_output()
+        if self._accepted:
+            self._collect_timing(key, lat)
         return {"key": key, "lattice": lat, "text": text}
 
+    def _collect_timing(self, key, lattice):
+        """Reports the timing record of an utterance returned by the decoder.
+
+        Inputs accepted before the utterance whose outputs were not returned,
+        e.g. because of search failures, are discarded.
+        """
+        now = _time.perf_counter()
+        while self._accepted:
+            accepted_key, num_frames, start = self._accepted.popleft()
+            if accepted_key == key:
+                break
+        else:
+            return
+        if self.timing is not None:
+            self.timing.collect({
+                "recognizer": type(self).__name__,
+                "stages": {"decode": now - start},
+                "num_frames": num_frames,
+                "num_lattice_states": lattice.num_states(),
+                "num_lattice_arcs": lattice.num_arcs(),
+            })
+
     def get_outputs(self):
         """Creates a generator for iterating over available outputs.
 
@@ -1242,6 +1879,125 @@ class NnetLatticeFasterBatchRecognizer(object):
             except ValueError:
                 return
 
+    def decode_stream(self, inputs, queue_size=16):
+        """Decodes a stream of inputs and generates outputs as they are ready.
+
+        Inputs are read on a background thread into a bounded queue, so that
+        reading (e.g. parsing archives or running feature extraction pipes)
+        overlaps with decoding. The calling thread feeds the decoder from the
+        queue and generates outputs as soon as they are ready. Outputs are
+        dictionaries like the output of :meth:`get_output` and are generated in
+        the same order the inputs were provided.
+
+        The stream is finished (see :meth:`finished`) after all inputs are
+        consumed, hence this method can be called only once.
+
+        Streaming statistics are available while decoding in the
+        :attr:`stream_stats` dictionary with the following `(key, value)` pairs:
+
+        ================== ===============================================
+        key                value
+        ================== ===============================================
+        "queue_depth"      Number of inputs waiting in the queue
+        "max_queue_depth"  Maximum number of inputs waiting in the queue
+        "num_inputs"       Number of inputs accepted by the decoder
+        "num_outputs"      Number of outputs generated
+        "input_wait"       Seconds spent waiting for inputs
+        "accept_wait"      Seconds spent blocked in :meth:`accept_input`
+        "elapsed"          Seconds since decoding started
+        "throughput"       Outputs generated per second
+        ================== ===============================================
+
+        Args:
+            inputs (Iterable[Tuple[str, object]]): Inputs to decode as
+                `(key, input)` pairs, e.g. a :class:`SequentialMatrixReader`.
+                See :meth:`accept_input` for the supported input types.
+            queue_size (int): Maximum number of inputs read ahead.
+
+        Yields:
+            Dictionaries representing decoding outputs.
+
+        Raises:
+            RuntimeError: If decoding fails.
+        """
+        if queue_size < 1:
+            raise ValueError("queue_size should be positive.")
+        stats = self.stream_stats = {
+            "queue_depth": 0,
+            "max_queue_depth": 0,
+            "num_inputs": 0,
+            "num_outputs": 0,
+            "input_wait": 0.0,
+            "accept_wait": 0.0,
+            "elapsed": 0.0,
+            "throughput": 0.0,
+        }
+        items = _queue.Queue(queue_size)
+        stop = _threading.Event()
+        end = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except _queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for item in inputs:
+                    if not put(item):
+                        return
+                put((end, None))
+            except Exception as e:
+                put((end, e))
+
+        def update(output=None):
+            stats["elapsed"] = _time.perf_counter() - start_time
+            if output is not None:
+                stats["num_outputs"] += 1
+            if stats["elapsed"] > 0:
+                stats["throughput"] = stats["num_outputs"] / stats["elapsed"]
+            return output
+
+        start_time = _time.perf_counter()
+        producer = _threading.Thread(target=produce)
+        producer.daemon = True
+        producer.start()
+        try:
+            while True:
+                wait_start = _time.perf_counter()
+                while True:
+                    try:
+                        key, input = items.get(timeout=0.01)
+                        break
+                    except _queue.Empty:
+                        for output in self.get_outputs():
+                            yield update(output)
+                stats["input_wait"] += _time.perf_counter() - wait_start
+                if key is end:
+                    if input is not None:
+                        raise input
+                    break
+                depth = items.qsize()
+                stats["queue_depth"] = depth
+                stats["max_queue_depth"] = max(stats["max_queue_depth"],
+                                               depth + 1)
+                accept_start = _time.perf_counter()
+                self.accept_input(key, input)
+                stats["accept_wait"] += _time.perf_counter() - accept_start
+                stats["num_inputs"] += 1
+                for output in self.get_outputs():
+                    yield update(output)
+            self.finished()
+            for output in self.get_outputs():
+                yield update(output)
+            update()
+        finally:
+            stop.set()
+
     def finished(self):
         """Informs the decoder that all input has been provided.
 
@@ -1323,8 +2079,10 @@ class NnetLatticeFasterGrammarRecognizer(NnetRecognizer):
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, decodable_opts, online_ivector_period)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, decodable_opts, online_ivector_period)
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class NnetLatticeBiglmFasterRecognizer(NnetRecognizer):
@@ -1357,7 +2115,7 @@ class NnetLatticeBiglmFasterRecognizer(NnetRecognizer):
     def from_files(cls, model_rxfilename, graph_rxfilename, old_lm_rxfilename,
                    new_lm_rxfilename, symbols_filename=None, allow_partial=True,
                    decoder_opts=None, decodable_opts=None,
-                   online_ivector_period=10):
+                   online_ivector_period=10, mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -1375,31 +2133,29 @@ class NnetLatticeBiglmFasterRecognizer(NnetRecognizer):
                 for simple nnet3 am decodable objects.
             online_ivector_period (int): Onlne ivector period. Relevant only if
                 online ivectors are used.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             NnetLatticeBiglmFasterRecognizer: A new recognizer.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
-        self.old_lm = _fst.read_fst_kaldi(old_lm_rxfilename)
-        _fst_utils.apply_probability_scale(-1.0, self.old_lm)
-        self.new_lm = _fst.read_fst_kaldi(new_lm_rxfilename)
-        self._old_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.old_lm)
-        self._new_lm = _fst_spec.StdBackoffDeterministicOnDemandFst(self.new_lm)
-        self._compose_lm = _fst_spec.StdComposeDeterministicOnDemandFst(
-            self._old_lm, self._new_lm)
-        self._cache_compose_lm = _fst_spec.StdCacheDeterministicOnDemandFst(
-            self._compose_lm)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
+        lm_diff = _LmDiffFst.from_files(old_lm_rxfilename, new_lm_rxfilename)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeBiglmFasterDecoder(graph, decoder_opts,
-                                                 self._cache_compose_lm)
+                                                 lm_diff.fst)
         if symbols_filename is None:
             symbols = None
         else:
             symbols = _fst.SymbolTable.read_text(symbols_filename)
-        return cls(transition_model, acoustic_model, decoder, symbols,
-                   allow_partial, decodable_opts, online_ivector_period)
+        recognizer = cls(transition_model, acoustic_model, decoder, symbols,
+                         allow_partial, decodable_opts, online_ivector_period)
+        recognizer._lm_diff = lm_diff
+        recognizer._decoder_opts = decoder_opts
+        return recognizer
 
 
 class OnlineRecognizer(object):
@@ -1420,6 +2176,32 @@ class OnlineRecognizer(object):
         self.allow_partial = allow_partial
         self.acoustic_scale = acoustic_scale
 
+    # Decoding statistics are collected if this is set to a DecodingStats.
+    stats = None
+
+    # Timing records are reported if this is set to a TimingCollector. Stages
+    # of an utterance are timed from the call to init_decoding (or decode) and
+    # reported when the final output is retrieved.
+    timing = None
+    _timer = None
+
+    def _clone(self):
+        """Returns a copy of the recognizer with a new decoder.
+
+        The copy shares the decoding graph and the models with this recognizer
+        but has its own decoder, hence the two can be used in different
+        threads at the same time. Input pipeline of the copy is not set.
+
+        Returns:
+            A new recognizer.
+        """
+        recognizer = _copy.copy(self)
+        recognizer.__dict__.pop("_decodable", None)
+        recognizer.__dict__.pop("_timer", None)
+        recognizer.decoder = type(self.decoder)(self.decoder._fst,
+                                                self.decoder.get_options())
+        return recognizer
+
     def _make_decodable(self, input_pipeline):
         """Constructs a new online decodable object from input pipeline.
 
@@ -1468,8 +2250,15 @@ class OnlineRecognizer(object):
         can also call this method if you have already decoded an utterance and
         want to start with a new utterance.
         """
+        self._timer = _StageTimer()
         self.decoder.init_decoding()
 
+    def _stage(self, name):
+        """Returns a context manager timing a stage of the current utterance."""
+        if self._timer is None:
+            self._timer = _StageTimer()
+        return self._timer.stage(name)
+
     def advance_decoding(self, max_num_frames=-1):
         """Advances decoding.
 
@@ -1481,7 +2270,8 @@ class OnlineRecognizer(object):
             max_num_frames (int): Maximum number of frames to decode. If
                 negative, all available frames are decoded.
         """
-        self.decoder.advance_decoding(self._decodable, max_num_frames)
+        with self._stage("search"):
+            self.decoder.advance_decoding(self._decodable, max_num_frames)
 
     def finalize_decoding(self):
         """Finalizes decoding.
@@ -1497,9 +2287,10 @@ class OnlineRecognizer(object):
         :meth:`advance_decoding` again (it will fail), and you cannot call
         get_lattice and related functions with use_final_probs = false.
         """
-        self.decoder.finalize_decoding()
+        with self._stage("finalize"):
+            self.decoder.finalize_decoding()
 
-    def decode(self):
+    def decode(self, outputs=None):
         """Decodes all frames in the input pipeline and returns the output.
 
         Output is a dictionary with the following `(key, value)` pairs:
@@ -1526,19 +2317,27 @@ class OnlineRecognizer(object):
         separated symbols. The "weight" output is a lattice weight consisting of
         (graph-score, acoustic-score).
 
+        If `outputs` is provided, only the requested outputs are computed.
+        For instance, lattice determinization is skipped unless "lattice"
+        output is requested.
+
         Args:
-            input (object): Input to decode.
+            outputs (Iterable[str]): Keys of the outputs to compute. If
+                ``None``, all outputs available are computed.
 
         Returns:
             A dictionary representing decoding output.
 
         Raises:
+            ValueError: If requested outputs are not available.
             RuntimeError: If decoding fails.
         """
-        self.decoder.decode(self._decodable)
-        return self.get_output()
+        self._timer = _StageTimer()
+        with self._timer.stage("search"):
+            self.decoder.decode(self._decodable)
+        return self.get_output(outputs)
 
-    def get_output(self):
+    def get_output(self, outputs=None):
         """Returns decoding output.
 
         Output is a dictionary with the following `(key, value)` pairs:
@@ -1565,68 +2364,29 @@ class OnlineRecognizer(object):
         separated symbols. The "weight" output is a lattice weight consisting of
         (graph-score, acoustic-score).
 
+        If `outputs` is provided, only the requested outputs are computed.
+        For instance, lattice determinization is skipped unless "lattice"
+        output is requested.
+
+        Args:
+            outputs (Iterable[str]): Keys of the outputs to compute. If
+                ``None``, all outputs available are computed.
+
         Returns:
             A dictionary representing decoding output.
 
         Raises:
+            ValueError: If requested outputs are not available.
             RuntimeError: If decoding fails.
         """
-        if not (self.allow_partial or self.decoder.reached_final()):
-            raise RuntimeError("No final state was active on the last frame.")
-
-        try:
-            best_path = self.decoder.get_best_path()
-        except RuntimeError:
-            raise RuntimeError("Empty decoding output.")
-
-        ali, words, weight = _fst_utils.get_linear_symbol_sequence(best_path)
-
-        if self.symbols:
-            text = " ".join(_fst.indices_to_symbols(self.symbols, words))
-        else:
-            text = " ".join(map(str, words))
-
-        likelihood = - (weight.value1 + weight.value2)
-
-        if self.acoustic_scale != 0.0:
-            scale = _fst_utils.acoustic_lattice_scale(1.0 / self.acoustic_scale)
-            _fst_utils.scale_lattice(scale, best_path)
-        best_path = _fst_utils.convert_lattice_to_compact_lattice(best_path)
-
-        try:
-            lat = self.decoder.get_raw_lattice()
-        except AttributeError:
-            return {
-                "alignment": ali,
-                "best_path": best_path,
-                "likelihood": likelihood,
-                "text": text,
-                "weight": weight,
-                "words": words,
-            }
-        if lat.num_states() == 0:
-            raise RuntimeError("Empty output lattice.")
-        lat.connect()
-
-        lat = self._determinize_lattice(lat)
-
-        if self.acoustic_scale != 0.0:
-            if isinstance(lat, _fst.CompactLatticeVectorFst):
-                _fst_utils.scale_compact_lattice(scale, lat)
-            else:
-                _fst_utils.scale_lattice(scale, lat)
-
-        return {
-            "alignment": ali,
-            "best_path": best_path,
-            "lattice": lat,
-            "likelihood": likelihood,
-            "text": text,
-            "weight": weight,
-            "words": words,
-        }
-
-    def get_partial_output(self, use_final_probs=False):
+        timer, self._timer = self._timer, None
+        output = _get_output(self, outputs, timer=timer)
+        if self.timing is not None and timer is not None:
+            self.timing.collect(
+                timer.record(self, self.decoder.num_frames_decoded()))
+        return output
+
+    def get_partial_output(self, use_final_probs=False, outputs=None):
         """Returns partial decoding output.
 
         Output is a dictionary with the following `(key, value)` pairs:
@@ -1650,35 +2410,18 @@ class OnlineRecognizer(object):
         Args:
             use_final_probs (bool): Whether to use final probabilities when
                 computing best path.
+            outputs (Iterable[str]): Keys of the outputs to compute. If
+                ``None``, all outputs available are computed.
 
         Returns:
             A dictionary representing decoding output.
 
         Raises:
+            ValueError: If requested outputs are not available.
             RuntimeError: If decoding fails.
         """
-        try:
-            best_path = self.decoder.get_best_path(use_final_probs)
-        except RuntimeError:
-            raise RuntimeError("Empty decoding output.")
-
-        ali, words, weight = _fst_utils.get_linear_symbol_sequence(best_path)
-
-        if self.symbols:
-            text = " ".join(_fst.indices_to_symbols(self.symbols, words))
-        else:
-            text = " ".join(map(str, words))
-
-        likelihood = - (weight.value1 + weight.value2)
-
-        return {
-            "alignment": ali,
-            "best_path": best_path,
-            "likelihood": likelihood,
-            "text": text,
-            "weight": weight,
-            "words": words,
-        }
+        return _get_output(self, outputs, partial=True,
+                           use_final_probs=use_final_probs, timer=self._timer)
 
 
 class NnetOnlineRecognizer(OnlineRecognizer):
@@ -1806,7 +2549,8 @@ class NnetLatticeFasterOnlineRecognizer(NnetOnlineRecognizer):
     @classmethod
     def from_files(cls, model_rxfilename, graph_rxfilename,
                    symbols_filename=None, allow_partial=True,
-                   decoder_opts=None, decodable_opts=None, endpoint_opts=None):
+                   decoder_opts=None, decodable_opts=None, endpoint_opts=None,
+                   mmap_graph=False):
         """Constructs a new recognizer from given files.
 
         Args:
@@ -1822,12 +2566,15 @@ class NnetLatticeFasterOnlineRecognizer(NnetOnlineRecognizer):
                 options for simple looped neural network computation.
             endpoint_opts (OnlineEndpointConfig): Online endpointing
                 configuration.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
 
         Returns:
             NnetLatticeFasterOnlineRecognizer: A new recognizer.
         """
         transition_model, acoustic_model = cls.read_model(model_rxfilename)
-        graph = _fst.read_fst_kaldi(graph_rxfilename)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
         if not decoder_opts:
             decoder_opts = _dec.LatticeFasterDecoderOptions()
         decoder = _dec.LatticeFasterOnlineDecoder(graph, decoder_opts)
@@ -1913,6 +2660,928 @@ class NnetLatticeFasterOnlineGrammarRecognizer(NnetOnlineRecognizer):
             self.output_frame_shift, self.decoder)
 
 
+class _NnetBatchStream(object):
+    """Per-stream state of batched online nnet3 computation.
+
+    Args:
+        scheduler (NnetOnlineBatchScheduler): The scheduler.
+        feature_pipeline (OnlineNnetFeaturePipeline): Input feature pipeline.
+    """
+    def __init__(self, scheduler, feature_pipeline):
+        self.scheduler = scheduler
+        self.feature_pipeline = feature_pipeline
+        self.decodable = _dec.DecodableMatrixMappedOffset(
+            scheduler.transition_model)
+        self.num_frames_computed = 0
+        self.num_frames_queued = 0
+        self.num_chunks_pending = 0
+        self.frames_to_discard = 0
+        self.finished = False
+        self.error = None
+
+    def compute(self, num_frames_decoded=0):
+        """Computes log-likelihoods for all frames ready in the pipeline.
+
+        Blocks until the log-likelihoods are appended to :attr:`decodable`.
+
+        Args:
+            num_frames_decoded (int): Number of frames decoded so far.
+                Log-likelihoods for these frames are discarded.
+
+        Raises:
+            RuntimeError: If computation fails.
+        """
+        if self.finished:
+            return
+        # Frames discarded earlier can not be discarded again.
+        self.frames_to_discard = max(
+            0, num_frames_decoded - self.decodable.first_available_frame())
+        self.scheduler._compute(self)
+
+
+class NnetOnlineBatchScheduler(object):
+    """Batched neural network computation for many online streams.
+
+    The scheduler collects chunks of input features from many online streams
+    and computes the acoustic log-likelihoods for all of them in a single
+    batched nnet3 computation. Each chunk is computed as a separate sequence
+    in the batch (distinguished by the `n` index), so the computation for a
+    given batch size is compiled once and then reused. Computed
+    log-likelihoods are appended to the :class:`DecodableMatrixMappedOffset`
+    objects of the streams which are then consumed by the decoders.
+
+    Chunks are computed by a background thread. A batch is computed as soon
+    as it contains `max_batch_size` chunks, every registered stream is waiting
+    for its chunks or the oldest chunk has been waiting for `max_wait`
+    seconds, whichever comes first.
+
+    Since each chunk is computed independently with its own left and right
+    context, this is intended for models without recurrent connections, e.g.
+    TDNN and CNN models. Recurrent models should be decoded with
+    :class:`NnetLatticeFasterOnlineRecognizer`.
+
+    Args:
+        transition_model (TransitionModel): The transition model.
+        acoustic_model (AmNnetSimple): The acoustic model.
+        decodable_opts (NnetSimpleLoopedComputationOptions): Configuration
+            options for neural network computation. Only `acoustic_scale`,
+            `frame_subsampling_factor`, `frames_per_chunk`, `optimize_config`
+            and `compute_config` options are used.
+        max_batch_size (int): Maximum number of chunks in a batch.
+        max_wait (float): Maximum number of seconds a chunk waits for a batch
+            to fill up.
+    """
+    def __init__(self, transition_model, acoustic_model, decodable_opts=None,
+                 max_batch_size=32, max_wait=0.01):
+        if not isinstance(acoustic_model, _nnet3.AmNnetSimple):
+            raise TypeError("acoustic_model should be a AmNnetSimple object")
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size should be positive.")
+        self.transition_model = transition_model
+        self.acoustic_model = acoustic_model
+        self.nnet = self.acoustic_model.get_nnet()
+        _nnet3.set_batchnorm_test_mode(True, self.nnet)
+        _nnet3.set_dropout_test_mode(True, self.nnet)
+        _nnet3.collapse_model(_nnet3.CollapseModelConfig(), self.nnet)
+        if decodable_opts:
+            if not isinstance(decodable_opts,
+                              _nnet3.NnetSimpleLoopedComputationOptions):
+                raise TypeError("decodable_opts should be either None or a "
+                                "NnetSimpleLoopedComputationOptions object")
+            self.decodable_opts = decodable_opts
+        else:
+            self.decodable_opts = _nnet3.NnetSimpleLoopedComputationOptions()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self.left_context, self.right_context = (
+            _nnet3.compute_simple_nnet_context(self.nnet))
+        self.subsampling_factor = self.decodable_opts.frame_subsampling_factor
+        self.output_frames_per_chunk = max(
+            1, -(-self.decodable_opts.frames_per_chunk
+                 // self.subsampling_factor))
+        self.input_frames_per_chunk = (
+            (self.output_frames_per_chunk - 1) * self.subsampling_factor
+            + self.left_context + self.right_context + 1)
+        self.input_dim = self.acoustic_model.input_dim()
+        self.ivector_dim = self.acoustic_model.ivector_dim()
+        self.log_priors = _mat.Vector(self.acoustic_model.priors())
+        if self.log_priors.dim > 0:
+            self.log_priors.apply_log_()
+        self.compiler = _nnet3.CachingOptimizingCompiler.new_with_optimize_opts(
+            self.nnet, self.decodable_opts.optimize_config)
+        self._requests = {}
+
+        self._queue = _collections.deque()
+        self._num_streams = 0
+        self._num_waiting_streams = 0
+        self._closed = False
+        self._cond = _threading.Condition()
+        self._thread = _threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add_stream(self, feature_pipeline):
+        """Registers a new stream.
+
+        Args:
+            feature_pipeline (OnlineNnetFeaturePipeline): Input feature
+                pipeline of the stream.
+
+        Returns:
+            A stream object. Log-likelihoods are computed by calling its
+            `compute` method and consumed from its `decodable` attribute.
+        """
+        with self._cond:
+            if self._closed:
+                raise ValueError("scheduler is closed")
+            self._num_streams += 1
+        return _NnetBatchStream(self, feature_pipeline)
+
+    def remove_stream(self, stream):
+        """Unregisters a stream.
+
+        Streams are unregistered automatically once all of their input is
+        computed. This method can be used to unregister a stream before that.
+
+        Args:
+            stream: A stream object returned by :meth:`add_stream`.
+        """
+        with self._cond:
+            if not stream.finished:
+                stream.finished = True
+                self._num_streams -= 1
+                self._cond.notify_all()
+
+    def close(self):
+        """Stops the background thread after pending chunks are computed."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _num_frames_ready(self, stream):
+        """Returns the number of output frames that can be computed.
+
+        Returns:
+            Tuple[int, bool]: Number of output frames whose input context is
+            available and whether input is finished.
+        """
+        features = stream.feature_pipeline.input_feature()
+        num_frames = features.num_frames_ready()
+        if num_frames > 0 and features.is_last_frame(num_frames - 1):
+            return -(-num_frames // self.subsampling_factor), True
+        num_frames -= self.right_context
+        if num_frames <= 0:
+            return 0, False
+        return (num_frames - 1) // self.subsampling_factor + 1, False
+
+    def _compute(self, stream):
+        """Queues ready chunks of a stream and waits until they are computed.
+
+        Args:
+            stream (_NnetBatchStream): The stream.
+
+        Raises:
+            RuntimeError: If computation fails.
+        """
+        num_frames_ready, input_finished = self._num_frames_ready(stream)
+        chunk_size = self.output_frames_per_chunk
+        if not input_finished:
+            num_frames_ready -= ((num_frames_ready - stream.num_frames_queued)
+                                 % chunk_size)
+        with self._cond:
+            if self._closed:
+                raise ValueError("scheduler is closed")
+            now = _time.perf_counter()
+            for start in range(stream.num_frames_queued, num_frames_ready,
+                               chunk_size):
+                num_frames = min(chunk_size, num_frames_ready - start)
+                self._queue.append((stream, start, num_frames, now))
+                stream.num_chunks_pending += 1
+            stream.num_frames_queued = max(num_frames_ready,
+                                           stream.num_frames_queued)
+            if stream.num_chunks_pending:
+                self._num_waiting_streams += 1
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: stream.num_chunks_pending == 0)
+                self._num_waiting_streams -= 1
+            if stream.error is not None:
+                error, stream.error = stream.error, None
+                raise RuntimeError("Batched nnet3 computation failed: {}"
+                                   .format(error))
+            if input_finished and not stream.finished:
+                stream.decodable.input_is_finished()
+                stream.finished = True
+                self._num_streams -= 1
+                self._cond.notify_all()
+
+    def _batch_ready(self):
+        return (len(self._queue) >= self.max_batch_size
+                or self._num_waiting_streams >= self._num_streams
+                or self._closed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._queue or self._closed)
+                if not self._queue:
+                    return
+                deadline = self._queue[0][3] + self.max_wait
+                while not self._batch_ready():
+                    timeout = deadline - _time.perf_counter()
+                    if timeout <= 0:
+                        break
+                    self._cond.wait(timeout)
+                batch_size = min(len(self._queue), self.max_batch_size)
+                batch = [self._queue.popleft() for _ in range(batch_size)]
+            error = None
+            try:
+                self._compute_batch(batch)
+            except Exception as e:
+                error = e
+            with self._cond:
+                for stream, _, _, _ in batch:
+                    stream.num_chunks_pending -= 1
+                    if error is not None:
+                        stream.error = error
+                self._cond.notify_all()
+
+    def _get_request(self, batch_size):
+        """Returns the computation request for a batch of chunks."""
+        request = self._requests.get(batch_size)
+        if request is None:
+            first_input = -self.left_context
+            last_input = (first_input + self.input_frames_per_chunk)
+            num_outputs = self.output_frames_per_chunk * self.subsampling_factor
+            input_indexes = [_nnet3.Index.new(n, t)
+                             for n in range(batch_size)
+                             for t in range(first_input, last_input)]
+            output_indexes = [_nnet3.Index.new(n, t)
+                              for n in range(batch_size)
+                              for t in range(0, num_outputs,
+                                             self.subsampling_factor)]
+            inputs = [_nnet3.IoSpecification.from_indexes("input",
+                                                          input_indexes)]
+            if self.ivector_dim > 0:
+                ivector_indexes = [_nnet3.Index.new(n, 0)
+                                   for n in range(batch_size)]
+                inputs.append(_nnet3.IoSpecification.from_indexes(
+                    "ivector", ivector_indexes))
+            request = _nnet3.ComputationRequest()
+            request.inputs = inputs
+            request.outputs = [_nnet3.IoSpecification.from_indexes(
+                "output", output_indexes)]
+            self._requests[batch_size] = request
+        return request
+
+    def _compute_batch(self, batch):
+        """Computes a batch of chunks and appends outputs to decodables."""
+        batch_size = len(batch)
+        num_inputs = self.input_frames_per_chunk
+        num_outputs = self.output_frames_per_chunk
+        inputs = _mat.Matrix(batch_size * num_inputs, self.input_dim)
+        if self.ivector_dim > 0:
+            ivectors = _mat.Matrix(batch_size, self.ivector_dim)
+        for n, (stream, start, _, _) in enumerate(batch):
+            features = stream.feature_pipeline.input_feature()
+            last_frame = features.num_frames_ready() - 1
+            first_input = start * self.subsampling_factor - self.left_context
+            frames = [min(max(t, 0), last_frame)
+                      for t in range(first_input, first_input + num_inputs)]
+            features.get_frames(frames,
+                                _mat.SubMatrix(inputs, n * num_inputs,
+                                               num_inputs))
+            if self.ivector_dim > 0:
+                ivector_feature = stream.feature_pipeline.ivector_feature()
+                ivector_frame = min(frames[-1],
+                                    ivector_feature.num_frames_ready() - 1)
+                ivector_feature.get_frame(ivector_frame, ivectors[n])
+
+        computation = self.compiler.compile(self._get_request(batch_size))
+        computer = _nnet3.NnetComputer(self.decodable_opts.compute_config,
+                                       computation, self.nnet, self.nnet)
+        computer.accept_input("input", _cumatrix.CuMatrix.from_matrix(inputs))
+        if self.ivector_dim > 0:
+            computer.accept_input("ivector",
+                                  _cumatrix.CuMatrix.from_matrix(ivectors))
+        computer.run()
+        output = _mat.Matrix()
+        computer.get_output_destructive("output").swap_with_matrix(output)
+        if self.log_priors.dim > 0:
+            output.add_vec_to_rows_(-1.0, self.log_priors)
+        output.scale_(self.decodable_opts.acoustic_scale)
+
+        for n, (stream, start, num_frames, _) in enumerate(batch):
+            loglikes = _mat.Matrix(_mat.SubMatrix(output, n * num_outputs,
+                                                  num_frames))
+            stream.decodable.accept_log_likes(loglikes,
+                                              stream.frames_to_discard)
+            stream.frames_to_discard = 0
+            stream.num_frames_computed = start + num_frames
+
+
+class NnetLatticeFasterOnlineBatchRecognizer(NnetLatticeFasterOnlineRecognizer):
+    """Neural network based lattice generating faster online speech recognizer
+    with batched neural network computation.
+
+    This recognizer computes acoustic log-likelihoods with a
+    :class:`NnetOnlineBatchScheduler`, which can be shared by many recognizers
+    (e.g. copies created by :class:`RecognizerPool`) decoding concurrent
+    streams in different threads. Chunks of input features from all of these
+    streams are computed together in batches. Each call to
+    :meth:`advance_decoding` blocks until the log-likelihoods for all complete
+    chunks in the input pipeline are computed.
+
+    See :class:`NnetOnlineBatchScheduler` for the models supported.
+
+    Args:
+        transition_model (TransitionModel): The transition model.
+        acoustic_model (AmNnetSimple): The acoustic model.
+        decoder (LatticeFasterOnlineDecoder): The online decoder.
+        scheduler (NnetOnlineBatchScheduler): The batch scheduler.
+        symbols (SymbolTable): The symbol table. If provided, "text" output of
+            :meth:`decode` includes symbols instead of integer indices.
+        allow_partial (bool): Whether to output decoding results if no
+            final state was active on the last frame.
+        endpoint_opts (OnlineEndpointConfig): Online endpointing configuration.
+    """
+    def __init__(self, transition_model, acoustic_model, decoder, scheduler,
+                 symbols=None, allow_partial=True, endpoint_opts=None):
+        if not isinstance(scheduler, NnetOnlineBatchScheduler):
+            raise TypeError("scheduler should be a NnetOnlineBatchScheduler")
+        self.scheduler = scheduler
+        self._stream = None
+        super(NnetLatticeFasterOnlineBatchRecognizer, self).__init__(
+            transition_model, acoustic_model, decoder, symbols, allow_partial,
+            scheduler.decodable_opts, endpoint_opts)
+
+    @classmethod
+    def from_files(cls, model_rxfilename, graph_rxfilename,
+                   symbols_filename=None, allow_partial=True,
+                   decoder_opts=None, decodable_opts=None, endpoint_opts=None,
+                   max_batch_size=32, max_wait=0.01, mmap_graph=False):
+        """Constructs a new recognizer from given files.
+
+        Args:
+            model_rxfilename (str): Extended filename for reading the model.
+            graph_rxfilename (str): Extended filename for reading the graph.
+            symbols_filename (str): The symbols file. If provided, "text" output
+                of :meth:`decode` includes symbols instead of integer indices.
+            allow_partial (bool): Whether to output decoding results if no
+                final state was active on the last frame.
+            decoder_opts (LatticeFasterDecoderOptions): Configuration options
+                for the decoder.
+            decodable_opts (NnetSimpleLoopedComputationOptions): Configuration
+                options for neural network computation.
+            endpoint_opts (OnlineEndpointConfig): Online endpointing
+                configuration.
+            max_batch_size (int): Maximum number of chunks in a batch.
+            max_wait (float): Maximum number of seconds a chunk waits for a
+                batch to fill up.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
+
+        Returns:
+            NnetLatticeFasterOnlineBatchRecognizer: A new recognizer.
+        """
+        transition_model, acoustic_model = cls.read_model(model_rxfilename)
+        scheduler = NnetOnlineBatchScheduler(transition_model, acoustic_model,
+                                             decodable_opts, max_batch_size,
+                                             max_wait)
+        graph = _fst.read_fst_kaldi(graph_rxfilename, mmap_graph)
+        if not decoder_opts:
+            decoder_opts = _dec.LatticeFasterDecoderOptions()
+        decoder = _dec.LatticeFasterOnlineDecoder(graph, decoder_opts)
+        if symbols_filename is None:
+            symbols = None
+        else:
+            symbols = _fst.SymbolTable.read_text(symbols_filename)
+        return cls(transition_model, acoustic_model, decoder, scheduler,
+                   symbols, allow_partial, endpoint_opts)
+
+    def _clone(self):
+        recognizer = super(NnetLatticeFasterOnlineBatchRecognizer,
+                           self)._clone()
+        recognizer._stream = None
+        return recognizer
+
+    def _make_decodable(self, feature_pipeline):
+        """Registers input feature pipeline with the batch scheduler.
+
+        This method also sets output_frame_shift which is used in endpointing.
+
+        Args:
+            feature_pipeline (OnlineNnetFeaturePipeline): Input feature
+                pipeline.
+
+        Returns:
+            DecodableMatrixMappedOffset: A decodable object receiving scaled
+            log-likelihoods from the batch scheduler.
+        """
+        self.output_frame_shift = (feature_pipeline.frame_shift_in_seconds() *
+                                   self.decodable_opts.frame_subsampling_factor)
+        if self._stream is not None:
+            self.scheduler.remove_stream(self._stream)
+        self._stream = self.scheduler.add_stream(feature_pipeline)
+        return self._stream.decodable
+
+    def advance_decoding(self, max_num_frames=-1):
+        """Advances decoding.
+
+        This will compute log-likelihoods for all complete chunks in the input
+        pipeline and decode until there are no more frames ready or
+        `max_num_frames` are decoded.
+
+        Args:
+            max_num_frames (int): Maximum number of frames to decode. If
+                negative, all available frames are decoded.
+        """
+        with self._stage("compute"):
+            self._stream.compute(self.decoder.num_frames_decoded())
+        with self._stage("search"):
+            self.decoder.advance_decoding(self._decodable, max_num_frames)
+
+    def decode(self, outputs=None):
+        """Decodes all frames in the input pipeline and returns the output.
+
+        Input pipeline should be finished before calling this method. Since
+        decoding starts from the first frame, this should not be called after
+        :meth:`advance_decoding` for the same input pipeline. See
+        :meth:`OnlineRecognizer.decode` for the output format.
+
+        Args:
+            outputs (Iterable[str]): Keys of the outputs to compute. If
+                ``None``, all outputs available are computed.
+
+        Returns:
+            A dictionary representing decoding output.
+
+        Raises:
+            ValueError: If requested outputs are not available.
+            RuntimeError: If decoding fails.
+        """
+        self._timer = _StageTimer()
+        with self._timer.stage("compute"):
+            # The decoder restarts from the first frame, hence no frames are
+            # discarded. The decoder still reports the number of frames
+            # decoded in the previous utterance at this point.
+            self._stream.compute(0)
+        with self._timer.stage("search"):
+            self.decoder.decode(self._decodable)
+        return self.get_output(outputs)
+
+
+class OnlineSession(object):
+    """Streaming speech recognition session with endpointing.
+
+    This class implements the usual online decoding loop on top of an online
+    recognizer. It feeds audio to a new feature pipeline, advances decoding,
+    reports partial hypotheses as they change and, if endpointing is enabled,
+    splits the stream into segments at detected endpoints. Audio following an
+    endpoint is fed to the next segment. The ivector adaptation state is
+    carried over from one segment to the next. Silence weighting is applied to
+    the ivector estimation if it is enabled in the feature pipeline
+    configuration.
+
+    Session outputs are the dictionaries produced by
+    :meth:`OnlineRecognizer.get_partial_output` (partial hypotheses) and
+    :meth:`OnlineRecognizer.get_output` (final hypotheses) with the following
+    additional `(key, value)` pairs:
+
+    ============ ================================ =========================
+    key          value                            value type
+    ============ ================================ =========================
+    "final"      Whether hypothesis is final      `bool`
+    "segment"    Index of the segment             `int`
+    ============ ================================ =========================
+
+    The recognizer is used exclusively by the session while it is active.
+
+    Args:
+        recognizer (NnetOnlineRecognizer): The online recognizer. Endpointing
+            requires the recognizer to implement `endpoint_detected`, e.g.
+            :class:`NnetLatticeFasterOnlineRecognizer`.
+        feature_info (OnlineNnetFeaturePipelineInfo): Configuration info for
+            the online feature pipeline.
+        adaptation_state (OnlineIvectorExtractorAdaptationState): Initial
+            adaptation state. If ``None`` and the feature pipeline uses
+            ivectors, a new adaptation state is initialized from
+            `feature_info`.
+        endpointing (bool): Whether to split the stream into segments at
+            detected endpoints.
+        outputs (Iterable[str]): Keys of the outputs to compute. If ``None``,
+            all outputs available are computed. "lattice" output is computed
+            only for final hypotheses.
+    """
+    def __init__(self, recognizer, feature_info, adaptation_state=None,
+                 endpointing=True, outputs=None):
+        if endpointing and not hasattr(recognizer, "endpoint_detected"):
+            raise TypeError("recognizer does not support endpointing")
+        self.recognizer = recognizer
+        self.feature_info = feature_info
+        if adaptation_state is None and feature_info.use_ivectors:
+            adaptation_state = (
+                _online2.OnlineIvectorExtractorAdaptationState.from_info(
+                    feature_info.ivector_extractor_info))
+        self.adaptation_state = adaptation_state
+        self.endpointing = endpointing
+        self.outputs = outputs
+        if outputs is None:
+            self._partial_outputs = None
+        else:
+            self._partial_outputs = _PARTIAL_OUTPUTS.intersection(
+                [outputs] if isinstance(outputs, str) else outputs)
+        self.segment = 0
+        self._finished = False
+        self._init_segment()
+
+    def _init_segment(self):
+        """Initializes decoding for a new segment."""
+        self.feature_pipeline = _online2.OnlineNnetFeaturePipeline(
+            self.feature_info)
+        if self.adaptation_state is not None:
+            self.feature_pipeline.set_adaptation_state(self.adaptation_state)
+        self.recognizer.set_input_pipeline(self.feature_pipeline)
+        self.recognizer.init_decoding()
+        self._silence_weighting = _online2.OnlineSilenceWeighting(
+            self.recognizer.transition_model,
+            self.feature_info.silence_weighting_config,
+            self.recognizer.decodable_opts.frame_subsampling_factor)
+        self._samples = []
+        self._num_frames_decoded = 0
+
+    def _finalize_segment(self):
+        """Finalizes decoding of the current segment.
+
+        Returns:
+            A dictionary representing final decoding output.
+        """
+        self.recognizer.finalize_decoding()
+        output = self.recognizer.get_output(self.outputs)
+        output["final"] = True
+        output["segment"] = self.segment
+        if self.adaptation_state is not None:
+            self.feature_pipeline.get_adaptation_state(self.adaptation_state)
+        return output
+
+    def _advance(self):
+        """Advances decoding of the current segment.
+
+        Returns:
+            A partial output if any new frames were decoded, else ``None``.
+        """
+        ivector_feature = self.feature_pipeline.ivector_feature()
+        if self._silence_weighting.active() and ivector_feature is not None:
+            decoder = self.recognizer.decoder
+            if isinstance(decoder, _dec.LatticeFasterOnlineGrammarDecoder):
+                self._silence_weighting.compute_current_traceback_grammar(
+                    decoder)
+            else:
+                self._silence_weighting.compute_current_traceback(decoder)
+            ivector_feature.update_frame_weights(
+                self._silence_weighting.get_delta_weights(
+                    self.feature_pipeline.num_frames_ready()))
+        self.recognizer.advance_decoding()
+        num_frames_decoded = self.recognizer.decoder.num_frames_decoded()
+        if num_frames_decoded > self._num_frames_decoded:
+            self._num_frames_decoded = num_frames_decoded
+            output = self.recognizer.get_partial_output(
+                outputs=self._partial_outputs)
+            output["final"] = False
+            output["segment"] = self.segment
+            return output
+        return None
+
+    def accept_waveform(self, samp_freq, waveform):
+        """Accepts a chunk of audio and advances decoding.
+
+        Args:
+            samp_freq (float): Sampling frequency of the audio.
+            waveform (VectorBase or numpy.ndarray): A chunk of audio.
+
+        Returns:
+            List[dict]: New decoding outputs. This includes a partial output
+            if the best hypothesis might have changed and a final output for
+            each segment ending in this chunk.
+
+        Raises:
+            ValueError: If the session is already finished.
+            RuntimeError: If decoding fails.
+        """
+        if self._finished:
+            raise ValueError("session is already finished")
+        samples = _numpy.array(waveform, dtype=_numpy.float32, copy=True)
+        if self.endpointing:
+            self._samples.append(samples)
+        self.feature_pipeline.accept_waveform(samp_freq,
+                                              _mat.SubVector(samples))
+        outputs = []
+        while True:
+            output = self._advance()
+            if not (self.endpointing and self._num_frames_decoded > 0
+                    and self.recognizer.endpoint_detected()):
+                if output is not None:
+                    outputs.append(output)
+                return outputs
+            outputs.append(self._finalize_segment())
+            # Feed the audio following the endpoint to the next segment.
+            num_samples = int(self._num_frames_decoded
+                              * self.recognizer.output_frame_shift
+                              * samp_freq)
+            remainder = _numpy.concatenate(self._samples)[num_samples:]
+            self.segment += 1
+            self._init_segment()
+            if len(remainder) == 0:
+                return outputs
+            self._samples.append(remainder)
+            self.feature_pipeline.accept_waveform(samp_freq,
+                                                  _mat.SubVector(remainder))
+
+    def input_finished(self):
+        """Signals the end of the audio stream and finalizes decoding.
+
+        Returns:
+            List[dict]: New decoding outputs. This includes the final output
+            for the last segment if it contains any decoded frames.
+
+        Raises:
+            ValueError: If the session is already finished.
+            RuntimeError: If decoding fails.
+        """
+        if self._finished:
+            raise ValueError("session is already finished")
+        self._finished = True
+        self.feature_pipeline.input_finished()
+        self._advance()
+        if self._num_frames_decoded == 0:
+            return []
+        return [self._finalize_segment()]
+
+
+class AsyncOnlineSession(object):
+    """Asynchronous streaming speech recognition session.
+
+    This class wraps an :class:`OnlineSession` for use with :mod:`asyncio`.
+    Audio chunks are put into a queue with :meth:`accept_waveform` and decoded
+    in an executor, hence the event loop is not blocked while decoding. Since
+    wrapped C++ calls release the GIL, many sessions can decode concurrently
+    in a thread pool executor. Decoding outputs are consumed by iterating over
+    the session asynchronously::
+
+        session = AsyncOnlineSession(OnlineSession(asr, feat_info))
+
+        async def produce():
+            async for chunk in audio_chunks():
+                await session.accept_waveform(samp_freq, chunk)
+            await session.input_finished()
+
+        async def consume():
+            async for output in session:
+                print(output["segment"], output["final"], output["text"])
+
+    Args:
+        session (OnlineSession): The online session.
+        executor (concurrent.futures.Executor): The executor used for
+            decoding. If ``None``, the default executor of the event loop is
+            used.
+        max_queue_size (int): Maximum number of audio chunks waiting to be
+            decoded. If less than or equal to zero, the queue size is
+            unbounded.
+    """
+    def __init__(self, session, executor=None, max_queue_size=0):
+        self.session = session
+        self.executor = executor
+        self._queue = _asyncio.Queue(max_queue_size)
+
+    async def accept_waveform(self, samp_freq, waveform):
+        """Queues a chunk of audio for decoding.
+
+        Waits for a free slot if the queue is full.
+
+        Args:
+            samp_freq (float): Sampling frequency of the audio.
+            waveform (VectorBase or numpy.ndarray): A chunk of audio.
+        """
+        await self._queue.put((samp_freq, waveform))
+
+    async def input_finished(self):
+        """Signals the end of the audio stream."""
+        await self._queue.put(None)
+
+    def __aiter__(self):
+        return self._outputs()
+
+    async def _outputs(self):
+        loop = _asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                outputs = await loop.run_in_executor(
+                    self.executor, self.session.input_finished)
+            else:
+                outputs = await loop.run_in_executor(
+                    self.executor, self.session.accept_waveform, *item)
+            for output in outputs:
+                yield output
+            if item is None:
+                return
+
+
+class RecognizerPool(object):
+    """Pool of online recognition sessions sharing models and decoding graph.
+
+    The pool hands out :class:`OnlineSession` objects for concurrent streams.
+    Each session uses its own copy of the prototype recognizer. Copies share
+    the decoding graph, the models and the looped nnet3 computation with the
+    prototype but have their own decoders. When a session is released, its
+    recognizer is kept for reuse by the next session, hence the decoder
+    allocations are recycled rather than freed.
+
+    This class is thread-safe.
+
+    Args:
+        recognizer (NnetOnlineRecognizer): The prototype recognizer. It is not
+            used for decoding by the pool.
+        feature_info (OnlineNnetFeaturePipelineInfo): Configuration info for
+            the online feature pipelines.
+        max_sessions (int): Maximum number of active sessions. If less than or
+            equal to zero, the number of active sessions is not limited.
+        endpointing (bool): Whether sessions split streams into segments at
+            detected endpoints.
+        outputs (Iterable[str]): Keys of the outputs computed by sessions. If
+            ``None``, all outputs available are computed.
+    """
+    def __init__(self, recognizer, feature_info, max_sessions=0,
+                 endpointing=True, outputs=None):
+        self.recognizer = recognizer
+        self.feature_info = feature_info
+        self.max_sessions = max_sessions
+        self.endpointing = endpointing
+        self.outputs = outputs
+        self._idle = []
+        self._num_active = 0
+        self._num_created = 0
+        self._peak_active = 0
+        self._lock = _threading.Condition()
+
+    @classmethod
+    def from_files(cls, model_rxfilename, graph_rxfilename, feature_info,
+                   symbols_filename=None, allow_partial=True,
+                   decoder_opts=None, decodable_opts=None, endpoint_opts=None,
+                   max_sessions=0, endpointing=True, outputs=None,
+                   mmap_graph=False):
+        """Constructs a new pool from given files.
+
+        Sessions handed out by this pool use copies of a
+        :class:`NnetLatticeFasterOnlineRecognizer`.
+
+        Args:
+            model_rxfilename (str): Extended filename for reading the model.
+            graph_rxfilename (str): Extended filename for reading the graph.
+            feature_info (OnlineNnetFeaturePipelineInfo): Configuration info
+                for the online feature pipelines.
+            symbols_filename (str): The symbols file. If provided, "text" output
+                of sessions includes symbols instead of integer indices.
+            allow_partial (bool): Whether to output decoding results if no
+                final state was active on the last frame.
+            decoder_opts (LatticeFasterDecoderOptions): Configuration options
+                for the decoder.
+            decodable_opts (NnetSimpleLoopedComputationOptions): Configuration
+                options for simple looped neural network computation.
+            endpoint_opts (OnlineEndpointConfig): Online endpointing
+                configuration.
+            max_sessions (int): Maximum number of active sessions. If less
+                than or equal to zero, the number of active sessions is not
+                limited.
+            endpointing (bool): Whether sessions split streams into segments
+                at detected endpoints.
+            outputs (Iterable[str]): Keys of the outputs computed by sessions.
+                If ``None``, all outputs available are computed.
+            mmap_graph (bool): Whether to memory-map the graph if it is a
+                const FST stored in a regular file. See
+                :func:`~kaldi.fstext.read_fst_kaldi`.
+
+        Returns:
+            RecognizerPool: A new pool.
+        """
+        recognizer = NnetLatticeFasterOnlineRecognizer.from_files(
+            model_rxfilename, graph_rxfilename, symbols_filename,
+            allow_partial, decoder_opts, decodable_opts, endpoint_opts,
+            mmap_graph)
+        return cls(recognizer, feature_info, max_sessions, endpointing,
+                   outputs)
+
+    def acquire(self, adaptation_state=None, block=True, timeout=None):
+        """Starts a new session.
+
+        Args:
+            adaptation_state (OnlineIvectorExtractorAdaptationState): Initial
+                adaptation state for the session. If ``None`` and the feature
+                pipelines use ivectors, a new adaptation state is initialized.
+            block (bool): Whether to wait for a session to be released if the
+                maximum number of sessions are active.
+            timeout (float): Maximum number of seconds to wait if `block` is
+                ``True``. If ``None``, waits indefinitely.
+
+        Returns:
+            OnlineSession: A new session.
+
+        Raises:
+            RuntimeError: If the maximum number of sessions are active.
+        """
+        with self._lock:
+            if self.max_sessions > 0:
+                is_free = lambda: self._num_active < self.max_sessions
+                if block:
+                    self._lock.wait_for(is_free, timeout)
+                if not is_free():
+                    raise RuntimeError("Maximum number of sessions are "
+                                       "active.")
+            if self._idle:
+                recognizer = self._idle.pop()
+            else:
+                recognizer = None
+                self._num_created += 1
+            self._num_active += 1
+            self._peak_active = max(self._peak_active, self._num_active)
+        try:
+            if recognizer is None:
+                recognizer = self.recognizer._clone()
+            return OnlineSession(recognizer, self.feature_info,
+                                 adaptation_state, self.endpointing,
+                                 self.outputs)
+        except Exception:
+            with self._lock:
+                self._num_active -= 1
+                self._lock.notify()
+            raise
+
+    def release(self, session):
+        """Ends a session and recycles its recognizer.
+
+        The session should not be used after it is released.
+
+        Args:
+            session (OnlineSession): A session acquired from this pool.
+        """
+        recognizer = session.recognizer
+        if recognizer is None:
+            raise ValueError("session is already released")
+        session.recognizer = None
+        if (isinstance(recognizer, NnetLatticeFasterOnlineBatchRecognizer)
+                and recognizer._stream is not None):
+            # Streams of sessions released before the end of their input would
+            # otherwise keep the scheduler waiting for them.
+            recognizer.scheduler.remove_stream(recognizer._stream)
+            recognizer._stream = None
+        with self._lock:
+            self._idle.append(recognizer)
+            self._num_active -= 1
+            self._lock.notify()
+
+    @_contextlib.contextmanager
+    def session(self, adaptation_state=None, block=True, timeout=None):
+        """Returns a context manager for a new session.
+
+        The session is released when the context is exited. Arguments are the
+        same as :meth:`acquire`.
+        """
+        session = self.acquire(adaptation_state, block, timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def stats(self):
+        """Returns pool occupancy statistics.
+
+        Output is a dictionary with the following `(key, value)` pairs:
+
+        ============== ============================================
+        key            value
+        ============== ============================================
+        "active"       Number of active sessions
+        "idle"         Number of idle recognizers kept for reuse
+        "created"      Number of recognizers created so far
+        "peak_active"  Maximum number of simultaneously active sessions
+        "max_sessions" Maximum number of active sessions
+        ============== ============================================
+
+        Returns:
+            A dictionary of pool statistics.
+        """
+        with self._lock:
+            return {
+                "active": self._num_active,
+                "idle": len(self._idle),
+                "created": self._num_created,
+                "peak_active": self._peak_active,
+                "max_sessions": self.max_sessions,
+            }
+
+
 class LatticeLmRescorer(object):
     """Lattice LM rescorer.
 
@@ -2115,3 +3784,239 @@ class LatticeRnnlmPrunedRescorer(object):
             rnnlm.read(ki.stream(), ki.binary)
         return cls(old_lm, word_embedding_mat, rnnlm, lm_scale, acoustic_scale,
                    max_ngram_order, opts, compose_opts)
+
+
+def _decode_shard(recognizer, shard, rspecifier, text_wxfilename,
+                  lattice_wspecifier, reader_type, input_fn, frame_shift,
+                  outputs):
+    """Decodes a shard of a table in a worker process.
+
+    Returns:
+        A dictionary of shard statistics.
+    """
+    stats = {
+        "shard": shard,
+        "num_utterances": 0,
+        "num_failed": 0,
+        "audio_seconds": 0.0,
+        "elapsed": 0.0,
+        "rtf": 0.0,
+        "lattice_type": None,
+    }
+    start_time = _time.perf_counter()
+    text_output = None
+    if text_wxfilename is not None:
+        text_output = _util_io.xopen(text_wxfilename, "wt")
+    lattice_writer = None
+    try:
+        with reader_type(rspecifier) as reader:
+            for key, value in reader:
+                input = input_fn(value) if input_fn else value
+                if hasattr(value, "duration"):
+                    stats["audio_seconds"] += value.duration
+                else:
+                    features = input[0] if isinstance(input, tuple) else input
+                    stats["audio_seconds"] += features.num_rows * frame_shift
+                try:
+                    output = recognizer.decode(input, outputs)
+                except RuntimeError:
+                    stats["num_failed"] += 1
+                    continue
+                stats["num_utterances"] += 1
+                if text_output is not None:
+                    text_output.write(key + " " + output["text"] + "\n")
+                if lattice_wspecifier is not None:
+                    if lattice_writer is None:
+                        lattice = output["lattice"]
+                        if isinstance(lattice, _fst.CompactLatticeVectorFst):
+                            stats["lattice_type"] = "compact"
+                            lattice_writer = _util_table.CompactLatticeWriter(
+                                lattice_wspecifier, async_write=16)
+                        else:
+                            stats["lattice_type"] = "raw"
+                            lattice_writer = _util_table.LatticeWriter(
+                                lattice_wspecifier, async_write=16)
+                    lattice_writer[key] = output["lattice"]
+    finally:
+        if text_output is not None:
+            text_output.close()
+        if lattice_writer is not None:
+            lattice_writer.close()
+    stats["elapsed"] = _time.perf_counter() - start_time
+    if stats["audio_seconds"] > 0:
+        stats["rtf"] = stats["elapsed"] / stats["audio_seconds"]
+    return stats
+
+
+def decode_sharded(recognizer, rspecifier, num_jobs, text_wxfilename=None,
+                   lattice_wspecifier=None, reader_type=None, input_fn=None,
+                   frame_shift=0.01):
+    """Decodes a script file in parallel using multiple processes.
+
+    The script file is split into `num_jobs` contiguous shards, each of which
+    is decoded by a worker process forked from the calling process. Workers
+    inherit the recognizer, hence the models and the decoding graph are loaded
+    only once and their memory is shared with the workers until it is written
+    to. Decoding outputs are written by the workers to temporary files and
+    then merged in script file order, hence the merged outputs are identical
+    to the outputs of decoding the script file sequentially.
+
+    Each value read from the table is converted to recognizer input with
+    `input_fn` if it is provided. For instance, waveforms read with a
+    :class:`~kaldi.util.table.SequentialWaveReader` can be converted to
+    feature matrices with a feature extraction function.
+
+    Per-shard statistics are returned as a list of dictionaries with the
+    following `(key, value)` pairs:
+
+    ================ ====================================================
+    key              value
+    ================ ====================================================
+    "shard"          Index of the shard
+    "num_utterances" Number of utterances decoded successfully
+    "num_failed"     Number of utterances that failed to decode
+    "audio_seconds"  Duration of audio in the shard (in seconds)
+    "elapsed"        Wall-clock time spent decoding the shard (in seconds)
+    "rtf"            Real-time factor of decoding the shard
+    ================ ====================================================
+
+    Audio duration is computed from the waveform if the table contains
+    waveforms, and from the number of input frames and `frame_shift`
+    otherwise.
+
+    This uses the "fork" multiprocessing start method, hence it is available
+    only on platforms supporting fork.
+
+    Args:
+        recognizer (Recognizer): The recognizer.
+        rspecifier (str): Kaldi rspecifier for reading the inputs. It should
+            be a script file rspecifier, e.g. "scp:feats.scp".
+        num_jobs (int): Number of worker processes.
+        text_wxfilename (str): Extended filename for writing the "text"
+            output. Each line includes the key followed by the transcript.
+        lattice_wspecifier (str): Kaldi wspecifier for writing the "lattice"
+            output.
+        reader_type (type): Sequential table reader type used for reading the
+            inputs. Defaults to
+            :class:`~kaldi.util.table.SequentialMatrixReader`.
+        input_fn (callable): Function converting the values read from the
+            table to recognizer inputs.
+        frame_shift (float): Frame shift of the input features (in seconds).
+
+    Returns:
+        List[dict]: Statistics for each shard.
+
+    Raises:
+        ValueError: If the rspecifier is not a script file rspecifier.
+        RuntimeError: If a worker process fails.
+    """
+    if num_jobs < 1:
+        raise ValueError("num_jobs should be positive.")
+    rspecifier_type, script_rxfilename, _ = _util_table.classify_rspecifier(
+        rspecifier)
+    if rspecifier_type != _util_table.RspecifierType.SCRIPT_SPECIFIER:
+        raise ValueError("rspecifier should be a script file rspecifier: {}"
+                         .format(rspecifier))
+    try:
+        script = _util_table.read_script_file(script_rxfilename, True)
+    except ValueError:
+        raise IOError("Error reading script file: {}".format(script_rxfilename))
+    if reader_type is None:
+        reader_type = _util_table.SequentialMatrixReader
+    outputs = []
+    if text_wxfilename is not None:
+        outputs.append("text")
+    if lattice_wspecifier is not None:
+        outputs.append("lattice")
+
+    num_jobs = max(1, min(num_jobs, len(script)))
+    prefix = rspecifier.split(":", 1)[0]
+    context = _multiprocessing.get_context("fork")
+    results = context.Queue()
+    temp_dir = _tempfile.mkdtemp(prefix="kaldi-decode-")
+    try:
+        processes = []
+        for shard in range(num_jobs):
+            begin = len(script) * shard // num_jobs
+            end = len(script) * (shard + 1) // num_jobs
+            shard_script = _os.path.join(temp_dir, "{}.scp".format(shard))
+            if not _util_table.write_script_file(shard_script,
+                                                 script[begin:end]):
+                raise IOError("Error writing script file: {}"
+                              .format(shard_script))
+            shard_text = shard_lattice = None
+            if text_wxfilename is not None:
+                shard_text = _os.path.join(temp_dir, "{}.txt".format(shard))
+            if lattice_wspecifier is not None:
+                shard_lattice = "ark:" + _os.path.join(temp_dir,
+                                                      "{}.lat".format(shard))
+            args = (recognizer, shard, prefix + ":" + shard_script,
+                    shard_text, shard_lattice, reader_type, input_fn,
+                    frame_shift, outputs)
+
+            def work(args=args, shard=shard):
+                try:
+                    results.put((shard, True, _decode_shard(*args)))
+                except BaseException:
+                    results.put((shard, False, _traceback.format_exc()))
+
+            process = context.Process(target=work)
+            process.start()
+            processes.append(process)
+
+        stats, errors = [], []
+        pending = dict(enumerate(processes))
+        while pending:
+            try:
+                shard, success, result = results.get(timeout=1.0)
+            except _queue.Empty:
+                # Workers killed, e.g. by the OOM killer, never post results.
+                for shard, process in list(pending.items()):
+                    if process.exitcode not in (None, 0):
+                        del pending[shard]
+                        errors.append("Worker process for shard {} exited "
+                                      "with code {}.".format(shard,
+                                                             process.exitcode))
+                continue
+            if pending.pop(shard, None) is None:
+                continue
+            if success:
+                stats.append(result)
+            else:
+                errors.append(result)
+        for process in processes:
+            process.join()
+        if errors:
+            raise RuntimeError("Decoding failed in worker process:\n{}"
+                               .format(errors[0]))
+        stats.sort(key=lambda s: s["shard"])
+
+        if text_wxfilename is not None:
+            with _util_io.xopen(text_wxfilename, "wt") as text_output:
+                for s in stats:
+                    path = _os.path.join(temp_dir, "{}.txt".format(s["shard"]))
+                    with _util_io.xopen(path, "rt") as text_input:
+                        for line in text_input:
+                            text_output.write(line)
+        if lattice_wspecifier is not None:
+            lattice_types = set(s["lattice_type"] for s in stats
+                                if s["lattice_type"] is not None)
+            if "raw" in lattice_types:
+                reader_type = _util_table.SequentialLatticeReader
+                writer_type = _util_table.LatticeWriter
+            else:
+                reader_type = _util_table.SequentialCompactLatticeReader
+                writer_type = _util_table.CompactLatticeWriter
+            with writer_type(lattice_wspecifier) as writer:
+                for s in stats:
+                    if s["lattice_type"] is None:
+                        continue
+                    path = _os.path.join(temp_dir, "{}.lat".format(s["shard"]))
+                    with reader_type("ark:" + path) as reader:
+                        for key, lattice in reader:
+                            writer[key] = lattice
+        for s in stats:
+            del s["lattice_type"]
+        return stats
+    finally:
+        _shutil.rmtree(temp_dir, ignore_errors=True)
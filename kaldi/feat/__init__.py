@@ -1,3 +1,4 @@
+from . import batch
 from . import fbank
 from . import functions
 from . import mel
@@ -0,0 +1,357 @@
+"""
+Batched feature computation for multiple waveforms.
+"""
+
+import numpy as _numpy
+
+from ..matrix import Matrix as _Matrix
+from ..matrix import Vector as _Vector
+from ..matrix import functions as _matrix_functions
+from . import fbank as _fbank
+from . import mel as _mel
+from . import mfcc as _mfcc
+from . import plp as _plp
+from . import spectrogram as _spectrogram
+from . import window as _window
+
+_FLOAT_EPSILON = _numpy.finfo(_numpy.float32).eps
+_FLOAT_MIN = _numpy.finfo(_numpy.float32).tiny
+
+
+class BatchFeatureComputer(object):
+    """Batched feature computer.
+
+    Computes the features of multiple waveforms at once. Instead of
+    processing one frame at a time, the frames of all waveforms are
+    extracted into a single frame matrix, which is processed and windowed
+    with vectorized operations. Then a single real FFT is computed over all
+    frames and the Mel projection is computed as a single matrix-matrix
+    product. This is much faster than computing the features of each
+    waveform with :class:`~kaldi.feat.mfcc.Mfcc`,
+    :class:`~kaldi.feat.fbank.Fbank` or
+    :class:`~kaldi.feat.spectrogram.Spectrogram` when there are many short
+    waveforms, e.g. voice commands.
+
+    Features are identical to the ones computed by the per-frame computers
+    up to floating point rounding, except when dithering is enabled, in
+    which case the dither noise is drawn from a NumPy random generator. For
+    PLP features, frames are extracted in batch but linear prediction is
+    done frame by frame with a :class:`~kaldi.feat.plp.PlpComputer`.
+
+    Options are read at construction time, hence modifying **opts**
+    afterwards does not affect the computer.
+
+    Args:
+        opts: Feature options, an instance of
+            :class:`~kaldi.feat.mfcc.MfccOptions`,
+            :class:`~kaldi.feat.fbank.FbankOptions`,
+            :class:`~kaldi.feat.plp.PlpOptions` or
+            :class:`~kaldi.feat.spectrogram.SpectrogramOptions`.
+        seed (int): Seed for the dither noise generator.
+
+    Raises:
+        TypeError: If the feature type is not supported.
+    """
+    def __init__(self, opts, seed=None):
+        if isinstance(opts, _mfcc.MfccOptions):
+            self._kind = "mfcc"
+        elif isinstance(opts, _fbank.FbankOptions):
+            self._kind = "fbank"
+        elif isinstance(opts, _plp.PlpOptions):
+            self._kind = "plp"
+        elif isinstance(opts, _spectrogram.SpectrogramOptions):
+            self._kind = "spectrogram"
+        else:
+            raise TypeError("Unsupported feature options type: {}"
+                            .format(type(opts).__name__))
+        self._opts = opts
+        self._frame_opts = opts.frame_opts
+        self._window_shift = self._frame_opts.window_shift()
+        self._window_size = self._frame_opts.window_size()
+        self._padded_size = self._frame_opts.padded_window_size()
+        window = _window.FeatureWindowFunction.from_options(self._frame_opts)
+        self._window = _numpy.array(window.window.numpy(),
+                                    dtype=_numpy.float32)
+        self._random = _numpy.random.RandomState(seed)
+        self._mel_projections = {}
+
+        if self._kind == "spectrogram":
+            self._need_raw_log_energy = opts.raw_energy
+        else:
+            self._need_raw_log_energy = opts.use_energy and opts.raw_energy
+        if self._kind == "plp":
+            self._computer = _plp.PlpComputer(opts)
+            self._dim = self._computer.dim()
+        elif self._kind == "mfcc":
+            num_bins = opts.mel_opts.num_bins
+            dct = _Matrix(num_bins, num_bins)
+            _matrix_functions.compute_dct_matrix(dct)
+            self._dct = _numpy.array(dct.numpy()[:opts.num_ceps].T)
+            self._lifter = None
+            if opts.cepstral_lifter != 0.0:
+                lifter = _Vector(opts.num_ceps)
+                _mel.compute_lifter_coeffs(opts.cepstral_lifter, lifter)
+                self._lifter = _numpy.array(lifter.numpy())
+            self._dim = opts.num_ceps
+        elif self._kind == "fbank":
+            self._dim = opts.mel_opts.num_bins + int(opts.use_energy)
+        else:
+            self._dim = self._padded_size // 2 + 1
+
+    def dim(self):
+        """Returns the feature dimension."""
+        return self._dim
+
+    def _mel_projection(self, vtln_warp):
+        """Returns the Mel projection matrix for the given VTLN warp factor.
+
+        The rows of the matrix are the responses of the Mel filterbanks to
+        each FFT bin, hence Mel energies are computed as the product of power
+        spectra with this matrix.
+        """
+        projection = self._mel_projections.get(vtln_warp)
+        if projection is None:
+            opts = self._opts.mel_opts
+            mel_opts = _mel.MelBanksOptions(opts.num_bins)
+            mel_opts.low_freq = opts.low_freq
+            mel_opts.high_freq = opts.high_freq
+            mel_opts.vtln_low = opts.vtln_low
+            mel_opts.vtln_high = opts.vtln_high
+            # HTK mode floors Mel energies, which is applied after projection.
+            mel_opts.htk_mode = False
+            banks = _mel.MelBanks(mel_opts, self._frame_opts, vtln_warp)
+            num_fft_bins = self._padded_size // 2 + 1
+            fft_energies = _Vector(num_fft_bins)
+            mel_energies = _Vector(banks.num_bins())
+            projection = _numpy.empty((num_fft_bins, banks.num_bins()),
+                                      dtype=_numpy.float32)
+            energies = fft_energies.numpy()
+            for i in range(num_fft_bins):
+                energies[i] = 1.0
+                banks.compute(fft_energies, mel_energies)
+                projection[i] = mel_energies.numpy()
+                energies[i] = 0.0
+            self._mel_projections[vtln_warp] = projection
+        return projection
+
+    def _mel_energies(self, spectrum, frame_warps):
+        """Projects power spectra to Mel energies, grouping frames by warp."""
+        warps = _numpy.unique(frame_warps)
+        if len(warps) == 1:
+            mel = spectrum.dot(self._mel_projection(float(warps[0])))
+        else:
+            mel = _numpy.empty((len(spectrum), self._opts.mel_opts.num_bins),
+                               dtype=_numpy.float32)
+            for warp in warps:
+                rows = frame_warps == warp
+                mel[rows] = spectrum[rows].dot(
+                    self._mel_projection(float(warp)))
+        if self._opts.mel_opts.htk_mode:
+            _numpy.maximum(mel, 1.0, out=mel)
+        return mel
+
+    def _extract_frames(self, signal, offsets, lengths):
+        """Extracts and processes the frames of all waveforms.
+
+        Returns the frame matrix, the number of frames of each waveform and
+        the raw log energy of each frame, if it is needed.
+        """
+        opts = self._frame_opts
+        counts = _numpy.array([_window.num_frames(int(n), opts)
+                               for n in lengths], dtype=_numpy.int64)
+        total = int(counts.sum())
+        frames = _Matrix(total, self._padded_size)
+        if not total:
+            return frames, counts, None
+
+        utts = _numpy.repeat(_numpy.arange(len(counts)), counts)
+        starts = _numpy.cumsum(counts) - counts
+        first = (_numpy.arange(total) - starts[utts]) * self._window_shift
+        if not opts.snip_edges:
+            first += self._window_shift // 2 - self._window_size // 2
+        indices = first[:, None] + _numpy.arange(self._window_size)
+        if not opts.snip_edges:
+            # Samples outside the waveform are reflected as in Kaldi.
+            num_samples = lengths[utts][:, None]
+            while True:
+                indices = _numpy.where(indices < 0, -indices - 1, indices)
+                outside = indices >= num_samples
+                if not outside.any():
+                    break
+                indices = _numpy.where(outside, 2 * num_samples - 1 - indices,
+                                       indices)
+        indices += offsets[utts][:, None]
+
+        array = frames.numpy()
+        window = array[:, :self._window_size]
+        window[:] = signal[indices]
+        if opts.dither != 0.0:
+            window += opts.dither * self._random.standard_normal(
+                window.shape).astype(_numpy.float32)
+        if opts.remove_dc_offset:
+            window -= window.mean(axis=1, keepdims=True)
+        raw_log_energy = None
+        if self._need_raw_log_energy:
+            raw_log_energy = _numpy.log(_numpy.maximum(
+                _numpy.einsum("ij,ij->i", window, window), _FLOAT_EPSILON))
+        if opts.preemph_coeff != 0.0:
+            window[:, 1:] -= opts.preemph_coeff * window[:, :-1]
+            window[:, 0] *= 1.0 - opts.preemph_coeff
+        window *= self._window
+        return frames, counts, raw_log_energy
+
+    def _signal_log_energy(self, array, raw_log_energy):
+        """Returns the floored log energy of each frame."""
+        if raw_log_energy is None:
+            # Kaldi floors spectrogram energies with epsilon, others with min.
+            floor = (_FLOAT_EPSILON if self._kind == "spectrogram"
+                     else _FLOAT_MIN)
+            raw_log_energy = _numpy.log(_numpy.maximum(
+                _numpy.einsum("ij,ij->i", array, array), floor))
+        if self._opts.energy_floor > 0.0:
+            _numpy.maximum(raw_log_energy, _numpy.log(self._opts.energy_floor),
+                           out=raw_log_energy)
+        return raw_log_energy
+
+    def compute(self, waves, lengths=None, vtln_warp=1.0):
+        """Computes the features of multiple waveforms.
+
+        This interface for computing features requires that the user has
+        already checked that the sampling frequency of the waveforms is equal
+        to the sampling frequency specified in the frame extraction options.
+
+        Args:
+            waves: The input waveforms, either a list of vectors or 1-D NumPy
+                arrays, or a single 2-D matrix or NumPy array holding one
+                zero-padded waveform per row, in which case **lengths** should
+                be provided.
+            lengths (List[int]): The number of samples of each waveform, if
+                **waves** is a 2-D array.
+            vtln_warp (float or List[float]): The VTLN warp factor (normally
+                1.0), or a list of warp factors, one per waveform.
+
+        Returns:
+            List[SubMatrix]: The features of each waveform, where the
+            row-index is the frame index. Feature matrices are views into a
+            single matrix holding the features of all waveforms. Waveforms
+            that are too short to extract any frames have empty features.
+
+        Raises:
+            ValueError: If **lengths** or **vtln_warp** do not match
+                **waves**.
+        """
+        if lengths is not None:
+            waves = _numpy.asarray(waves.numpy() if hasattr(waves, "numpy")
+                                   else waves, dtype=_numpy.float32)
+            if waves.ndim != 2:
+                raise ValueError("waves should be a 2-D array when lengths "
+                                 "are provided.")
+            lengths = _numpy.asarray(lengths, dtype=_numpy.int64)
+            if len(lengths) != len(waves):
+                raise ValueError("Number of lengths ({}) does not match the "
+                                 "number of waveforms ({})."
+                                 .format(len(lengths), len(waves)))
+            if len(lengths) and (lengths.min() < 0
+                                 or lengths.max() > waves.shape[1]):
+                raise ValueError("lengths should be in the range [0, {}]."
+                                 .format(waves.shape[1]))
+            signal = _numpy.ascontiguousarray(waves).reshape(-1)
+            offsets = _numpy.arange(len(waves), dtype=_numpy.int64)
+            offsets *= waves.shape[1]
+        else:
+            waves = [_numpy.asarray(wave.numpy() if hasattr(wave, "numpy")
+                                    else wave, dtype=_numpy.float32)
+                     for wave in waves]
+            lengths = _numpy.array([len(wave) for wave in waves],
+                                   dtype=_numpy.int64)
+            offsets = _numpy.cumsum(lengths) - lengths
+            signal = (_numpy.concatenate(waves) if waves
+                      else _numpy.empty(0, dtype=_numpy.float32))
+
+        if _numpy.isscalar(vtln_warp):
+            warps = _numpy.full(len(lengths), vtln_warp, dtype=_numpy.float64)
+        else:
+            warps = _numpy.asarray(vtln_warp, dtype=_numpy.float64)
+            if len(warps) != len(lengths):
+                raise ValueError("Number of VTLN warp factors ({}) does not "
+                                 "match the number of waveforms ({})."
+                                 .format(len(warps), len(lengths)))
+
+        frames, counts, raw_log_energy = self._extract_frames(signal, offsets,
+                                                              lengths)
+        feats = _Matrix(frames.num_rows, self._dim)
+        if frames.num_rows:
+            frame_warps = _numpy.repeat(warps, counts)
+            self._compute(frames, feats, raw_log_energy, frame_warps)
+
+        outputs, start = [], 0
+        for count in counts:
+            count = int(count)
+            if count:
+                outputs.append(feats.row_range(start, count))
+            else:
+                outputs.append(_Matrix())
+            start += count
+        return outputs
+
+    def _compute(self, frames, feats, raw_log_energy, frame_warps):
+        """Computes features from windowed frames."""
+        opts = self._opts
+        array, out = frames.numpy(), feats.numpy()
+
+        if self._kind == "plp":
+            if raw_log_energy is None:
+                raw_log_energy = _numpy.zeros(len(array))
+            for i in range(len(array)):
+                self._computer.compute(float(raw_log_energy[i]),
+                                       float(frame_warps[i]),
+                                       frames[i], feats[i])
+            return
+
+        use_energy = self._kind == "spectrogram" or opts.use_energy
+        if use_energy:
+            log_energy = self._signal_log_energy(array, raw_log_energy)
+        spectrum = _numpy.fft.rfft(array, axis=1)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).astype(_numpy.float32)
+        del spectrum
+
+        if self._kind == "spectrogram":
+            out[:] = _numpy.log(_numpy.maximum(power, _FLOAT_EPSILON))
+            out[:, 0] = log_energy
+        elif self._kind == "fbank":
+            if not opts.use_power:
+                _numpy.sqrt(power, out=power)
+            mel = self._mel_energies(power, frame_warps)
+            if opts.use_log_fbank:
+                mel = _numpy.log(_numpy.maximum(mel, _FLOAT_EPSILON))
+            num_bins = mel.shape[1]
+            if use_energy and opts.htk_compat:
+                out[:, :num_bins] = mel
+                out[:, num_bins] = log_energy
+            elif use_energy:
+                out[:, 0] = log_energy
+                out[:, 1:] = mel
+            else:
+                out[:] = mel
+        else:
+            mel = self._mel_energies(power, frame_warps)
+            mel = _numpy.log(_numpy.maximum(mel, _FLOAT_EPSILON))
+            ceps = mel.dot(self._dct)
+            if self._lifter is not None:
+                ceps *= self._lifter
+            if use_energy:
+                ceps[:, 0] = log_energy
+            if opts.htk_compat:
+                energy = ceps[:, 0].copy()
+                if not use_energy:
+                    energy *= _numpy.sqrt(2.0)
+                out[:, :-1] = ceps[:, 1:]
+                out[:, -1] = energy
+            else:
+                out[:] = ceps
+
+################################################################################
+
+__all__ = [name for name in dir()
+           if name[0] != '_'
+           and not name.endswith('Base')]
@@ -0,0 +1,179 @@
+"""
+Drivers for extracting features from tables of waveforms.
+"""
+
+import collections as _collections
+from concurrent import futures as _futures
+import logging as _logging
+import queue as _queue
+
+from ..matrix import compressed as _compressed
+from ..util import table as _table
+
+
+def extract_features(computer, wav_rspecifier, feats_wspecifier,
+                     num_threads=1, vtln_map_rspecifier="",
+                     utt2spk_rspecifier="", vtln_warp=1.0, channel=-1,
+                     min_duration=0.0, subtract_mean=False,
+                     compression_method=None, read_ahead=16):
+    """Extracts features from a table of waveforms using multiple threads.
+
+    Waveforms are read from **wav_rspecifier** and features are computed
+    with **computer**, e.g. an :class:`~kaldi.feat.mfcc.Mfcc` or a
+    :class:`~kaldi.feat.fbank.Fbank`, on `num_threads` threads, each using
+    its own copy of the computer. Since wrapped C++ calls release the GIL,
+    feature computation runs in parallel. Features are written to
+    **feats_wspecifier** in the order waveforms are read, hence the output is
+    identical to the output of extracting the features sequentially, e.g.
+    with Kaldi's `compute-mfcc-feats`. At most a few waveforms per thread are
+    pending at any time.
+
+    Utterances are handled as in `compute-mfcc-feats`: utterances shorter
+    than **min_duration** seconds, utterances without the requested channel
+    and utterances without a VTLN warp factor are skipped with a warning, as
+    are utterances for which feature computation fails.
+
+    Args:
+        computer: The feature computer, e.g. an instance of
+            :class:`~kaldi.feat.mfcc.Mfcc`, :class:`~kaldi.feat.fbank.Fbank`,
+            :class:`~kaldi.feat.plp.Plp` or
+            :class:`~kaldi.feat.spectrogram.Spectrogram`.
+        wav_rspecifier (str): Kaldi rspecifier for reading the waveforms.
+        feats_wspecifier (str): Kaldi wspecifier for writing the features.
+        num_threads (int): Number of feature computation threads.
+        vtln_map_rspecifier (str): Kaldi rspecifier for reading the map from
+            utterance or speaker ids to VTLN warp factors.
+        utt2spk_rspecifier (str): Kaldi rspecifier for reading the map from
+            utterance ids to speaker ids, if VTLN warp factors are given per
+            speaker.
+        vtln_warp (float): VTLN warp factor, used only if
+            **vtln_map_rspecifier** is not provided.
+        channel (int): Channel to extract. If -1, mono audio is expected and
+            the first channel is used.
+        min_duration (float): Minimum duration of utterances to process (in
+            seconds).
+        subtract_mean (bool): Whether to subtract the mean of each feature
+            matrix.
+        compression_method (CompressionMethod): If provided, features are
+            compressed with this method and written with a
+            :class:`~kaldi.util.table.CompressedMatrixWriter`.
+        read_ahead (int): Number of waveforms read ahead on a background
+            thread.
+
+    Returns:
+        Tuple[int, int]: The number of utterances read and the number of
+        utterances for which features are written.
+
+    Raises:
+        ValueError: If the number of threads is not positive.
+        IOError: If opening the tables fails.
+    """
+    if num_threads < 1:
+        raise ValueError("num_threads should be positive.")
+    workers = _queue.Queue()
+    workers.put(computer)
+    for _ in range(num_threads - 1):
+        workers.put(type(computer).from_other(computer))
+
+    def compute(data, channel, samp_freq, vtln_warp):
+        worker = workers.get()
+        try:
+            feats = worker.compute_features(data[channel], samp_freq,
+                                            vtln_warp)
+        finally:
+            workers.put(worker)
+        if subtract_mean and feats.num_rows:
+            array = feats.numpy()
+            array -= array.mean(axis=0)
+        if compression_method is not None:
+            return _compressed.CompressedMatrix.new(feats, compression_method)
+        return feats
+
+    vtln_map_reader = None
+    if vtln_map_rspecifier:
+        # The map is optional, hence the reader is opened explicitly.
+        vtln_map_reader = _table.RandomAccessFloatReaderMapped()
+        if not vtln_map_reader.open(vtln_map_rspecifier, utt2spk_rspecifier):
+            raise IOError("Error opening VTLN map with rspecifier: {}"
+                          .format(vtln_map_rspecifier))
+    elif utt2spk_rspecifier:
+        _logging.warning("utt2spk option is needed only if vtln-map option "
+                         "is specified.")
+
+    if compression_method is not None:
+        writer_type = _table.CompressedMatrixWriter
+    else:
+        writer_type = _table.MatrixWriter
+
+    def inputs(reader):
+        # Skipped utterances are yielded without arguments to be counted.
+        for key, wave in reader:
+            if wave.duration < min_duration:
+                _logging.warning("File: {} is too short ({} sec): producing "
+                                 "no output.".format(key, wave.duration))
+                yield key, None
+                continue
+            data = wave.data()
+            if channel >= data.num_rows:
+                _logging.warning("File with id {} has {} channels but you "
+                                 "specified channel {}, producing no output."
+                                 .format(key, data.num_rows, channel))
+                yield key, None
+                continue
+            if channel == -1 and data.num_rows != 1:
+                _logging.warning("Channel not specified but you have data "
+                                 "with {} channels; defaulting to zero"
+                                 .format(data.num_rows))
+            this_warp = vtln_warp
+            if vtln_map_reader is not None:
+                if key not in vtln_map_reader:
+                    _logging.warning("No vtln-map entry for utterance-id (or "
+                                     "speaker-id) {}".format(key))
+                    yield key, None
+                    continue
+                this_warp = vtln_map_reader[key]
+            yield key, (data, max(channel, 0), wave.samp_freq, this_warp)
+
+    def extract(reader, writer):
+        num_utts, num_success = 0, 0
+        max_pending = 2 * num_threads
+        pending = _collections.deque()
+
+        def write():
+            key, future = pending.popleft()
+            try:
+                feats = future.result()
+            except Exception:
+                _logging.warning("Failed to compute features for utterance "
+                                 "{}".format(key))
+                return 0
+            writer[key] = feats
+            return 1
+
+        with _futures.ThreadPoolExecutor(num_threads) as executor:
+            for key, args in inputs(reader):
+                num_utts += 1
+                if args is None:
+                    continue
+                pending.append((key, executor.submit(compute, *args)))
+                if len(pending) > max_pending:
+                    num_success += write()
+            while pending:
+                num_success += write()
+        return num_utts, num_success
+
+    try:
+        with _table.SequentialWaveReader(wav_rspecifier, read_ahead) as reader:
+            with writer_type(feats_wspecifier,
+                             async_write=2 * num_threads) as writer:
+                num_utts, num_success = extract(reader, writer)
+    finally:
+        if vtln_map_reader is not None:
+            vtln_map_reader.close()
+    return num_utts, num_success
+
+################################################################################
+
+__all__ = [name for name in dir()
+           if name[0] != '_'
+           and not name.endswith('Base')]
@@ -1,5 +1,50 @@
 from ._online_feature import *
 
+from ..matrix import Matrix as _Matrix
+
+
+def get_frames(feature, start=0, count=None, out=None):
+    """Returns a range of frames of an online feature as a matrix.
+
+    The frames are copied with a single wrapped call, which releases the
+    GIL, instead of one :meth:`get_frame` call and one vector allocation per
+    frame. This works for any online feature, e.g. :class:`OnlineMfcc`,
+    :class:`~kaldi.feat.pitch.OnlineProcessPitch` or
+    :class:`~kaldi.online2.OnlineNnetFeaturePipeline`.
+
+    Args:
+        feature (OnlineFeatureInterface): The online feature.
+        start (int): Index of the first frame.
+        count (int): Number of frames. If ``None``, all frames ready from
+            **start** on are returned.
+        out (MatrixBase): The matrix that will store the frames, e.g. a
+            :class:`~kaldi.matrix.SubMatrix` of a preallocated buffer. It
+            should have **count** rows and `feature.dim()` columns. If
+            ``None``, a new matrix is allocated.
+
+    Returns:
+        Matrix: The frames, i.e. **out** if it is provided.
+
+    Raises:
+        IndexError: If the frames are not ready.
+        ValueError: If **out** does not have the right size.
+    """
+    num_frames_ready = feature.num_frames_ready()
+    if count is None:
+        count = num_frames_ready - start
+    if start < 0 or count < 0 or start + count > num_frames_ready:
+        raise IndexError("Frames [{}, {}) are not ready, number of frames "
+                         "ready: {}".format(start, start + count,
+                                            num_frames_ready))
+    dim = feature.dim()
+    if out is None:
+        out = _Matrix(count, dim)
+    elif out.num_rows != count or out.num_cols != dim:
+        raise ValueError("out should be of size ({}, {}).".format(count, dim))
+    if count:
+        feature.get_frames(list(range(start, start + count)), out)
+    return out
+
 ################################################################################
 
 __all__ = [name for name in dir()
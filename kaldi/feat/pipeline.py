@@ -0,0 +1,358 @@
+"""
+Offline feature pipeline fusing feature extraction, CMVN, deltas and splicing.
+"""
+
+import numpy as _numpy
+
+from ..matrix import Matrix as _Matrix
+from ..transform import cmvn as _cmvn
+from ..util.options import ParseOptions as _ParseOptions
+from . import fbank as _fbank
+from . import functions as _functions
+from . import mfcc as _mfcc
+from . import plp as _plp
+from . import spectrogram as _spectrogram
+
+_FEATURE_TYPES = {
+    "mfcc": (_mfcc.MfccOptions, _mfcc.Mfcc),
+    "fbank": (_fbank.FbankOptions, _fbank.Fbank),
+    "plp": (_plp.PlpOptions, _plp.Plp),
+    "spectrogram": (_spectrogram.SpectrogramOptions, _spectrogram.Spectrogram),
+}
+
+
+class FeaturePipelineOptions(object):
+    """Options for the offline feature pipeline.
+
+    These options can be set directly, registered with a
+    :class:`~kaldi.util.options.ParseOptions` object or read from a
+    configuration file, e.g. a file with the following contents::
+
+        --feature-type=mfcc
+        --feature-config=conf/mfcc.conf
+        --apply-cmvn=true
+        --add-deltas=true
+        --delta-order=2
+
+    Attributes:
+        feature_type (str): Feature type, one of "mfcc", "fbank", "plp" or
+            "spectrogram" (default="mfcc").
+        feature_config (str): Configuration file for feature extraction
+            options, e.g. `conf/mfcc.conf` (default=""). It is read by
+            :meth:`read_feature_config`.
+        mfcc_opts (MfccOptions): Options for MFCC features.
+        fbank_opts (FbankOptions): Options for filterbank features.
+        plp_opts (PlpOptions): Options for PLP features.
+        spectrogram_opts (SpectrogramOptions): Options for spectrogram
+            features.
+        apply_cmvn (bool): Whether to apply per-utterance CMVN if no CMVN
+            statistics are provided (default=False).
+        norm_vars (bool): Whether to apply variance normalization
+            (default=False).
+        add_deltas (bool): Whether to add delta features (default=False).
+        delta_opts (DeltaFeaturesOptions): Options for delta computation.
+        left_context (int): Number of left context frames to splice
+            (default=0).
+        right_context (int): Number of right context frames to splice
+            (default=0).
+    """
+    def __init__(self):
+        self.feature_type = "mfcc"
+        self.feature_config = ""
+        self.mfcc_opts = _mfcc.MfccOptions()
+        self.fbank_opts = _fbank.FbankOptions()
+        self.plp_opts = _plp.PlpOptions()
+        self.spectrogram_opts = _spectrogram.SpectrogramOptions()
+        self.apply_cmvn = False
+        self.norm_vars = False
+        self.add_deltas = False
+        self.delta_opts = _functions.DeltaFeaturesOptions()
+        self.left_context = 0
+        self.right_context = 0
+
+    @classmethod
+    def from_config(cls, filename):
+        """Creates pipeline options from a configuration file.
+
+        Args:
+            filename (str): Configuration file location.
+
+        Returns:
+            FeaturePipelineOptions: The pipeline options.
+        """
+        opts = cls()
+        po = _ParseOptions("")
+        opts.register(po)
+        po.read_config_file(filename)
+        opts.update(po.parse_args([""]))
+        return opts
+
+    @property
+    def feature_opts(self):
+        """Options for the selected feature type."""
+        if self.feature_type not in _FEATURE_TYPES:
+            raise ValueError("Unsupported feature type: {}"
+                             .format(self.feature_type))
+        return getattr(self, self.feature_type + "_opts")
+
+    def register(self, po):
+        """Registers options with an options parser.
+
+        Delta options are registered directly. Other options are returned by
+        :meth:`~kaldi.util.options.ParseOptions.parse_args` and should be
+        passed to :meth:`update` after parsing.
+
+        Args:
+            po (ParseOptions): The options parser.
+        """
+        po.register_str("feature-type", self.feature_type,
+                        "Feature type: mfcc, fbank, plp or spectrogram")
+        po.register_str("feature-config", self.feature_config,
+                        "Configuration file for feature extraction options")
+        po.register_bool("apply-cmvn", self.apply_cmvn,
+                         "Apply per-utterance CMVN if no CMVN statistics are "
+                         "provided")
+        po.register_bool("norm-vars", self.norm_vars,
+                         "Apply variance normalization")
+        po.register_bool("add-deltas", self.add_deltas, "Add delta features")
+        po.register_int("left-context", self.left_context,
+                        "Number of left context frames to splice")
+        po.register_int("right-context", self.right_context,
+                        "Number of right context frames to splice")
+        self.delta_opts.register(po)
+
+    def update(self, args):
+        """Updates options with parsed values.
+
+        The feature configuration file is not read here. It is read when a
+        :class:`FeaturePipeline` is constructed with these options.
+
+        Args:
+            args (Namespace): Parsed values returned by
+                :meth:`~kaldi.util.options.ParseOptions.parse_args`.
+
+        Raises:
+            ValueError: If the feature type is not supported or the context
+                sizes are negative.
+        """
+        self.feature_type = args.feature_type
+        self.feature_config = args.feature_config
+        self.apply_cmvn = args.apply_cmvn
+        self.norm_vars = args.norm_vars
+        self.add_deltas = args.add_deltas
+        self.left_context = args.left_context
+        self.right_context = args.right_context
+        if self.left_context < 0 or self.right_context < 0:
+            raise ValueError("Context sizes should be non-negative.")
+        if self.feature_type not in _FEATURE_TYPES:
+            raise ValueError("Unsupported feature type: {}"
+                             .format(self.feature_type))
+
+    def read_feature_config(self):
+        """Reads feature extraction options from the feature config file.
+
+        Options of the selected feature type are updated in place. Nothing is
+        done if :attr:`feature_config` is empty.
+
+        Returns:
+            The options for the selected feature type.
+
+        Raises:
+            ValueError: If the feature type is not supported.
+        """
+        feature_opts = self.feature_opts
+        if self.feature_config:
+            po = _ParseOptions("")
+            feature_opts.register(po)
+            po.read_config_file(self.feature_config)
+        return feature_opts
+
+
+def _delta_scales(order, window):
+    """Returns the delta filter of each order as in Kaldi's DeltaFeatures."""
+    scales = [_numpy.ones(1)]
+    normalizer = sum(j * j for j in range(-window, window + 1))
+    for _ in range(order):
+        prev = scales[-1]
+        cur = _numpy.zeros(len(prev) + 2 * window)
+        for j in range(-window, window + 1):
+            cur[j + window:j + window + len(prev)] += j * prev
+        scales.append(cur / normalizer)
+    return scales
+
+
+class FeaturePipeline(object):
+    """Offline feature pipeline.
+
+    Runs feature extraction, CMVN, delta computation and frame splicing, i.e.
+    the usual `compute-mfcc-feats | apply-cmvn | add-deltas | splice-feats`
+    chain, in one pass. CMVN is applied in place and deltas and spliced
+    frames are written into internal buffers that are reused across
+    utterances, hence only the extracted features and the output matrix are
+    allocated per utterance. The output is identical to the output of
+    :func:`~kaldi.feat.functions.compute_deltas` and
+    :func:`~kaldi.feat.functions.splice_frames` applied in sequence, up to
+    floating point rounding.
+
+    Pipelines keep internal buffers, hence a pipeline should not be shared
+    between threads.
+
+    Args:
+        opts (FeaturePipelineOptions): Options for the pipeline. Options are
+            read at construction time, including the feature extraction
+            options in :attr:`~FeaturePipelineOptions.feature_config`.
+
+    Raises:
+        ValueError: If the feature type is not supported.
+    """
+    def __init__(self, opts):
+        feature_opts = opts.read_feature_config()
+        self._computer = _FEATURE_TYPES[opts.feature_type][1](feature_opts)
+        self._apply_cmvn = opts.apply_cmvn
+        self._norm_vars = opts.norm_vars
+        self._delta_scales = None
+        if opts.add_deltas:
+            self._delta_scales = _delta_scales(opts.delta_opts.order,
+                                               opts.delta_opts.window)
+        self._left_context = opts.left_context
+        self._right_context = opts.right_context
+        self._buffers = {}
+
+    def dim(self):
+        """Returns the output feature dimension."""
+        dim = self._computer.dim()
+        if self._delta_scales is not None:
+            dim *= len(self._delta_scales)
+        return dim * (self._left_context + self._right_context + 1)
+
+    def _buffer(self, name, num_rows, num_cols):
+        """Returns a reusable buffer with at least the given size."""
+        buf = self._buffers.get(name)
+        if buf is None or len(buf) < num_rows or buf.shape[1] != num_cols:
+            capacity = num_rows
+            if buf is not None and buf.shape[1] == num_cols:
+                capacity = max(num_rows, 2 * len(buf))
+            buf = _numpy.empty((capacity, num_cols), dtype=_numpy.float32)
+            self._buffers[name] = buf
+        return buf[:num_rows]
+
+    def compute(self, wave, samp_freq, vtln_warp=1.0, cmvn_stats=None,
+                out=None):
+        """Computes pipeline features from a waveform.
+
+        Args:
+            wave (Vector): The input waveform.
+            samp_freq (float): The sampling frequency of the waveform.
+            vtln_warp (float): The VTLN warp factor (normally 1.0).
+            cmvn_stats (DoubleMatrix): CMVN statistics, e.g. per-speaker
+                statistics. If ``None``, per-utterance CMVN is applied if
+                enabled in the options.
+            out (MatrixBase): The matrix that will store the output features.
+                If ``None``, a new matrix is allocated.
+
+        Returns:
+            Matrix: The output features, i.e. **out** if it is provided.
+        """
+        feats = self._computer.compute_features(wave, samp_freq, vtln_warp)
+        return self.process(feats, cmvn_stats, out)
+
+    def process(self, feats, cmvn_stats=None, out=None):
+        """Applies CMVN, deltas and splicing to given features.
+
+        CMVN is applied to **feats** in place.
+
+        Args:
+            feats (MatrixBase): The input features, e.g. features read from a
+                table.
+            cmvn_stats (DoubleMatrix): CMVN statistics, e.g. per-speaker
+                statistics. If ``None``, per-utterance CMVN is applied if
+                enabled in the options.
+            out (MatrixBase): The matrix that will store the output features.
+                It should have as many rows as **feats** and :meth:`dim`
+                columns. If ``None``, a new matrix is allocated, unless no
+                deltas or splicing are needed, in which case **feats** is
+                returned.
+
+        Returns:
+            Matrix: The output features, i.e. **out** if it is provided.
+
+        Raises:
+            ValueError: If **out** does not have the right size.
+        """
+        num_frames, feat_dim = feats.num_rows, feats.num_cols
+        dim = self.dim()
+        if out is not None and (out.num_rows != num_frames
+                                or out.num_cols != dim):
+            raise ValueError("out should be of size ({}, {})."
+                             .format(num_frames, dim))
+        if not num_frames:
+            return out if out is not None else _Matrix()
+
+        if cmvn_stats is not None or self._apply_cmvn:
+            cmvn = _cmvn.Cmvn()
+            if cmvn_stats is not None:
+                cmvn.stats = cmvn_stats
+            else:
+                cmvn.init(feat_dim)
+                cmvn.accumulate(feats)
+            cmvn.apply(feats, norm_vars=self._norm_vars)
+
+        splice = self._left_context or self._right_context
+        if self._delta_scales is None and not splice:
+            if out is None:
+                return feats
+            out.numpy()[:] = feats.numpy()
+            return out
+
+        if out is None:
+            out = _Matrix(num_frames, dim)
+        x, y = feats.numpy(), out.numpy()
+
+        if self._delta_scales is not None:
+            delta_dim = feat_dim * len(self._delta_scales)
+            if splice:
+                spliced = self._buffer("spliced", num_frames
+                                       + self._left_context
+                                       + self._right_context, delta_dim)
+                deltas = spliced[self._left_context:
+                                 self._left_context + num_frames]
+            else:
+                deltas = y
+            # Frames are padded with copies of the first and last frames.
+            width = (len(self._delta_scales[-1]) - 1) // 2
+            padded = self._buffer("padded", num_frames + 2 * width, feat_dim)
+            padded[:width] = x[0]
+            padded[width:width + num_frames] = x
+            padded[width + num_frames:] = x[-1]
+            scratch = self._buffer("scratch", num_frames, feat_dim)
+            deltas[:, :feat_dim] = x
+            for i, scales in enumerate(self._delta_scales[1:], 1):
+                block = deltas[:, i * feat_dim:(i + 1) * feat_dim]
+                block.fill(0.0)
+                start = width - (len(scales) - 1) // 2
+                for j, scale in enumerate(scales):
+                    if scale != 0.0:
+                        _numpy.multiply(padded[start + j:
+                                               start + j + num_frames],
+                                        scale, out=scratch)
+                        block += scratch
+        else:
+            delta_dim = feat_dim
+            spliced = self._buffer("spliced", num_frames + self._left_context
+                                   + self._right_context, delta_dim)
+            spliced[self._left_context:self._left_context + num_frames] = x
+
+        if splice:
+            spliced[:self._left_context] = spliced[self._left_context]
+            spliced[self._left_context + num_frames:] = spliced[
+                self._left_context + num_frames - 1]
+            for k in range(self._left_context + self._right_context + 1):
+                y[:, k * delta_dim:(k + 1) * delta_dim] = spliced[
+                    k:k + num_frames]
+        return out
+
+################################################################################
+
+__all__ = [name for name in dir()
+           if name[0] != '_'
+           and not name.endswith('Base')]
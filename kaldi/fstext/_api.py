@@ -3345,13 +3345,22 @@ def symbols_to_indices(symbol_table, symbols):
 
 # Kaldi I/O
 
-def read_fst_kaldi(rxfilename):
+def read_fst_kaldi(rxfilename, mmap=False):
     """Reads FST using Kaldi I/O mechanisms.
 
     Does not support reading in text mode.
 
+    If `mmap` is ``True`` and the FST is a const FST stored in a regular file,
+    the FST data is memory-mapped read-only instead of being copied into
+    memory. Processes mapping the same file share a single copy of it in the
+    page cache. The data can only be mapped if it is aligned in the file, e.g.
+    if the FST was written by OpenFst with alignment enabled. Otherwise, or if
+    the FST is not a const FST or it is not read from a regular file, the FST
+    is read into memory as usual.
+
     Args:
         rxfilename (str): Extended filename for reading the FST.
+        mmap (bool): Whether to memory-map const FSTs read from regular files.
 
     Returns:
         An FST object.
@@ -3360,6 +3369,8 @@ def read_fst_kaldi(rxfilename):
         IOError: If reading fails.
         TypeError: If FST type or arc type is not supported.
     """
+    mmap = (mmap and _util_io.classify_rxfilename(rxfilename)
+            == _util_io.InputType.FILE_INPUT)
     with _util_io.xopen(rxfilename) as ki:
         rxfilename = _util_io.printable_rxfilename(rxfilename)
         if not ki.stream().good():
@@ -3399,6 +3410,8 @@ def read_fst_kaldi(rxfilename):
         else:
             raise TypeError("Unsupported FST arc type: {}.".format(arc_type))
         ropts = _fst.FstReadOptions(rxfilename, hdr)
+        if mmap and fst_type == "const":
+            ropts.mode = _fst.FstReadOptions.read_mode("map")
         fst = fst_class.read_from_stream(ki.stream(), ropts)
         if not fst:
             raise IOError("Error reading FST (after reading header).")
@@ -1,4 +1,48 @@
 from ._compressed_matrix import *
+from ._matrix import Matrix as _Matrix
+
+
+def decompress_rows(cmat, row_start=0, row_end=None, out=None):
+    """Decompresses a range of rows of a compressed matrix.
+
+    Only the requested rows are decompressed, hence reading a small window
+    of a long compressed matrix, e.g. a chunk of frames of an utterance read
+    with a :class:`~kaldi.util.table.SequentialCompressedMatrixReader`, does
+    not require decompressing the whole matrix.
+
+    Args:
+        cmat (CompressedMatrix): The compressed matrix.
+        row_start (int): Index of the first row to decompress.
+        row_end (int): Index past the last row to decompress. If ``None``,
+            rows are decompressed until the end of the matrix.
+        out (MatrixBase): The matrix that will store the decompressed rows,
+            e.g. a :class:`~kaldi.matrix.SubMatrix` of a preallocated buffer.
+            It should have `row_end - row_start` rows and as many columns as
+            **cmat**. If ``None``, a new matrix is allocated.
+
+    Returns:
+        Matrix: The decompressed rows, i.e. **out** if it is provided.
+
+    Raises:
+        IndexError: If the row range is out of bounds.
+        ValueError: If **out** does not have the right size.
+    """
+    if row_end is None:
+        row_end = cmat.num_rows
+    if not 0 <= row_start <= row_end <= cmat.num_rows:
+        raise IndexError("Row range [{}, {}) is out of bounds for a matrix "
+                         "with {} rows.".format(row_start, row_end,
+                                                cmat.num_rows))
+    num_rows = row_end - row_start
+    if out is None:
+        out = _Matrix(num_rows, cmat.num_cols)
+    elif out.num_rows != num_rows or out.num_cols != cmat.num_cols:
+        raise ValueError("out should be of size ({}, {})."
+                         .format(num_rows, cmat.num_cols))
+    if num_rows:
+        cmat.copy_to_mat_offset(row_start, 0, out)
+    return out
+
 
 __all__ = [name for name in dir()
            if name[0] != '_'
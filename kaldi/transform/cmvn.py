@@ -1,8 +1,12 @@
+from concurrent import futures as _futures
+import logging as _logging
+
 from . import _cmvn
 from .. import matrix
 from ..matrix import _kaldi_matrix
 from ..matrix import _kaldi_vector
 from ..util import io
+from ..util import table as _table
 
 class Cmvn(object):
     """Cepstral mean variance normalization (CMVN).
@@ -140,4 +144,221 @@ class Cmvn(object):
             self.stats.write(ko.stream(), binary)
 
 
-__all__ = ['Cmvn']
+def _read_utt2spk(utt2spk):
+    """Reads an utterance-to-speaker map given as a dict or an rspecifier."""
+    if utt2spk is None or isinstance(utt2spk, dict):
+        return utt2spk
+    rspecifier_type, _, _ = _table.classify_rspecifier(utt2spk)
+    if rspecifier_type != _table.RspecifierType.ARCHIVE_SPECIFIER:
+        raise ValueError("utt2spk should be an archive rspecifier, e.g. "
+                         "'ark:data/utt2spk'.")
+    mapping = _table._read_token_archive(utt2spk)
+    if mapping is None:
+        raise IOError("Error reading utt2spk with rspecifier: {}"
+                      .format(utt2spk))
+    return mapping
+
+
+def _accumulate_shard(feats_rspecifier, utt2spk, keep_feats):
+    """Accumulates per-speaker statistics over one feature table.
+
+    Returns the statistics and, if `keep_feats` is ``True``, the list of
+    `(key, speaker, feats)` tuples read from the table.
+    """
+    stats, entries = {}, [] if keep_feats else None
+    with _table.SequentialMatrixReader(feats_rspecifier) as reader:
+        for key, feats in reader:
+            if utt2spk is None:
+                spk = key
+            elif key in utt2spk:
+                spk = utt2spk[key]
+            else:
+                _logging.warning("No speaker for utterance {}, skipping it."
+                                 .format(key))
+                continue
+            spk_stats = stats.get(spk)
+            if spk_stats is None:
+                spk_stats = matrix.DoubleMatrix(2, feats.num_cols + 1)
+                stats[spk] = spk_stats
+            _cmvn.acc_cmvn_stats(feats, None, spk_stats)
+            if keep_feats:
+                entries.append((key, spk, feats))
+    return stats, entries
+
+
+def _accumulate_shards(feats_rspecifier, utt2spk, num_threads, keep_feats):
+    """Accumulates statistics over one or more shards and merges them."""
+    utt2spk = _read_utt2spk(utt2spk)
+    if isinstance(feats_rspecifier, str):
+        feats_rspecifier = [feats_rspecifier]
+    if num_threads < 1:
+        raise ValueError("num_threads should be positive.")
+    if num_threads == 1 or len(feats_rspecifier) == 1:
+        results = [_accumulate_shard(rspecifier, utt2spk, keep_feats)
+                   for rspecifier in feats_rspecifier]
+    else:
+        # Wrapped C++ calls release the GIL, hence shards are read and
+        # accumulated in parallel.
+        with _futures.ThreadPoolExecutor(num_threads) as executor:
+            results = list(executor.map(
+                lambda rspecifier: _accumulate_shard(rspecifier, utt2spk,
+                                                     keep_feats),
+                feats_rspecifier))
+    stats, entries = results[0][0], results[0][1]
+    for shard_stats, shard_entries in results[1:]:
+        for spk, spk_stats in shard_stats.items():
+            if spk in stats:
+                stats[spk].add_mat_(1.0, spk_stats)
+            else:
+                stats[spk] = spk_stats
+        if keep_feats:
+            entries.extend(shard_entries)
+    return stats, entries
+
+
+def _write_stats(stats, stats_wspecifier):
+    """Writes statistics to a table in sorted key order."""
+    with _table.DoubleMatrixWriter(stats_wspecifier) as writer:
+        for key in sorted(stats):
+            writer[key] = stats[key]
+
+
+def compute_cmvn_stats(feats_rspecifier, utt2spk=None, stats_wspecifier="",
+                       num_threads=1):
+    """Computes per-speaker CMVN statistics for a feature table.
+
+    Features are read once and the statistics of each speaker are
+    accumulated as in Kaldi's `compute-cmvn-stats --spk2utt`. If multiple
+    feature tables are given, e.g. the shards `feats.1.ark ... feats.8.ark`,
+    they are accumulated in parallel on `num_threads` threads and the
+    statistics are merged at the end.
+
+    Args:
+        feats_rspecifier (str or List[str]): Kaldi rspecifier, or list of
+            rspecifiers, for reading the features.
+        utt2spk (str or dict): Map from utterance ids to speaker ids, either
+            a dictionary or a Kaldi rspecifier, e.g. `"ark:data/utt2spk"`.
+            If ``None``, statistics are accumulated per utterance.
+        stats_wspecifier (str): If provided, statistics are also written to
+            this table.
+        num_threads (int): Number of shards accumulated in parallel.
+
+    Returns:
+        Dict[str, DoubleMatrix]: The statistics of each speaker (or
+        utterance), in the format of the :attr:`Cmvn.stats` matrix.
+
+    Raises:
+        IOError: If reading utt2spk fails.
+        ValueError: If utt2spk is not an archive rspecifier or the number
+            of threads is not positive.
+    """
+    stats, _ = _accumulate_shards(feats_rspecifier, utt2spk, num_threads,
+                                  False)
+    if stats_wspecifier:
+        _write_stats(stats, stats_wspecifier)
+    return stats
+
+
+def _normalize(key, spk, feats, stats, norm_vars, reverse):
+    """Normalizes features in place, returns False if stats are missing."""
+    spk_stats = stats.get(spk)
+    if spk_stats is None:
+        _logging.warning("No normalization statistics available for key {}, "
+                         "producing no output for this utterance."
+                         .format(key))
+        return False
+    if reverse:
+        _cmvn.apply_cmvn_reverse(spk_stats, norm_vars, feats)
+    else:
+        _cmvn.apply_cmvn(spk_stats, norm_vars, feats)
+    return True
+
+
+def apply_cmvn_stats(feats_rspecifier, feats_wspecifier, stats, utt2spk=None,
+                     norm_vars=False, reverse=False):
+    """Applies per-speaker CMVN to a feature table.
+
+    Features are normalized while streaming them from **feats_rspecifier**
+    to **feats_wspecifier**, as in Kaldi's `apply-cmvn --utt2spk`.
+    Utterances without statistics are skipped with a warning.
+
+    Args:
+        feats_rspecifier (str): Kaldi rspecifier for reading the features.
+        feats_wspecifier (str): Kaldi wspecifier for writing the normalized
+            features.
+        stats (str or dict): The statistics of each speaker, either a
+            dictionary returned by :func:`compute_cmvn_stats` or a Kaldi
+            rspecifier for reading them.
+        utt2spk (str or dict): Map from utterance ids to speaker ids. If
+            ``None``, statistics are looked up by utterance id.
+        norm_vars (bool): Whether to apply variance normalization.
+        reverse (bool): Whether to apply CMVN in a reverse sense.
+
+    Returns:
+        Tuple[int, int]: The number of utterances normalized and the number
+        of utterances without statistics.
+
+    Raises:
+        IOError: If reading utt2spk fails.
+        ValueError: If utt2spk is not an archive rspecifier.
+    """
+    if isinstance(stats, str):
+        with _table.SequentialDoubleMatrixReader(stats) as reader:
+            stats = {key: value for key, value in reader}
+    utt2spk = _read_utt2spk(utt2spk)
+    num_done, num_err = 0, 0
+    with _table.SequentialMatrixReader(feats_rspecifier) as reader:
+        with _table.MatrixWriter(feats_wspecifier) as writer:
+            for key, feats in reader:
+                spk = key if utt2spk is None else utt2spk.get(key)
+                if _normalize(key, spk, feats, stats, norm_vars, reverse):
+                    writer[key] = feats
+                    num_done += 1
+                else:
+                    num_err += 1
+    return num_done, num_err
+
+
+def normalize_cmvn(feats_rspecifier, feats_wspecifier, utt2spk=None,
+                   norm_vars=False, stats_wspecifier="", num_threads=1):
+    """Computes and applies per-speaker CMVN with a single read pass.
+
+    Features are read once and kept in memory while the statistics are
+    accumulated, then normalized in place and written in the order they
+    were read. This avoids reading the features twice, as done by
+    :func:`compute_cmvn_stats` followed by :func:`apply_cmvn_stats`, at the
+    cost of holding all features in memory.
+
+    Args:
+        feats_rspecifier (str or List[str]): Kaldi rspecifier, or list of
+            rspecifiers read in parallel, for reading the features.
+        feats_wspecifier (str): Kaldi wspecifier for writing the normalized
+            features.
+        utt2spk (str or dict): Map from utterance ids to speaker ids. If
+            ``None``, CMVN is applied per utterance.
+        norm_vars (bool): Whether to apply variance normalization.
+        stats_wspecifier (str): If provided, statistics are also written to
+            this table.
+        num_threads (int): Number of shards read in parallel.
+
+    Returns:
+        Dict[str, DoubleMatrix]: The statistics of each speaker (or
+        utterance).
+
+    Raises:
+        IOError: If reading utt2spk fails.
+        ValueError: If utt2spk is not an archive rspecifier or the number
+            of threads is not positive.
+    """
+    stats, entries = _accumulate_shards(feats_rspecifier, utt2spk,
+                                        num_threads, True)
+    if stats_wspecifier:
+        _write_stats(stats, stats_wspecifier)
+    with _table.MatrixWriter(feats_wspecifier) as writer:
+        for key, spk, feats in entries:
+            _normalize(key, spk, feats, stats, norm_vars, False)
+            writer[key] = feats
+    return stats
+
+
+__all__ = ['Cmvn', 'apply_cmvn_stats', 'compute_cmvn_stats', 'normalize_cmvn']
@@ -8,12 +8,194 @@ see `Kaldi I/O mechanisms`_ and `Kaldi I/O from a command-line perspective`_.
    http://kaldi-asr.org/doc/io_tut.html
 """
 
+import gzip as _gzip
+import os as _os
+import shutil as _shutil
+import tempfile as _tempfile
+import threading as _threading
+
+try:
+    import zstandard as _zstandard
+except ImportError:
+    _zstandard = None
 
 from ..base import io as _base_io
 from . import _kaldi_io
 from ._kaldi_io import *
 
 
+################################################################################
+# Compressed Streams
+################################################################################
+
+_COMPRESSION_EXTENSIONS = {".gz": "gzip", ".zst": "zstd", ".zstd": "zstd"}
+_PIPE_BUFFER_SIZE = 1 << 20
+
+
+def _get_compression(filename, compression):
+    """Returns the compression method for a filename.
+
+    Args:
+        filename (str): The filename.
+        compression (str): "gzip", "zstd", "infer" for inferring the method
+            from the filename extension or ``None`` for no compression.
+
+    Returns:
+        The compression method, or ``None`` if the file is not compressed.
+
+    Raises:
+        ValueError: If the compression method is not supported.
+    """
+    if compression == "infer":
+        return _COMPRESSION_EXTENSIONS.get(_os.path.splitext(filename)[1])
+    if compression not in (None, "gzip", "zstd"):
+        raise ValueError("Unsupported compression method: {}"
+                         .format(compression))
+    return compression
+
+
+def _open_compressed(filename, mode, compression):
+    """Opens a compressed file as a binary Python file object."""
+    if compression == "gzip":
+        return _gzip.open(filename, mode)
+    if _zstandard is None:
+        raise ImportError("zstd compression requires the zstandard package.")
+    if "w" in mode:
+        # Compress using all cores.
+        return _zstandard.open(filename, mode,
+                               cctx=_zstandard.ZstdCompressor(threads=-1))
+    return _zstandard.open(filename, mode)
+
+
+class _CompressedPipe(object):
+    """Named pipe connecting a Kaldi stream to a compressed file.
+
+    A background thread decompresses the file into the pipe, or compresses
+    what is written to the pipe into the file. Kaldi streams open the pipe
+    like a regular file, hence no process is spawned for the compression.
+    Since compression libraries release the GIL, compression overlaps with
+    the work done on the other threads.
+
+    Args:
+        filename (str): The compressed file.
+        compression (str): The compression method, "gzip" or "zstd".
+        writing (bool): Whether the pipe is used for writing the file.
+
+    Raises:
+        IOError: If opening the compressed file for reading fails.
+    """
+    def __init__(self, filename, compression, writing):
+        self.filename = filename
+        self.writing = writing
+        # Open files to read first, so that missing files are reported here
+        # instead of leaving the Kaldi stream waiting for the pipe.
+        source = None
+        if not writing:
+            source = _open_compressed(filename, "rb", compression)
+        self._dir = _tempfile.mkdtemp(prefix="kaldi-pipe-")
+        self.path = _os.path.join(self._dir, "pipe")
+        _os.mkfifo(self.path)
+        self._error = None
+        self._stop = _threading.Event()
+        self._thread = _threading.Thread(target=self._copy,
+                                         args=(source, compression))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _copy(self, source, compression):
+        """Copies data between the compressed file and the pipe."""
+        try:
+            if self.writing:
+                with open(self.path, "rb") as src:
+                    with _open_compressed(self.filename, "wb",
+                                          compression) as dst:
+                        _shutil.copyfileobj(src, dst, _PIPE_BUFFER_SIZE)
+            else:
+                with source, open(self.path, "wb") as dst:
+                    while not self._stop.is_set():
+                        data = source.read(_PIPE_BUFFER_SIZE)
+                        if not data:
+                            break
+                        dst.write(data)
+        except BrokenPipeError:
+            # The stream reading the pipe was closed early.
+            pass
+        except Exception as e:
+            self._error = e
+
+    def close(self):
+        """Waits for the background thread and removes the pipe.
+
+        This should be called after the Kaldi stream using the pipe is
+        closed.
+
+        Raises:
+            Exception: The error raised by the background thread, if any.
+        """
+        if self._thread is None:
+            return
+        if not self.writing:
+            self._stop.set()
+        while self._thread.is_alive():
+            # If the thread is waiting to open the pipe, e.g. because the
+            # stream was never opened, open the other end to release it.
+            try:
+                if self.writing:
+                    fd = _os.open(self.path, _os.O_WRONLY | _os.O_NONBLOCK)
+                else:
+                    fd = _os.open(self.path, _os.O_RDONLY | _os.O_NONBLOCK)
+            except OSError:
+                fd = None
+            self._thread.join(0.05)
+            if fd is not None:
+                _os.close(fd)
+        self._thread = None
+        _shutil.rmtree(self._dir, ignore_errors=True)
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+
+def _open_compressed_pipe(xfilename, compression, writing):
+    """Returns the extended filename to use for a compressed file.
+
+    Args:
+        xfilename (str): Extended filename of the compressed file.
+        compression (str): "gzip", "zstd", "infer" for inferring the method
+            from the filename extension or ``None`` for no compression.
+        writing (bool): Whether the file is opened for writing.
+
+    Returns:
+        A tuple `(xfilename, pipe)` where `pipe` is the
+        :class:`_CompressedPipe` connected to the compressed file and
+        `xfilename` is its path, or `pipe` is ``None`` and `xfilename` is
+        unchanged if the file is not compressed.
+
+    Raises:
+        ValueError: If the compression method is not supported or the
+            extended filename is not a regular file.
+    """
+    compression = _get_compression(xfilename, compression)
+    if compression is None:
+        return xfilename, None
+    if writing:
+        regular = (_kaldi_io.classify_wxfilename(xfilename)
+                   == _kaldi_io.OutputType.FILE_OUTPUT)
+    else:
+        regular = (_kaldi_io.classify_rxfilename(xfilename)
+                   == _kaldi_io.InputType.FILE_INPUT)
+    if not regular:
+        raise ValueError("Only regular files can be compressed, got: {}"
+                         .format(xfilename))
+    pipe = _CompressedPipe(xfilename, compression, writing)
+    return pipe.path, pipe
+
+
+################################################################################
+# Input/Output Streams
+################################################################################
+
+
 class Input(_kaldi_io.Input):
     """Input stream for reading from extended filenames.
 
@@ -30,11 +212,21 @@ class Input(_kaldi_io.Input):
     input stream as `unicode` strings, the bytes having been first decoded using
     the platform-dependent default encoding.
 
+    If **compression** is provided, the file is decompressed on a background
+    thread while it is read, without spawning a decompression process as in
+    `"gunzip -c foo.gz |"`. Supported methods are "gzip" and "zstd", the
+    latter requiring the `zstandard` package. If **compression** is
+    "infer", the method is inferred from the filename extension (".gz",
+    ".zst" or ".zstd") and files with other extensions are read as is.
+    Only regular files can be decompressed.
+
     This class implements the iterator and context manager protocols.
 
     Args:
         rxfilename (str): Extended filename to open for reading.
         binary (bool): Whether to open the stream in binary mode.
+        compression (str): Compression method of the file, "infer" or
+            ``None`` for no decompression.
 
     Attributes:
         binary (bool): Whether the contents of the input stream are binary.
@@ -43,11 +235,14 @@ class Input(_kaldi_io.Input):
             if the stream is still open.
     """
 
-    def __init__(self, rxfilename=None, binary=True):
+    # Pipe connecting the stream to a compressed file, if any.
+    _pipe = None
+
+    def __init__(self, rxfilename=None, binary=True, compression=None):
         super(Input, self).__init__()
         self.binary = False
         if rxfilename is not None:
-            self.open(rxfilename, binary)
+            self.open(rxfilename, binary, compression)
 
     def __del__(self):
         if self.is_open():
@@ -67,18 +262,23 @@ class Input(_kaldi_io.Input):
                 break
             yield line
 
-    def open(self, rxfilename, binary=True):
+    def open(self, rxfilename, binary=True, compression=None):
         """Opens the stream for reading.
 
         Args:
             rxfilename (str): Extended filename to open for reading.
             binary (bool): Whether to open the stream in binary mode.
+            compression (str): Compression method of the file, "infer" or
+                ``None`` for no decompression.
         """
+        rxfilename, self._pipe = _open_compressed_pipe(rxfilename,
+                                                       compression, False)
         if binary:
             success, self.binary = super(Input, self).open(rxfilename)
         else:
             success = self._open_text_mode(rxfilename)
         if not success:
+            self._close_pipe()
             raise IOError("Could not open stream for reading.")
         self._read = _base_io.read if binary else _base_io.read_text
         self._readline = _base_io.readline if binary else _base_io.readline_text
@@ -112,6 +312,24 @@ class Input(_kaldi_io.Input):
         """
         return list(self)
 
+    def close(self):
+        """Closes the stream.
+
+        Returns:
+            The exit status of the input pipe, if any, or zero.
+
+        Raises:
+            Exception: The error raised while decompressing the file, if any.
+        """
+        status = super(Input, self).close()
+        self._close_pipe()
+        return status
+
+    def _close_pipe(self):
+        if self._pipe is not None:
+            pipe, self._pipe = self._pipe, None
+            pipe.close()
+
 
 class Output(_kaldi_io.Output):
     """Output stream for writing to extended filenames.
@@ -130,6 +348,14 @@ class Output(_kaldi_io.Output):
     of the stream. This header is checked by PyKaldi input streams opened in
     binary mode to set the `~Input.binary` attribute.
 
+    If **compression** is provided, the file is compressed on a background
+    thread while it is written, without spawning a compression process as in
+    `"| gzip -c > foo.gz"`. Supported methods are "gzip" and "zstd", the
+    latter requiring the `zstandard` package and compressing with all
+    cores. If **compression** is "infer", the method is inferred from the
+    filename extension (".gz", ".zst" or ".zstd") and files with other
+    extensions are written as is. Only regular files can be compressed.
+
     This class implements the context manager protocol.
 
     Args:
@@ -137,12 +363,18 @@ class Output(_kaldi_io.Output):
         binary (bool): Whether to open the stream in binary mode.
         write_header (bool): Whether to write Kaldi binary mode header in
             binary mode.
+        compression (str): Compression method of the file, "infer" or
+            ``None`` for no compression.
     """
 
-    def __init__(self, wxfilename=None, binary=True, write_header=True):
+    # Pipe connecting the stream to a compressed file, if any.
+    _pipe = None
+
+    def __init__(self, wxfilename=None, binary=True, write_header=True,
+                 compression=None):
         super(Output, self).__init__()
         if wxfilename is not None:
-            self.open(wxfilename, binary, write_header)
+            self.open(wxfilename, binary, write_header, compression)
 
     def __del__(self):
         if self.is_open():
@@ -161,7 +393,7 @@ class Output(_kaldi_io.Output):
             raise ValueError("I/O operation on closed stream.")
         _base_io.flush(self.stream())
 
-    def open(self, wxfilename, binary, write_header):
+    def open(self, wxfilename, binary, write_header, compression=None):
         """Opens the stream for writing.
 
         Args:
@@ -169,8 +401,13 @@ class Output(_kaldi_io.Output):
             binary (bool): Whether to open the stream in binary mode.
             write_header (bool): Whether to write Kaldi binary mode header in
                 binary mode.
+            compression (str): Compression method of the file, "infer" or
+                ``None`` for no compression.
         """
+        wxfilename, self._pipe = _open_compressed_pipe(wxfilename,
+                                                       compression, True)
         if not super(Output, self).open(wxfilename, binary, write_header):
+            self._close_pipe()
             raise IOError("Could not open stream for writing.")
         self._write = _base_io.write if binary else _base_io.write_text
 
@@ -195,8 +432,26 @@ class Output(_kaldi_io.Output):
         for line in lines:
             self.write(line)
 
+    def close(self):
+        """Closes the stream.
+
+        Returns:
+            True if the stream is closed successfully, False otherwise.
+
+        Raises:
+            Exception: The error raised while compressing the file, if any.
+        """
+        success = super(Output, self).close()
+        self._close_pipe()
+        return success
+
+    def _close_pipe(self):
+        if self._pipe is not None:
+            pipe, self._pipe = self._pipe, None
+            pipe.close()
+
 
-def xopen(xfilename, mode="r", write_header=True):
+def xopen(xfilename, mode="r", write_header=True, compression=None):
     """Opens an extended filename and returns the stream.
 
     The **mode** defaults to "r" which means open for reading in binary mode.
@@ -230,6 +485,9 @@ def xopen(xfilename, mode="r", write_header=True):
             write Kaldi binary mode header (`\\\\0` then `B`) to the beginning
             of the stream. This header is checked by streams opened for reading
             in binary mode to set `~Input.binary` attribute.
+        compression (str): Compression method of the file, "gzip", "zstd",
+            "infer" for inferring the method from the filename extension or
+            ``None`` for no compression. See `Input` and `Output`.
     """
     if not isinstance(xfilename, str):
         raise TypeError("invalid xfilename: %r" % xfilename)
@@ -249,9 +507,9 @@ def xopen(xfilename, mode="r", write_header=True):
     if not text:
         binary = True
     if reading:
-        return Input(xfilename, binary)
+        return Input(xfilename, binary, compression)
     else:
-        return Output(xfilename, binary, write_header)
+        return Output(xfilename, binary, write_header, compression)
 
 
 ################################################################################
@@ -9,50 +9,208 @@ read/write specifiers, see `Kaldi I/O mechanisms`_ and
    http://kaldi-asr.org/doc/io_tut.html
 """
 
+import collections as _collections
+import glob as _glob
+import mmap as _mmap
+import os as _os
+import queue as _queue
+import random as _random
+import struct as _struct
+import tempfile as _tempfile
+import threading as _threading
+
+import numpy as _numpy
+
+from . import _kaldi_io
 from . import _kaldi_table
 from ._kaldi_table import (read_script_file, write_script_file,
                            classify_wspecifier, classify_rspecifier,
                            WspecifierType, RspecifierType,
                            WspecifierOptions, RspecifierOptions)
 from . import _kaldi_table_ext
+from . import io as _util_io
 import kaldi.matrix as _matrix
 
+################################################################################
+# Compressed Tables
+################################################################################
+
+def _open_compressed_rspecifier(rspecifier, compression):
+    """Returns the rspecifier to use for reading a compressed archive.
+
+    Returns:
+        A tuple `(rspecifier, pipe)` where `pipe` is the pipe connected to
+        the compressed archive, or ``None`` if the archive is not compressed.
+    """
+    if compression is None:
+        return rspecifier, None
+    rspecifier_type, rxfilename, _ = classify_rspecifier(rspecifier)
+    if _util_io._get_compression(rxfilename, compression) is None:
+        return rspecifier, None
+    if rspecifier_type != RspecifierType.ARCHIVE_SPECIFIER:
+        raise ValueError("Only archives can be read compressed, rspecifier: "
+                         "{}".format(rspecifier))
+    path, pipe = _util_io._open_compressed_pipe(rxfilename, compression,
+                                                False)
+    prefix = rspecifier[:len(rspecifier) - len(rxfilename)]
+    return prefix + path, pipe
+
+
+def _open_compressed_wspecifier(wspecifier, compression):
+    """Returns the wspecifier to use for writing a compressed archive.
+
+    Returns:
+        A tuple `(wspecifier, pipe)` where `pipe` is the pipe connected to
+        the compressed archive, or ``None`` if the archive is not compressed.
+    """
+    if compression is None:
+        return wspecifier, None
+    wspecifier_type, ark, _, _ = classify_wspecifier(wspecifier)
+    if _util_io._get_compression(ark, compression) is None:
+        return wspecifier, None
+    # Script files can not point into compressed archives.
+    if wspecifier_type != WspecifierType.ARCHIVE_SPECIFIER:
+        raise ValueError("Only archives without script files can be written "
+                         "compressed, wspecifier: {}".format(wspecifier))
+    path, pipe = _util_io._open_compressed_pipe(ark, compression, True)
+    prefix = wspecifier[:len(wspecifier) - len(ark)]
+    return prefix + path, pipe
+
+
+def _close_pipe(table):
+    """Closes the compressed archive pipe of a table, if any."""
+    if table._pipe is not None:
+        pipe, table._pipe = table._pipe, None
+        pipe.close()
+
 ################################################################################
 # Sequential Readers
 ################################################################################
 
 class _SequentialReaderBase(object):
     """Base class defining the Python API for sequential table readers."""
-    def __init__(self, rspecifier=""):
+    def __init__(self, rspecifier="", read_ahead=0, compression=None):
         """
         This class is used for reading objects sequentially from an archive or
         script file. It implements the iterator protocol similar to how Python
         implements iteration over dictionaries. Each iteration returns a `(key,
         value)` pair from the table in sequential order.
 
+        If `read_ahead` is positive, iterating over the reader reads the table
+        on a background thread that stays up to `read_ahead` entries ahead of
+        the iteration. Since wrapped C++ calls release the GIL, reading and
+        parsing the table, including any input pipes, overlaps with whatever
+        the iterating thread does with the entries. The reader should not be
+        used other than through the iterator until the iteration is over. If
+        the iteration is stopped early, entries read ahead are discarded.
+
+        If `compression` is provided, the archive is decompressed on a
+        background thread while it is read (see :class:`kaldi.util.io.Input`),
+        instead of being read through a decompression pipe, e.g.
+        `"ark:gunzip -c foo.ark.gz |"`.
+
         Args:
             rspecifier(str): Kaldi rspecifier for reading the table.
                 If provided, the table is opened for reading.
+            read_ahead (int): Number of entries to read ahead on a background
+                thread while iterating. If not positive, entries are read on
+                the iterating thread.
+            compression (str): Compression method of the archive, "gzip",
+                "zstd", "infer" for inferring the method from the filename
+                extension or ``None`` for no decompression.
 
         Raises:
             IOError: If opening the table for reading fails.
+            ValueError: If `compression` is provided and the table is not an
+                archive stored in a regular file.
         """
         super(_SequentialReaderBase, self).__init__()
+        self.read_ahead = read_ahead
+        self.compression = compression
         if rspecifier != "":
             if not self.open(rspecifier):
                 raise IOError("Error opening sequential table reader with "
                               "rspecifier: {}".format(rspecifier))
 
+    # Background thread and stop event of the active read ahead iterator.
+    _read_ahead_thread = None
+
+    # Pipe connected to the compressed archive, if any.
+    _pipe = None
+    compression = None
+
     def __enter__(self):
         return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __iter__(self):
+        if self.read_ahead > 0:
+            return self._iter_read_ahead()
+        return self._iter()
+
+    def _iter(self):
+        """Generates table entries read on the calling thread."""
         while not self.done():
             key = self.key()
             value = self.value()
             self.next()
             yield key, value
 
+    def _iter_read_ahead(self):
+        """Generates table entries read ahead on a background thread."""
+        self._stop_read_ahead()
+        entries = _queue.Queue(self.read_ahead)
+        stop = _threading.Event()
+        end = object()
+
+        def put(entry):
+            while not stop.is_set():
+                try:
+                    entries.put(entry, timeout=0.1)
+                    return True
+                except _queue.Full:
+                    pass
+            return False
+
+        def read():
+            try:
+                for entry in self._iter():
+                    if not put(entry):
+                        return
+                put((end, None))
+            except Exception as e:
+                put((end, e))
+
+        thread = _threading.Thread(target=read)
+        thread.daemon = True
+        self._read_ahead_thread = thread, stop
+        thread.start()
+        try:
+            while True:
+                try:
+                    key, value = entries.get(timeout=0.1)
+                except _queue.Empty:
+                    if stop.is_set():
+                        return
+                    continue
+                if key is end:
+                    if value is not None:
+                        raise value
+                    return
+                yield key, value
+        finally:
+            self._stop_read_ahead()
+
+    def _stop_read_ahead(self):
+        """Stops the active read ahead thread, if any."""
+        if self._read_ahead_thread is not None:
+            thread, stop = self._read_ahead_thread
+            self._read_ahead_thread = None
+            stop.set()
+            thread.join()
+
     def open(self, rspecifier):
         """Opens the table for reading.
 
@@ -66,7 +224,13 @@ class _SequentialReaderBase(object):
         Raises:
             IOError: If opening the table for reading fails.
         """
-        return super(_SequentialReaderBase, self).open(rspecifier)
+        self._stop_read_ahead()
+        rspecifier, self._pipe = _open_compressed_rspecifier(rspecifier,
+                                                             self.compression)
+        success = super(_SequentialReaderBase, self).open(rspecifier)
+        if not success:
+            _close_pipe(self)
+        return success
 
     def done(self):
         """Indicates whether the table reader is exhausted or not.
@@ -137,7 +301,10 @@ class _SequentialReaderBase(object):
         Returns:
             True if table is closed successfully, False otherwise.
         """
-        return super(_SequentialReaderBase, self).close()
+        self._stop_read_ahead()
+        success = super(_SequentialReaderBase, self).close()
+        _close_pipe(self)
+        return success
 
 
 class SequentialVectorReader(_SequentialReaderBase,
@@ -164,6 +331,19 @@ class SequentialDoubleMatrixReader(_SequentialReaderBase,
     pass
 
 
+class SequentialCompressedMatrixReader(
+        _SequentialReaderBase,
+        _kaldi_table.SequentialCompressedMatrixReader):
+    """Sequential table reader for compressed matrices.
+
+    Values are read as compressed matrices, which can be decompressed in
+    whole or in part, e.g. with
+    :func:`kaldi.matrix.compressed.decompress_rows`. Uncompressed matrices in
+    the table are compressed when they are read.
+    """
+    pass
+
+
 class SequentialWaveReader(_SequentialReaderBase,
                            _kaldi_table.SequentialWaveReader):
     """Sequential table reader for wave files."""
@@ -288,27 +468,345 @@ class SequentialFloatPairVectorReader(
     """Sequential table reader for sequences of single precision float pairs."""
     pass
 
+
+def _glob_rspecifier(rspecifier):
+    """Expands the filename pattern in an rspecifier."""
+    rspecifier_type, rxfilename, _ = classify_rspecifier(rspecifier)
+    if rspecifier_type == RspecifierType.NO_SPECIFIER:
+        raise ValueError("Invalid rspecifier: {}".format(rspecifier))
+    prefix = rspecifier[:len(rspecifier) - len(rxfilename)]
+    filenames = sorted(_glob.glob(rxfilename))
+    if not filenames:
+        raise IOError("No tables match rspecifier: {}".format(rspecifier))
+    return [prefix + filename for filename in filenames]
+
+
+class ShardedSequentialReader(object):
+    """Sequential table reader for tables sharded into multiple parts.
+
+    This reader reads the entries of multiple tables, e.g. the archives
+    `feats.1.ark ... feats.200.ark`, as a single sequence of `(key, value)`
+    pairs. Up to `num_threads` shards are read concurrently, each on its own
+    background thread (see the `read_ahead` argument of sequential table
+    readers). Since wrapped C++ calls release the GIL, reading and parsing
+    the shards overlaps with each other and with the processing of the
+    entries in the iterating thread.
+
+    Entries of the shards being read are interleaved in round-robin order. If
+    `shuffle` is ``True``, the shards are read in random order and entries are
+    passed through a shuffle buffer, as typically done for training. Memory
+    use is bounded by `num_threads * read_ahead + shuffle_buffer_size`
+    entries.
+
+    Args:
+        reader_type (type): The sequential table reader type for reading the
+            shards, e.g. :class:`SequentialMatrixReader`.
+        rspecifiers (str or List[str]): Kaldi rspecifiers for reading the
+            shards. If a single rspecifier is given, its filename is treated
+            as a glob pattern, e.g. `"ark:data/feats.*.ark"`, and the matching
+            shards are read in sorted order.
+        num_threads (int): Number of shards read concurrently.
+        read_ahead (int): Number of entries read ahead in each shard.
+        shuffle (bool): Whether to shuffle the shards and the entries.
+        shuffle_buffer_size (int): Number of entries in the shuffle buffer.
+        seed (int): Seed of the random number generator used for shuffling.
+        compression (str): Compression method of the shards, see
+            :class:`SequentialMatrixReader`.
+
+    Raises:
+        IOError: If no shards match the glob pattern.
+        ValueError: If the rspecifier is not valid.
+    """
+    def __init__(self, reader_type, rspecifiers, num_threads=4, read_ahead=16,
+                 shuffle=False, shuffle_buffer_size=1000, seed=None,
+                 compression=None):
+        if isinstance(rspecifiers, str):
+            rspecifiers = _glob_rspecifier(rspecifiers)
+        if num_threads < 1:
+            raise ValueError("num_threads should be positive.")
+        if read_ahead < 1:
+            raise ValueError("read_ahead should be positive.")
+        if shuffle and shuffle_buffer_size < 1:
+            raise ValueError("shuffle_buffer_size should be positive.")
+        self.reader_type = reader_type
+        self.rspecifiers = list(rspecifiers)
+        self.num_threads = num_threads
+        self.read_ahead = read_ahead
+        self.shuffle = shuffle
+        self.shuffle_buffer_size = shuffle_buffer_size
+        self.compression = compression
+        self._random = _random.Random(seed)
+
+    def __iter__(self):
+        rspecifiers = list(self.rspecifiers)
+        if self.shuffle:
+            self._random.shuffle(rspecifiers)
+        entries = self._interleave(rspecifiers)
+        try:
+            if self.shuffle:
+                for entry in self._shuffle(entries):
+                    yield entry
+            else:
+                for entry in entries:
+                    yield entry
+        finally:
+            entries.close()
+
+    def _interleave(self, rspecifiers):
+        """Generates the entries of the shards in round-robin order."""
+        pending = _collections.deque(rspecifiers)
+        active = _collections.deque()
+        try:
+            while pending or active:
+                while pending and len(active) < self.num_threads:
+                    reader = self.reader_type(pending.popleft(),
+                                              read_ahead=self.read_ahead,
+                                              compression=self.compression)
+                    active.append((reader, iter(reader)))
+                reader, entries = active.popleft()
+                try:
+                    entry = next(entries)
+                except StopIteration:
+                    reader.close()
+                    continue
+                active.append((reader, entries))
+                yield entry
+        finally:
+            for reader, entries in active:
+                entries.close()
+                reader.close()
+
+    def _shuffle(self, entries):
+        """Generates entries in random order using a shuffle buffer."""
+        buffer = []
+        for entry in entries:
+            if len(buffer) < self.shuffle_buffer_size:
+                buffer.append(entry)
+                continue
+            i = self._random.randrange(len(buffer))
+            buffer[i], entry = entry, buffer[i]
+            yield entry
+        self._random.shuffle(buffer)
+        for entry in buffer:
+            yield entry
+
+
+class PaddedBatchReader(object):
+    """Reader for minibatches of padded feature matrices.
+
+    This reader groups the entries of a matrix table into minibatches of
+    `batch_size` entries and yields each minibatch as a tuple `(keys, batch,
+    lengths)`, where `keys` is the list of keys, `batch` is an array of shape
+    `(batch_size, max_length, dim)` holding the matrices padded with
+    `pad_value` and `lengths` is an array holding the number of rows of each
+    matrix. Each matrix is copied once, directly into the minibatch array.
+    The last minibatch may have fewer entries.
+
+    If `bucket_size` is larger than `batch_size`, entries are collected into
+    buckets of `bucket_size` entries and sorted by length before they are
+    grouped into minibatches, so that matrices of similar lengths are padded
+    together. Entries left over from a bucket are carried over to the next
+    one.
+
+    Entries are read from `table`, which can be an rspecifier or any
+    iterable of `(key, matrix)` pairs, e.g. a sequential table reader or a
+    :class:`ShardedSequentialReader`. If an rspecifier is given, it is read
+    with a :class:`SequentialMatrixReader`, with `read_ahead` entries read
+    ahead on a background thread.
+
+    Args:
+        table (str or Iterable[Tuple[str, Matrix]]): Kaldi rspecifier for
+            reading the matrices, or an iterable of `(key, matrix)` pairs.
+        batch_size (int): Number of entries in each minibatch.
+        bucket_size (int): Number of entries sorted by length before they
+            are grouped into minibatches. If not larger than `batch_size`,
+            entries are grouped in table order.
+        pad_value (float): Value used for padding.
+        dtype (numpy.dtype): Data type of the minibatch arrays.
+        read_ahead (int): Number of entries read ahead if `table` is an
+            rspecifier.
+        compression (str): Compression method of the archive if `table` is
+            an rspecifier, see :class:`SequentialMatrixReader`.
+
+    Raises:
+        ValueError: If `batch_size` is not positive.
+    """
+    def __init__(self, table, batch_size, bucket_size=0, pad_value=0.0,
+                 dtype=_numpy.float32, read_ahead=16, compression=None):
+        if batch_size < 1:
+            raise ValueError("batch_size should be positive.")
+        self.table = table
+        self.batch_size = batch_size
+        self.bucket_size = bucket_size
+        self.pad_value = pad_value
+        self.dtype = dtype
+        self.read_ahead = read_ahead
+        self.compression = compression
+
+    def __iter__(self):
+        if isinstance(self.table, str):
+            with SequentialMatrixReader(self.table, self.read_ahead,
+                                        self.compression) as reader:
+                for batch in self._batches(reader):
+                    yield batch
+        else:
+            for batch in self._batches(self.table):
+                yield batch
+
+    def _batches(self, entries):
+        """Generates minibatches of entries."""
+        bucket = []
+        bucketing = self.bucket_size > self.batch_size
+        bucket_size = self.bucket_size if bucketing else self.batch_size
+        for entry in entries:
+            bucket.append(entry)
+            if len(bucket) < bucket_size:
+                continue
+            if bucketing:
+                bucket.sort(key=lambda entry: entry[1].num_rows)
+            end = len(bucket) - len(bucket) % self.batch_size
+            for start in range(0, end, self.batch_size):
+                yield self._collate(bucket[start:start + self.batch_size])
+            bucket = bucket[end:]
+        if bucketing:
+            bucket.sort(key=lambda entry: entry[1].num_rows)
+        for start in range(0, len(bucket), self.batch_size):
+            yield self._collate(bucket[start:start + self.batch_size])
+
+    def _collate(self, entries):
+        """Copies a list of entries into a padded minibatch."""
+        keys = [key for key, _ in entries]
+        lengths = _numpy.array([value.num_rows for _, value in entries],
+                               dtype=_numpy.int32)
+        dim = max(value.num_cols for _, value in entries)
+        batch = _numpy.empty((len(entries), lengths.max(), dim), self.dtype)
+        for i, (key, value) in enumerate(entries):
+            length = lengths[i]
+            if length:
+                if value.num_cols != dim:
+                    raise ValueError("Matrix {} has {} columns, expected {}."
+                                     .format(key, value.num_cols, dim))
+                batch[i, :length] = value.numpy()
+            batch[i, length:] = self.pad_value
+        return keys, batch, lengths
+
 ################################################################################
 # Random Access Readers
 ################################################################################
 
+def _script_locations(rspecifier):
+    """Reads the archive locations of the entries in a script rspecifier.
+
+    Returns a dictionary mapping each key to a `(filename, offset)` pair, or
+    `None` if the rspecifier is not a script file that can be read twice.
+    """
+    rspecifier_type, rxfilename, _ = classify_rspecifier(rspecifier)
+    if (rspecifier_type != RspecifierType.SCRIPT_SPECIFIER
+            or _kaldi_io.classify_rxfilename(rxfilename)
+            != _kaldi_io.InputType.FILE_INPUT):
+        return None
+    try:
+        script = read_script_file(rxfilename, False)
+    except ValueError:
+        return None
+    locations = {}
+    for key, location in script:
+        if location.endswith("]"):
+            location = location[:location.rfind("[")]
+        filename, _, offset = location.rpartition(":")
+        if filename and offset.isdigit():
+            locations[key] = (filename, int(offset))
+        else:
+            locations[key] = (location, 0)
+    return locations
+
+
+def _mapped_script_locations(table_rspecifier, map_rspecifier):
+    """Reads the archive locations of the entries in a mapped script table.
+
+    Returns a dictionary mapping each key in the map to the `(filename,
+    offset)` pair of the table entry it is mapped to, or `None` if either
+    the table or the map cannot be read twice.
+    """
+    locations = _script_locations(table_rspecifier)
+    if not locations or map_rspecifier == "":
+        return locations
+    _, rxfilename, _ = classify_rspecifier(map_rspecifier)
+    if (_kaldi_io.classify_rxfilename(rxfilename)
+            != _kaldi_io.InputType.FILE_INPUT):
+        return None
+    mapping = _read_token_archive(map_rspecifier)
+    if mapping is None:
+        return None
+    return {key: locations[table_key] for key, table_key in mapping.items()
+            if table_key in locations}
+
+
+def _read_token_archive(rspecifier):
+    """Reads a text archive of tokens, e.g. utt2spk, into a dictionary.
+
+    Returns `None` if the rspecifier is not an archive rspecifier or the
+    archive cannot be read.
+    """
+    rspecifier_type, rxfilename, _ = classify_rspecifier(rspecifier)
+    if rspecifier_type != RspecifierType.ARCHIVE_SPECIFIER:
+        return None
+    # Text archives of tokens have the script file format.
+    try:
+        return dict(read_script_file(rxfilename, False))
+    except ValueError:
+        return None
+
+
+def _get_many(reader, keys, locations):
+    """Looks up multiple keys in file order."""
+    keys = list(keys)
+    if locations:
+        # Keys with unknown locations, e.g. missing keys, are looked up first.
+        unknown = ("", -1)
+        order = sorted(range(len(keys)),
+                       key=lambda i: locations.get(keys[i], unknown))
+    else:
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+    values = [None] * len(keys)
+    for i in order:
+        values[i] = reader[keys[i]]
+    return values
+
+
 class _RandomAccessReaderBase(object):
     """Base class defining the Python API for random access table readers."""
-    def __init__(self, rspecifier=""):
+    _rspecifier = ""
+    _locations = None
+
+    # Pipe connected to the compressed archive, if any.
+    _pipe = None
+    compression = None
+
+    def __init__(self, rspecifier="", compression=None):
         """
         This class is used for randomly accessing objects in an archive or
         script file. It implements `__contains__` and `__getitem__` methods to
         provide a dictionary-like interface for accessing table entries. e.g.
         `reader[key]` returns the `value` associated with the `key`.
 
+        If `compression` is provided, the archive is decompressed on a
+        background thread while it is read (see :class:`kaldi.util.io.Input`).
+
         Args:
             rspecifier(str): Kaldi rspecifier for reading the table.
                 If provided, the table is opened for reading.
+            compression (str): Compression method of the archive, "gzip",
+                "zstd", "infer" for inferring the method from the filename
+                extension or ``None`` for no decompression.
 
         Raises:
             IOError: If opening the table for reading fails.
+            ValueError: If `compression` is provided and the table is not an
+                archive stored in a regular file.
         """
         super(_RandomAccessReaderBase, self).__init__()
+        self.compression = compression
         if rspecifier != "":
             if not self.open(rspecifier):
                 raise IOError("Error opening random access table reader with "
@@ -317,6 +815,9 @@ class _RandomAccessReaderBase(object):
     def __enter__(self):
         return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __contains__(self, key):
         return self.has_key(key)
 
@@ -339,7 +840,13 @@ class _RandomAccessReaderBase(object):
         Raises:
             IOError: If opening the table for reading fails.
         """
-        return super(_RandomAccessReaderBase, self).open(rspecifier)
+        self._rspecifier, self._locations = rspecifier, None
+        rspecifier, self._pipe = _open_compressed_rspecifier(rspecifier,
+                                                             self.compression)
+        success = super(_RandomAccessReaderBase, self).open(rspecifier)
+        if not success:
+            _close_pipe(self)
+        return success
 
     def has_key(self, key):
         """Checks whether the table has the key.
@@ -369,6 +876,32 @@ class _RandomAccessReaderBase(object):
         """
         return super(_RandomAccessReaderBase, self).value(key)
 
+    def get_many(self, keys):
+        """Returns the values associated with multiple keys.
+
+        Keys are looked up in the order their entries are stored in the
+        underlying archives rather than the order they are given in. If the
+        table is read through a script file, the script file is read once to
+        find out where the entries are stored and the lookups are sorted by
+        archive file and offset. Otherwise, the lookups are sorted by key,
+        which is the storage order of sorted archives. This way, each
+        archive is read in one forward pass instead of seeking back and forth
+        for each key. All lookups are done by wrapped calls that release the
+        GIL.
+
+        Args:
+            keys (Iterable[str]): The keys.
+
+        Returns:
+            List of values associated with the keys, in the order of the keys.
+
+        Raises:
+            KeyError: If the table does not have one of the keys.
+        """
+        if self._locations is None:
+            self._locations = _script_locations(self._rspecifier) or {}
+        return _get_many(self, keys, self._locations)
+
     def is_open(self):
         """Indicates whether the table reader is open or not.
 
@@ -389,7 +922,9 @@ class _RandomAccessReaderBase(object):
         Returns:
             True if table is closed successfully, False otherwise.
         """
-        return super(_RandomAccessReaderBase, self).close()
+        success = super(_RandomAccessReaderBase, self).close()
+        _close_pipe(self)
+        return success
 
 
 class RandomAccessVectorReader(_RandomAccessReaderBase,
@@ -418,6 +953,19 @@ class RandomAccessDoubleMatrixReader(
     pass
 
 
+class RandomAccessCompressedMatrixReader(
+        _RandomAccessReaderBase,
+        _kaldi_table.RandomAccessCompressedMatrixReader):
+    """Random access table reader for compressed matrices.
+
+    Values are read as compressed matrices, which can be decompressed in
+    whole or in part, e.g. with
+    :func:`kaldi.matrix.compressed.decompress_rows`. Uncompressed matrices in
+    the table are compressed when they are read.
+    """
+    pass
+
+
 class RandomAccessWaveReader(_RandomAccessReaderBase,
                              _kaldi_table.RandomAccessWaveReader):
     """Random access table reader for wave files."""
@@ -546,7 +1094,15 @@ class _RandomAccessReaderMappedBase(object):
     """
     Base class defining the Python API for mapped random access table readers.
     """
-    def __init__(self, table_rspecifier="", map_rspecifier=""):
+    _rspecifiers = ("", "")
+    _locations = None
+
+    # Pipe connected to the compressed archive, if any.
+    _pipe = None
+    compression = None
+
+    def __init__(self, table_rspecifier="", map_rspecifier="",
+                 compression=None):
         """
         This class is used for randomly accessing objects in an archive or
         script file. It implements `__contains__` and `__getitem__` methods to
@@ -556,16 +1112,25 @@ class _RandomAccessReaderMappedBase(object):
         the `value` associated with the key `map[key]`. Otherwise, it works like
         a random access table reader.
 
+        If `compression` is provided, the table archive is decompressed on a
+        background thread while it is read (see :class:`kaldi.util.io.Input`).
+
         Args:
             table_rspecifier(str): Kaldi rspecifier for reading the table.
                 If provided, the table is opened for reading.
             map_rspecifier (str): Kaldi rspecifier for reading the map.
                 If provided, the map is opened for reading.
+            compression (str): Compression method of the table archive,
+                "gzip", "zstd", "infer" for inferring the method from the
+                filename extension or ``None`` for no decompression.
 
         Raises:
             IOError: If opening the table or map for reading fails.
+            ValueError: If `compression` is provided and the table is not an
+                archive stored in a regular file.
         """
         super(_RandomAccessReaderMappedBase, self).__init__()
+        self.compression = compression
         if table_rspecifier != "" and map_rspecifier != "":
             if not self.open(table_rspecifier, map_rspecifier):
                 raise IOError("Error opening mapped random access table reader "
@@ -575,6 +1140,9 @@ class _RandomAccessReaderMappedBase(object):
     def __enter__(self):
         return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __contains__(self, key):
         return self.has_key(key)
 
@@ -599,8 +1167,15 @@ class _RandomAccessReaderMappedBase(object):
         Raises:
             IOError: If opening the table or map for reading fails.
         """
-        return super(_RandomAccessReaderMappedBase, self).open(table_rspecifier,
-                                                               map_rspecifier)
+        self._rspecifiers = table_rspecifier, map_rspecifier
+        self._locations = None
+        table_rspecifier, self._pipe = _open_compressed_rspecifier(
+            table_rspecifier, self.compression)
+        success = super(_RandomAccessReaderMappedBase, self).open(
+            table_rspecifier, map_rspecifier)
+        if not success:
+            _close_pipe(self)
+        return success
 
     def has_key(self, key):
         """Checks whether the table has the key.
@@ -630,6 +1205,31 @@ class _RandomAccessReaderMappedBase(object):
         """
         return super(_RandomAccessReaderMappedBase, self).value(key)
 
+    def get_many(self, keys):
+        """Returns the values associated with multiple keys.
+
+        Keys are looked up in the order the entries they are mapped to are
+        stored in the underlying archives rather than the order they are
+        given in. If the table is read through a script file and the map is
+        a text archive file, both are read once to find out where the
+        entries are stored and the lookups are sorted by archive file and
+        offset. Otherwise, the lookups are sorted by key. All lookups are
+        done by wrapped calls that release the GIL.
+
+        Args:
+            keys (Iterable[str]): The keys.
+
+        Returns:
+            List of values associated with the keys, in the order of the keys.
+
+        Raises:
+            KeyError: If the table does not have one of the keys.
+        """
+        if self._locations is None:
+            self._locations = (_mapped_script_locations(*self._rspecifiers)
+                               or {})
+        return _get_many(self, keys, self._locations)
+
     def is_open(self):
         """Indicates whether the table reader is open or not.
 
@@ -650,7 +1250,9 @@ class _RandomAccessReaderMappedBase(object):
         Returns:
             True if table is closed successfully, False otherwise.
         """
-        return super(_RandomAccessReaderMappedBase, self).close()
+        success = super(_RandomAccessReaderMappedBase, self).close()
+        _close_pipe(self)
+        return success
 
 
 class RandomAccessVectorReaderMapped(
@@ -693,7 +1295,8 @@ class RandomAccessFloatReaderMapped(
 
 class _WriterBase(object):
     """Base class defining the additional Python API for table writers."""
-    def __init__(self, wspecifier=""):
+    def __init__(self, wspecifier="", write_index=False, async_write=0,
+                 compression=None):
         """
 
         This class is used for writing objects to an archive or script file. It
@@ -701,25 +1304,201 @@ class _WriterBase(object):
         interface for writing table entries, e.g. `writer[key] = value` writes
         the pair `(key, value)` to the table.
 
+        If `write_index` is ``True``, an offset index of the archive (see
+        :class:`ArchiveIndex`) is written next to it when the table is closed,
+        e.g. `foo.ark.idx` for `foo.ark`. Archive offsets are taken from a
+        script file, which Kaldi writes along with the archive. If the
+        wspecifier does not specify one, a temporary script file is used.
+
+        If `async_write` is positive, entries are serialized and written to
+        the table on a background thread while up to `async_write` entries
+        are queued for writing. Since wrapped C++ calls release the GIL,
+        writing the table, including any output pipes, overlaps with
+        whatever the writing thread does next. Entries are written in the
+        order they are given in. Written values are owned by the background
+        thread until they are written, hence they should not be modified
+        after they are passed to the writer. Errors raised while writing an
+        entry are raised by the next call to `write`, `flush` or `close`.
+
+        If `compression` is provided, the archive is compressed on a
+        background thread while it is written (see
+        :class:`kaldi.util.io.Output`), instead of being written through a
+        compression pipe, e.g. `"ark:| gzip -c > foo.ark.gz"`. Compressed
+        archives can not be written along with script files or indexes.
+
         Args:
             wspecifier (str): Kaldi wspecifier for writing the table.
                 If provided, the table is opened for writing.
+            write_index (bool): Whether to write an offset index of the
+                archive. Only archives written to regular files can be
+                indexed.
+            async_write (int): Number of entries that can be queued for
+                writing on a background thread. If not positive, entries are
+                written on the calling thread.
+            compression (str): Compression method of the archive, "gzip",
+                "zstd", "infer" for inferring the method from the filename
+                extension or ``None`` for no compression.
 
         Raises:
             IOError: If opening the table for writing fails.
+            ValueError: If `write_index` is ``True`` and the archive can not
+                be indexed, or `compression` is provided and the table is not
+                an archive written to a regular file.
         """
         super(_WriterBase, self).__init__()
+        self.write_index = write_index
+        self.async_write = async_write
+        self.compression = compression
         if wspecifier != "":
             if not self.open(wspecifier):
                 raise IOError("Error opening table writer with wspecifier: {}"
                               .format(wspecifier))
 
+    # Archive filename, script filename and whether the script file is
+    # temporary, if an index is written when the table is closed.
+    _index_files = None
+
+    # Queue of entries and thread writing them, if entries are written on a
+    # background thread, and the first error raised by the thread.
+    _write_queue = None
+    _write_thread = None
+    _write_error = None
+
+    # Pipe connected to the compressed archive, if any.
+    _pipe = None
+    compression = None
+
+    # Output stream of the archive and whether it is flushed after each
+    # entry, if values are written directly to the stream.
+    _output = None
+    _flush_output = False
+
+    # Whether values can be written directly to binary archives.
+    _write_directly = False
+
     def __enter__(self):
         return self
 
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __setitem__(self, key, value):
         self.write(key, value)
 
+    def _start_async_write(self):
+        """Starts the background writer thread."""
+        self._write_queue = _queue.Queue(self.async_write)
+        self._write_error = None
+        self._write_thread = _threading.Thread(target=self._write_entries,
+                                               args=(self._write_queue,))
+        self._write_thread.daemon = True
+        self._write_thread.start()
+
+    def _write_entries(self, queue):
+        """Writes queued entries until the queue is closed."""
+        while True:
+            entry = queue.get()
+            try:
+                if entry is None:
+                    return
+                # Entries queued after an error are discarded.
+                if self._write_error is None:
+                    self._write_entry(*entry)
+            except Exception as e:
+                self._write_error = e
+            finally:
+                queue.task_done()
+
+    def _stop_async_write(self):
+        """Writes the queued entries and stops the background writer thread."""
+        if self._write_thread is None:
+            return
+        self._write_queue.put(None)
+        self._write_thread.join()
+        self._write_queue = self._write_thread = None
+
+    def _raise_write_error(self):
+        """Raises the error raised by the background writer thread, if any."""
+        error, self._write_error = self._write_error, None
+        if error is not None:
+            raise error
+
+    def _prepare_index(self, wspecifier):
+        """Returns the wspecifier to use for writing an indexed archive."""
+        wtype, ark, scp, opts = classify_wspecifier(wspecifier)
+        if wtype not in (WspecifierType.ARCHIVE_SPECIFIER,
+                         WspecifierType.BOTH_SPECIFIER):
+            raise ValueError("Only archives can be indexed, wspecifier: {}"
+                             .format(wspecifier))
+        if (_kaldi_io.classify_wxfilename(ark)
+                != _kaldi_io.OutputType.FILE_OUTPUT):
+            raise ValueError("Only archives written to regular files can be "
+                             "indexed, wspecifier: {}".format(wspecifier))
+        if wtype == WspecifierType.BOTH_SPECIFIER:
+            if (_kaldi_io.classify_wxfilename(scp)
+                    != _kaldi_io.OutputType.FILE_OUTPUT):
+                raise ValueError("Only archives with script files written to "
+                                 "regular files can be indexed, wspecifier: "
+                                 "{}".format(wspecifier))
+            self._index_files = ark, scp, False
+            return wspecifier
+        if "," in ark:
+            raise ValueError("Archive filename can not contain commas if an "
+                             "index is written, wspecifier: {}"
+                             .format(wspecifier))
+        fd, scp = _tempfile.mkstemp(suffix=".scp",
+                                    dir=_os.path.dirname(ark) or None)
+        _os.close(fd)
+        self._index_files = ark, scp, True
+        flags = ["b" if opts.binary else "t", "f" if opts.flush else "nf"]
+        if opts.permissive:
+            flags.append("p")
+        return "{},ark,scp:{},{}".format(",".join(flags), ark, scp)
+
+    def _finish_index(self, write=True):
+        """Writes the archive index if one was requested."""
+        if self._index_files is None:
+            return
+        ark, scp, temporary = self._index_files
+        self._index_files = None
+        try:
+            if write:
+                ArchiveIndex.from_script(ark, scp).write(ark + ".idx")
+        finally:
+            if temporary:
+                _os.remove(scp)
+
+    def _direct_archive(self, wspecifier):
+        """Returns the archive to write values to directly, if any.
+
+        Values are written directly only to binary archives without script
+        files. Other tables are written with the C++ table writer.
+        """
+        if not self._write_directly or self._pipe is not None:
+            return None
+        wtype, ark, _, opts = classify_wspecifier(wspecifier)
+        if wtype != WspecifierType.ARCHIVE_SPECIFIER or not opts.binary:
+            return None
+        self._flush_output = opts.flush
+        return ark
+
+    def _write_entry(self, key, value):
+        """Writes an entry with the C++ table writer or directly."""
+        if self._output is None:
+            super(_WriterBase, self).write(key, value)
+            return
+        if key.split() != [key]:
+            raise ValueError("Invalid table key: {!r}".format(key))
+        # Archive entries are the key, a space and the binary object.
+        self._output.write((key + " ").encode())
+        self._output.write(b"\0B")
+        value.write(self._output.stream(), True)
+        if not self._output.stream().good():
+            raise IOError("Error writing table entry with key: {}"
+                          .format(key))
+        if self._flush_output:
+            self._output.flush()
+
     def open(self, wspecifier):
         """Opens the table for writing.
 
@@ -732,12 +1511,54 @@ class _WriterBase(object):
 
         Raises:
             IOError: If opening the table for writing fails.
+            ValueError: If an index should be written and the archive can not
+                be indexed.
         """
-        return super(_WriterBase, self).open(wspecifier)
+        self._stop_async_write()
+        if self._output is not None:
+            output, self._output = self._output, None
+            output.close()
+        if self.write_index:
+            wspecifier = self._prepare_index(wspecifier)
+        try:
+            wspecifier, self._pipe = _open_compressed_wspecifier(
+                wspecifier, self.compression)
+        except Exception:
+            self._finish_index(write=False)
+            raise
+        ark = self._direct_archive(wspecifier)
+        if ark is not None:
+            try:
+                self._output = _util_io.Output(ark, binary=True,
+                                               write_header=False)
+                success = True
+            except IOError:
+                success = False
+        else:
+            success = super(_WriterBase, self).open(wspecifier)
+        if not success:
+            self._finish_index(write=False)
+            _close_pipe(self)
+        elif self.async_write > 0:
+            self._start_async_write()
+        return success
 
     def flush(self):
-        """Flushes the table contents to disk/pipe."""
-        super(_WriterBase, self).flush()
+        """Flushes the table contents to disk/pipe.
+
+        If entries are written on a background thread, this waits until the
+        queued entries are written.
+
+        Raises:
+            Exception: The error raised while writing a queued entry, if any.
+        """
+        if self._write_queue is not None:
+            self._write_queue.join()
+            self._raise_write_error()
+        if self._output is not None:
+            self._output.flush()
+        else:
+            super(_WriterBase, self).flush()
 
     def write(self, key, value):
         """Writes the `(key, value)` pair to the table.
@@ -748,8 +1569,15 @@ class _WriterBase(object):
         Args:
             key (str): The key.
             value: The value.
+
+        Raises:
+            Exception: The error raised while writing a queued entry, if any.
         """
-        super(_WriterBase, self).write(key, value)
+        if self._write_queue is not None:
+            self._raise_write_error()
+            self._write_queue.put((key, value))
+        else:
+            self._write_entry(key, value)
 
     def is_open(self):
         """Indicates whether the table writer is open or not.
@@ -760,6 +1588,8 @@ class _WriterBase(object):
         Returns:
           True if the table writer is open, False otherwise.
         """
+        if self._output is not None:
+            return True
         return super(_WriterBase, self).is_open()
 
     def close(self):
@@ -768,78 +1598,145 @@ class _WriterBase(object):
         This method is provided for compatibility with the C++ API only;
         most users should use the Pythonic API.
 
+        If entries are written on a background thread, this waits until the
+        queued entries are written.
+
         Returns:
             True if table is closed successfully, False otherwise.
+
+        Raises:
+            Exception: The error raised while writing a queued entry, if any.
         """
-        return super(_WriterBase, self).close()
+        self._stop_async_write()
+        if self._output is not None:
+            output, self._output = self._output, None
+            success = output.close()
+        else:
+            success = super(_WriterBase, self).close()
+        _close_pipe(self)
+        self._finish_index(write=self._write_error is None)
+        self._raise_write_error()
+        return success
 
 
 class VectorWriter(_WriterBase, _kaldi_table.VectorWriter):
     """Table writer for single precision vectors."""
+    _write_directly = True
+
     def write(self, key, value):
         """Writes the `(key, value)` pair to the table.
 
         This method is provided for compatibility with the C++ API only;
         most users should use the Pythonic API.
 
-        Overrides write to accept both Vector and SubVector.
+        Overrides write to accept Vector, SubVector and other vector
+        like objects, e.g. NumPy arrays. If the table is a binary
+        archive without a script file, values are written directly to
+        the archive, wrapping NumPy arrays in a SubVector first.
+        Otherwise, values other than Vector are copied into a new
+        Vector first since the underlying C++ table writer can only
+        write Vector objects.
 
         Args:
             key (str): The key.
             value: The value.
         """
-        super(VectorWriter, self).write(key, _matrix.Vector(value))
+        if self._output is not None:
+            if not isinstance(value, _matrix._kaldi_vector.VectorBase):
+                value = _matrix.SubVector(value)
+        elif not isinstance(value, _matrix.Vector):
+            value = _matrix.Vector(value)
+        super(VectorWriter, self).write(key, value)
 
 
 class DoubleVectorWriter(_WriterBase, _kaldi_table.DoubleVectorWriter):
     """Table writer for double precision vectors."""
+    _write_directly = True
+
     def write(self, key, value):
         """Writes the `(key, value)` pair to the table.
 
         This method is provided for compatibility with the C++ API only;
         most users should use the Pythonic API.
 
-        Overrides write to accept both DoubleVector and DoubleSubVector.
+        Overrides write to accept DoubleVector, DoubleSubVector and other vector
+        like objects, e.g. NumPy arrays. If the table is a binary
+        archive without a script file, values are written directly to
+        the archive, wrapping NumPy arrays in a DoubleSubVector first.
+        Otherwise, values other than DoubleVector are copied into a new
+        DoubleVector first since the underlying C++ table writer can only
+        write DoubleVector objects.
 
         Args:
             key (str): The key.
             value: The value.
         """
-        super(DoubleVectorWriter, self).write(key, _matrix.DoubleVector(value))
+        if self._output is not None:
+            if not isinstance(value, _matrix._kaldi_vector.DoubleVectorBase):
+                value = _matrix.DoubleSubVector(value)
+        elif not isinstance(value, _matrix.DoubleVector):
+            value = _matrix.DoubleVector(value)
+        super(DoubleVectorWriter, self).write(key, value)
 
 
 class MatrixWriter(_WriterBase, _kaldi_table.MatrixWriter):
     """Table writer for single precision matrices."""
+    _write_directly = True
+
     def write(self, key, value):
         """Writes the `(key, value)` pair to the table.
 
         This method is provided for compatibility with the C++ API only;
         most users should use the Pythonic API.
 
-        Overrides write to accept both Matrix and SubMatrix.
+        Overrides write to accept Matrix, SubMatrix and other matrix
+        like objects, e.g. NumPy arrays. If the table is a binary
+        archive without a script file, values are written directly to
+        the archive, wrapping NumPy arrays in a SubMatrix first.
+        Otherwise, values other than Matrix are copied into a new
+        Matrix first since the underlying C++ table writer can only
+        write Matrix objects.
 
         Args:
             key (str): The key.
             value: The value.
         """
-        super(MatrixWriter, self).write(key, _matrix.Matrix(value))
+        if self._output is not None:
+            if not isinstance(value, _matrix._kaldi_matrix.MatrixBase):
+                value = _matrix.SubMatrix(value)
+        elif not isinstance(value, _matrix.Matrix):
+            value = _matrix.Matrix(value)
+        super(MatrixWriter, self).write(key, value)
 
 
 class DoubleMatrixWriter(_WriterBase, _kaldi_table.DoubleMatrixWriter):
     """Table writer for double precision matrices."""
+    _write_directly = True
+
     def write(self, key, value):
         """Writes the `(key, value)` pair to the table.
 
         This method is provided for compatibility with the C++ API only;
         most users should use the Pythonic API.
 
-        Overrides write to accept both DoubleMatrix and DoubleSubMatrix.
+        Overrides write to accept DoubleMatrix, DoubleSubMatrix and other matrix
+        like objects, e.g. NumPy arrays. If the table is a binary
+        archive without a script file, values are written directly to
+        the archive, wrapping NumPy arrays in a DoubleSubMatrix first.
+        Otherwise, values other than DoubleMatrix are copied into a new
+        DoubleMatrix first since the underlying C++ table writer can only
+        write DoubleMatrix objects.
 
         Args:
             key (str): The key.
             value: The value.
         """
-        super(DoubleMatrixWriter, self).write(key, _matrix.DoubleMatrix(value))
+        if self._output is not None:
+            if not isinstance(value, _matrix._kaldi_matrix.DoubleMatrixBase):
+                value = _matrix.DoubleSubMatrix(value)
+        elif not isinstance(value, _matrix.DoubleMatrix):
+            value = _matrix.DoubleMatrix(value)
+        super(DoubleMatrixWriter, self).write(key, value)
 
       
 class CompressedMatrixWriter(_WriterBase, _kaldi_table.CompressedMatrixWriter):
@@ -953,6 +1850,613 @@ class FloatPairVectorWriter(_WriterBase, _kaldi_table.FloatPairVectorWriter):
     """Table writer for sequences of single precision float pairs."""
     pass
 
+################################################################################
+# Memory-mapped Archives
+################################################################################
+
+_MATRIX_DTYPES = {b"FM": _numpy.float32, b"DM": _numpy.float64}
+_COMPRESSED_MATRIX_TOKENS = frozenset([b"CM", b"CM2", b"CM3"])
+
+
+def _read_int32(buf, pos):
+    """Reads a binary Kaldi int32 starting at byte offset `pos`."""
+    size, value = _struct.unpack_from("<bi", buf, pos)
+    if size != 4:
+        raise ValueError("Expected int32 at byte offset {}.".format(pos))
+    return value
+
+
+def _read_matrix_header(buf, pos):
+    """Reads the header of a binary matrix starting at byte offset `pos`.
+
+    Returns:
+        A tuple `(entry, end)` where `entry` is a tuple `(token, offset,
+        num_rows, num_cols, min_value, range)` describing the matrix and `end`
+        is the byte offset of the end of the matrix. `offset` is the byte
+        offset of the matrix data. `min_value` and `range` are the global
+        header values of compressed matrices and ``None`` for others.
+    """
+    end = buf.find(b" ", pos, pos + 4)
+    if end < 0:
+        raise ValueError("Expected matrix token at byte offset {}."
+                         .format(pos))
+    token = buf[pos:end]
+    pos = end + 1
+    if token in _MATRIX_DTYPES:
+        num_rows = _read_int32(buf, pos)
+        num_cols = _read_int32(buf, pos + 5)
+        pos += 10
+        min_value, range_ = None, None
+        size = (num_rows * num_cols *
+                _numpy.dtype(_MATRIX_DTYPES[token]).itemsize)
+    elif token in _COMPRESSED_MATRIX_TOKENS:
+        min_value, range_, num_rows, num_cols = _struct.unpack_from(
+            "<ffii", buf, pos)
+        pos += 16
+        if token == b"CM":
+            size = num_cols * 8 + num_rows * num_cols
+        elif token == b"CM2":
+            size = num_rows * num_cols * 2
+        else:
+            size = num_rows * num_cols
+    else:
+        raise ValueError("Unsupported object type {!r} at byte offset {}."
+                         .format(token.decode(errors="replace"), pos))
+    if num_rows < 0 or num_cols < 0 or pos + size > len(buf):
+        raise ValueError("Truncated or corrupted matrix at byte offset {}."
+                         .format(pos))
+    return (token, pos, num_rows, num_cols, min_value, range_), pos + size
+
+
+def _decompress_matrix(buf, entry, row_start=0, row_end=None):
+    """Decompresses rows of a compressed matrix into a new float32 array.
+
+    This follows the decompression in Kaldi's CompressedMatrix::CopyToMat.
+    Only the rows in `[row_start, row_end)` are decompressed.
+    """
+    token, offset, num_rows, num_cols, min_value, range_ = entry
+    min_value = _numpy.float32(min_value)
+    range_ = _numpy.float32(range_)
+    rows = slice(row_start, row_end)
+    if token == b"CM2":
+        data = _numpy.frombuffer(buf, _numpy.uint16, num_rows * num_cols,
+                                 offset).reshape(num_rows, num_cols)[rows]
+        scale = range_ * _numpy.float32(1.52590218966964e-05)
+        return min_value + scale * data.astype(_numpy.float32)
+    if token == b"CM3":
+        data = _numpy.frombuffer(buf, _numpy.uint8, num_rows * num_cols,
+                                 offset).reshape(num_rows, num_cols)[rows]
+        scale = range_ * _numpy.float32(1.0 / 255.0)
+        return min_value + scale * data.astype(_numpy.float32)
+    # Column-wise compression with per-column percentile headers.
+    headers = _numpy.frombuffer(buf, _numpy.uint16, num_cols * 4,
+                                offset).reshape(num_cols, 4)
+    headers = (min_value + range_ * _numpy.float32(1.52590218966964e-05)
+               * headers.astype(_numpy.float32))
+    p0, p25, p75, p100 = (headers[:, i:i+1] for i in range(4))
+    data = _numpy.frombuffer(buf, _numpy.uint8, num_rows * num_cols,
+                             offset + num_cols * 8).reshape(num_cols, num_rows)
+    data = data[:, rows]
+    values = data.astype(_numpy.float32)
+    mat = _numpy.where(
+        data <= 64, p0 + (p25 - p0) * values * _numpy.float32(1 / 64.0),
+        _numpy.where(
+            data <= 192,
+            p25 + (p75 - p25) * (values - 64) * _numpy.float32(1 / 128.0),
+            p75 + (p100 - p75) * (values - 192) * _numpy.float32(1 / 63.0)))
+    return _numpy.ascontiguousarray(mat.T, dtype=_numpy.float32)
+
+
+class MmapMatrixArchive(object):
+    """Read-only memory-mapped random access to a binary matrix archive.
+
+    This class indexes the entries of a binary archive of single or double
+    precision matrices (e.g. written by a :class:`MatrixWriter` or Kaldi's
+    `copy-feats`) once, memory-maps the archive and provides access to the
+    matrices by key or by integer position in the archive. It implements the
+    `__getitem__` method to provide a dictionary-like interface, e.g.
+    `archive[key]` or `archive[0]`. Iterating over the archive returns the
+    `(key, value)` pairs in archive order.
+
+    Uncompressed matrices are returned as views into the memory-mapped file,
+    i.e. no copy is made. The archive is mapped copy-on-write. Hence multiple
+    processes mapping the same archive, e.g. data loader worker processes,
+    share a single copy of it in the page cache, and modifying a returned
+    view only modifies the private copy of the pages of the calling process.
+    Since Kaldi matrix views require memory aligned to the element size,
+    :class:`SubMatrix` values are copies if the matrix data is not aligned in
+    the archive; arrays returned by :meth:`numpy` are views in any case.
+
+    Compressed matrices (e.g. written by `copy-feats --compress=true`) are
+    indexed using their headers and decompressed on access.
+
+    Only binary archives stored in regular files are supported, i.e. there is
+    no support for text mode archives, pipes or script files.
+
+    Instances can be pickled, e.g. to pass them to worker processes. The
+    archive is reopened without indexing it again when unpickling.
+
+    Args:
+        filename (str): The archive file.
+
+    Raises:
+        IOError: If opening the archive fails.
+        ValueError: If the archive contains entries that are not binary
+            matrices or it is corrupted.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._open()
+        self._keys, self._entries = [], []
+        self._scan()
+        self._index = {key: i for i, key in enumerate(self._keys)}
+
+    def __getstate__(self):
+        return {"filename": self.filename, "_keys": self._keys,
+                "_entries": self._entries}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._open()
+        self._index = {key: i for i, key in enumerate(self._keys)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        for i, key in enumerate(self._keys):
+            yield key, self[i]
+
+    def __getitem__(self, key):
+        token = self._entry(key)[0]
+        array = self.numpy(key)
+        if not array.flags.aligned:
+            array = array.copy()
+        if token == b"DM":
+            return _matrix.DoubleSubMatrix(array)
+        return _matrix.SubMatrix(array)
+
+    def _open(self):
+        """Memory-maps the archive file."""
+        with open(self.filename, "rb") as f:
+            # Empty files can not be mapped.
+            if _os.fstat(f.fileno()).st_size:
+                self._buf = _mmap.mmap(f.fileno(), 0,
+                                       access=_mmap.ACCESS_COPY)
+            else:
+                self._buf = b""
+
+    def _scan(self):
+        """Indexes the entries of the archive."""
+        buf = self._buf
+        pos, size = 0, len(buf)
+        while pos < size:
+            end = buf.find(b" ", pos)
+            if end < 0:
+                raise ValueError("Expected key at byte offset {} of archive "
+                                 "{}.".format(pos, self.filename))
+            key = buf[pos:end].decode()
+            if buf[end+1:end+3] != b"\0B":
+                raise ValueError("Entry with key {} in archive {} is not in "
+                                 "binary mode.".format(key, self.filename))
+            entry, pos = _read_matrix_header(buf, end + 3)
+            self._keys.append(key)
+            self._entries.append(entry)
+
+    def _entry(self, key):
+        """Returns the index entry for a key or an integer position."""
+        if isinstance(key, str):
+            try:
+                return self._entries[self._index[key]]
+            except KeyError:
+                raise KeyError(key)
+        return self._entries[key]
+
+    def keys(self):
+        """Returns the keys in archive order."""
+        return list(self._keys)
+
+    def shape(self, key):
+        """Returns the shape of a matrix without reading its data.
+
+        Args:
+            key (str or int): The key or the integer position of the matrix.
+
+        Returns:
+            Tuple[int, int]: The number of rows and columns.
+        """
+        entry = self._entry(key)
+        return entry[2], entry[3]
+
+    def numpy(self, key, row_start=0, row_end=None):
+        """Returns a matrix, or a range of its rows, as a NumPy array.
+
+        Uncompressed matrices are returned as views into the memory-mapped
+        file. Compressed matrices are decompressed into new float32 arrays.
+        Only the requested rows of compressed matrices are decompressed.
+
+        Args:
+            key (str or int): The key or the integer position of the matrix.
+            row_start (int): Index of the first row.
+            row_end (int): Index past the last row. If ``None``, rows are
+                returned until the end of the matrix.
+
+        Returns:
+            numpy.ndarray: The matrix.
+
+        Raises:
+            KeyError: If the key is not in the archive.
+            IndexError: If the position or the row range is out of range.
+        """
+        entry = self._entry(key)
+        token, offset, num_rows, num_cols = entry[:4]
+        if row_end is None:
+            row_end = num_rows
+        if not 0 <= row_start <= row_end <= num_rows:
+            raise IndexError("Row range [{}, {}) is out of bounds for a "
+                             "matrix with {} rows.".format(row_start, row_end,
+                                                          num_rows))
+        if token in _MATRIX_DTYPES:
+            return _numpy.frombuffer(
+                self._buf, _MATRIX_DTYPES[token], num_rows * num_cols,
+                offset).reshape(num_rows, num_cols)[row_start:row_end]
+        return _decompress_matrix(self._buf, entry, row_start, row_end)
+
+    def close(self):
+        """Closes the archive.
+
+        The memory mapping is released once all views into it are deleted.
+        """
+        self._buf = b""
+
+################################################################################
+# Archive Indexes
+################################################################################
+
+_INDEX_MAGIC = b"KALDIIDX"
+_INDEX_VERSION = 1
+_INDEX_DTYPE = _numpy.dtype([("offset", "<i8"), ("size", "<i8"),
+                             ("type", "S8")])
+_VECTOR_DTYPES = {b"FV": _numpy.float32, b"DV": _numpy.float64}
+
+
+def _object_type(buf, offset):
+    """Returns the type token of a binary Kaldi object, or an empty string."""
+    if buf[offset:offset+2] != b"\0B":
+        return b""
+    end = buf.find(b" ", offset + 2, offset + 11)
+    if end < 0:
+        return b""
+    token = buf[offset+2:end]
+    return token if token.isalnum() else b""
+
+
+class ArchiveIndex(object):
+    """Offset index of an archive file.
+
+    The index maps each key in the archive to the byte offset of its object
+    (the offset used in script files, e.g. `foo.ark:1234`), the size of the
+    object in bytes and the type of the object. The object type is the Kaldi
+    token at the start of binary objects, e.g. "FM" for single precision
+    matrices or "CM" for compressed matrices, and an empty string if the
+    object does not start with a token, e.g. in text mode archives.
+
+    Indexes are stored in sidecar files, by convention named after the
+    archive, e.g. `foo.ark.idx` for `foo.ark`. These files are binary, hence
+    they load much faster than script files with the same information. Table
+    writers can write an index while writing an archive (see the
+    `write_index` argument of table writers). Indexes of existing archives
+    can be built from script files with :meth:`from_script` or by scanning
+    archives with :meth:`scan`.
+
+    Index files start with the magic string `KALDIIDX` followed by the
+    version and the number of entries as little endian uint32 and uint64.
+    Then come the entries as `(offset, size, type)` records of two little
+    endian int64 values and an 8 byte type, and finally the newline separated
+    UTF-8 encoded keys.
+
+    Args:
+        keys (List[str]): The keys in archive order.
+        entries (numpy.ndarray): A structured array with the fields "offset",
+            "size" and "type" holding the entries for the keys.
+    """
+    def __init__(self, keys, entries):
+        if len(keys) != len(entries):
+            raise ValueError("keys and entries should have the same length.")
+        self.keys = keys
+        self.entries = entries
+        self._positions = {key: i for i, key in enumerate(keys)}
+
+    @classmethod
+    def from_script(cls, archive_filename, script_rxfilename):
+        """Builds the index of an archive from a script file.
+
+        Each entry in the script file should point into the archive, e.g.
+        `key foo.ark:1234`, as in the script files written with `ark,scp`
+        wspecifiers.
+
+        Args:
+            archive_filename (str): The archive file.
+            script_rxfilename (str): Extended filename for reading the script
+                file.
+
+        Returns:
+            ArchiveIndex: The index.
+
+        Raises:
+            IOError: If reading the script file fails.
+            ValueError: If the script file has entries that do not point
+                into the archive.
+        """
+        try:
+            script = read_script_file(script_rxfilename, True)
+        except ValueError:
+            raise IOError("Error reading script file: {}"
+                          .format(script_rxfilename))
+        keys, offsets = [], []
+        for key, rxfilename in script:
+            filename, _, offset = rxfilename.rpartition(":")
+            if filename != archive_filename or not offset.isdigit():
+                raise ValueError("Script entry {} {} does not point into "
+                                 "archive {}.".format(key, rxfilename,
+                                                      archive_filename))
+            keys.append(key)
+            offsets.append(int(offset))
+        order = sorted(range(len(keys)), key=offsets.__getitem__)
+        keys = [keys[i] for i in order]
+        entries = _numpy.zeros(len(keys), _INDEX_DTYPE)
+        entries["offset"] = [offsets[i] for i in order]
+        with open(archive_filename, "rb") as f:
+            size = _os.fstat(f.fileno()).st_size
+            buf = (_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+                   if size else b"")
+        # Objects end where the next key starts.
+        for i, key in enumerate(keys):
+            offset = int(entries["offset"][i])
+            if i + 1 < len(keys):
+                end = (int(entries["offset"][i + 1])
+                       - len(keys[i + 1].encode()) - 1)
+            else:
+                end = size
+            entries["size"][i] = end - offset
+            entries["type"][i] = _object_type(buf, offset)
+        return cls(keys, entries)
+
+    @classmethod
+    def scan(cls, archive_filename):
+        """Builds the index of an archive by scanning it.
+
+        Scanning is supported only for binary archives of single or double
+        precision vectors and matrices, including compressed matrices. Use
+        :meth:`from_script` to index archives of other types.
+
+        Args:
+            archive_filename (str): The archive file.
+
+        Returns:
+            ArchiveIndex: The index.
+
+        Raises:
+            ValueError: If the archive contains entries that are not binary
+                vectors or matrices or it is corrupted.
+        """
+        with open(archive_filename, "rb") as f:
+            size = _os.fstat(f.fileno()).st_size
+            buf = (_mmap.mmap(f.fileno(), 0, access=_mmap.ACCESS_READ)
+                   if size else b"")
+        keys, records = [], []
+        pos = 0
+        while pos < size:
+            end = buf.find(b" ", pos)
+            if end < 0:
+                raise ValueError("Expected key at byte offset {} of archive "
+                                 "{}.".format(pos, archive_filename))
+            key = buf[pos:end].decode()
+            offset = end + 1
+            token = _object_type(buf, offset)
+            if token in _VECTOR_DTYPES:
+                dim = _read_int32(buf, offset + len(token) + 3)
+                pos = (offset + len(token) + 8 +
+                       dim * _numpy.dtype(_VECTOR_DTYPES[token]).itemsize)
+                if dim < 0 or pos > size:
+                    raise ValueError("Truncated or corrupted vector at byte "
+                                     "offset {}.".format(offset))
+            elif token in _MATRIX_DTYPES or token in _COMPRESSED_MATRIX_TOKENS:
+                _, pos = _read_matrix_header(buf, offset + 2)
+            else:
+                raise ValueError("Entry with key {} in archive {} is not a "
+                                 "binary vector or matrix."
+                                 .format(key, archive_filename))
+            keys.append(key)
+            records.append((offset, pos - offset, token))
+        return cls(keys, _numpy.array(records, _INDEX_DTYPE))
+
+    @classmethod
+    def read(cls, filename):
+        """Reads an index file.
+
+        Args:
+            filename (str): The index file.
+
+        Returns:
+            ArchiveIndex: The index.
+
+        Raises:
+            ValueError: If the file is not a valid index file.
+        """
+        with open(filename, "rb") as f:
+            header = f.read(20)
+            if len(header) != 20 or header[:8] != _INDEX_MAGIC:
+                raise ValueError("Not an archive index file: {}"
+                                 .format(filename))
+            version, num_entries = _struct.unpack("<IQ", header[8:])
+            if version != _INDEX_VERSION:
+                raise ValueError("Unsupported archive index version {}: {}"
+                                 .format(version, filename))
+            entries = _numpy.fromfile(f, _INDEX_DTYPE, num_entries)
+            if len(entries) != num_entries:
+                raise ValueError("Truncated archive index file: {}"
+                                 .format(filename))
+            keys = f.read().decode().split("\n") if num_entries else []
+        return cls(keys, entries)
+
+    def write(self, filename):
+        """Writes the index to a file.
+
+        Args:
+            filename (str): The index file.
+        """
+        with open(filename, "wb") as f:
+            f.write(_INDEX_MAGIC)
+            f.write(_struct.pack("<IQ", _INDEX_VERSION, len(self.keys)))
+            f.write(self.entries.astype(_INDEX_DTYPE, copy=False).tobytes())
+            f.write("\n".join(self.keys).encode())
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def position(self, key):
+        """Returns the position of a key in the archive.
+
+        Raises:
+            KeyError: If the key is not in the index.
+        """
+        return self._positions[key]
+
+    def lookup(self, key):
+        """Returns the `(offset, size, type)` entry for a key.
+
+        Raises:
+            KeyError: If the key is not in the index.
+        """
+        offset, size, type_ = self.entries[self._positions[key]]
+        return int(offset), int(size), type_.decode()
+
+
+class IndexedArchiveReader(object):
+    """Random access table reader using an archive offset index.
+
+    This reader looks up keys in an :class:`ArchiveIndex` and reads the
+    values directly from their offsets in the archive. Hence it does not need
+    a script file or to scan the archive, and lookups take constant time
+    regardless of the size of the archive or the order of the keys. It
+    implements the `__getitem__` method to provide a dictionary-like interface
+    for looking up table entries, e.g. `reader[key]` returns the `value`
+    associated with the `key`.
+
+    Entries can also be read sequentially, starting at any position in the
+    archive, with :meth:`read_range`. Combined with :meth:`split`, this allows
+    reading huge archives in parallel, e.g. in multiple threads or processes.
+
+    This reader can be used from multiple threads at the same time.
+
+    Args:
+        reader_type (type): The sequential table reader type for reading
+            values, e.g. :class:`SequentialMatrixReader`.
+        archive_filename (str): The archive file.
+        index (ArchiveIndex or str): The index or the index file. If ``None``,
+            the index is read from the file named after the archive, e.g.
+            `foo.ark.idx` for `foo.ark`.
+
+    Raises:
+        ValueError: If the index file is not valid.
+    """
+    def __init__(self, reader_type, archive_filename, index=None):
+        self.reader_type = reader_type
+        self.archive_filename = archive_filename
+        if index is None:
+            index = archive_filename + ".idx"
+        if not isinstance(index, ArchiveIndex):
+            index = ArchiveIndex.read(index)
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise TypeError("key should be a string")
+        position = self.index.position(key)
+        entries = self.read_range(position, position + 1)
+        try:
+            return next(entries)[1]
+        finally:
+            entries.close()
+
+    def keys(self):
+        """Returns the keys in archive order."""
+        return list(self.index.keys)
+
+    def read_range(self, start=0, stop=None):
+        """Reads entries in a range of positions in the archive.
+
+        Args:
+            start (int): The position of the first entry.
+            stop (int): The position after the last entry. If ``None``, the
+                archive is read until the end.
+
+        Yields:
+            `(key, value)` pairs in archive order.
+
+        Raises:
+            IOError: If reading the archive fails.
+            ValueError: If the archive does not match the index.
+        """
+        if stop is None or stop > len(self.index):
+            stop = len(self.index)
+        if start >= stop:
+            return
+        keys = self.index.keys
+        offset = int(self.index.entries["offset"][start])
+        # Sequential readers expect to start reading at the key.
+        offset -= len(keys[start].encode()) + 1
+        rspecifier = "ark:{}:{}".format(self.archive_filename, offset)
+        with self.reader_type(rspecifier) as reader:
+            for position in range(start, stop):
+                if reader.done() or reader.key() != keys[position]:
+                    raise ValueError("Archive {} does not match its index at "
+                                     "key {}.".format(self.archive_filename,
+                                                      keys[position]))
+                yield keys[position], reader.value()
+                reader.next()
+
+    def split(self, num_parts):
+        """Splits the archive into ranges of roughly equal size in bytes.
+
+        Args:
+            num_parts (int): The number of ranges.
+
+        Returns:
+            List[Tuple[int, int]]: Non-empty `(start, stop)` ranges of
+            positions covering the archive, suitable for :meth:`read_range`.
+        """
+        if num_parts < 1:
+            raise ValueError("num_parts should be positive.")
+        ends = _numpy.cumsum(self.index.entries["size"])
+        if not len(ends):
+            return []
+        targets = ends[-1] * _numpy.arange(1, num_parts) / num_parts
+        bounds = [0] + list(_numpy.minimum(
+            _numpy.searchsorted(ends, targets) + 1, len(ends)))
+        bounds.append(len(ends))
+        return [(int(start), int(stop)) for start, stop
+                in zip(bounds[:-1], bounds[1:]) if start < stop]
+
 ################################################################################
 
 __all__ = [name for name in dir()
@@ -457,4 +457,4 @@ packages = find_packages(exclude=["tests.*", "tests"])
 
 setup(name='pykaldi', version='0.1.2', description='A Python wrapper for Kaldi', author='Dogan Can, Victor Martinez', ext_modules=extensions,
       cmdclass={'build': build, 'build_ext': build_ext, 'build_sphinx': build_sphinx, 'install_lib': install_lib, 'test_cuda': test_cuda, }, packages=packages, package_data={},
-      install_requires=['numpy', 'pyparsing'], setup_requires=['pytest-runner'], tests_require=['pytest'], zip_safe=False, test_suite='tests')
+      install_requires=['numpy', 'pyparsing'], extras_require={'zstd': ['zstandard']}, setup_requires=['pytest-runner'], tests_require=['pytest'], zip_safe=False, test_suite='tests')
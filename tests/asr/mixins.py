@@ -0,0 +1,92 @@
+import numpy as np
+
+from kaldi.base.io import istringstream
+from kaldi.fstext import StdArc, StdVectorFst, TropicalWeight
+from kaldi.hmm import HmmTopology, TransitionModel
+from kaldi.nnet3 import AmNnetSimple, Nnet
+from kaldi.online2 import (OnlineNnetFeaturePipelineConfig,
+                           OnlineNnetFeaturePipelineInfo)
+from kaldi.tree import monophone_context_dependency
+from kaldi.util.io import xopen
+
+################################################################################################################
+# Small models for testing recognizers
+################################################################################################################
+
+# MFCC features with default options
+FEAT_DIM = 13
+SAMP_FREQ = 16000.0
+
+_TOPOLOGY = """<Topology>
+<TopologyEntry>
+<ForPhones> 1 2 </ForPhones>
+<State> 0 <PdfClass> 0 <Transition> 0 0.5 <Transition> 1 0.5 </State>
+<State> 1 </State>
+</TopologyEntry>
+</Topology>
+"""
+
+# Single TDNN layer with one frame of left and right context
+_NNET_CONFIG = """input-node name=input dim={feat_dim}
+component name=affine type=AffineComponent input-dim={input_dim} output-dim={num_pdfs} param-stddev=0.1 bias-stddev=0.1
+component-node name=affine component=affine input=Append(Offset(input, -1), input, Offset(input, 1))
+component name=log-softmax type=LogSoftmaxComponent dim={num_pdfs}
+component-node name=log-softmax component=log-softmax input=affine
+output-node name=output input=log-softmax objective=linear
+"""
+
+
+def make_transition_model():
+    """Monophone transition model with two single-state phones."""
+    topo = HmmTopology()
+    topo.read(istringstream.from_str(_TOPOLOGY), False)
+    ctx_dep = monophone_context_dependency(
+        topo.get_phones(), topo.get_phone_to_num_pdf_classes())
+    return TransitionModel.from_topo(ctx_dep, topo)
+
+
+def make_acoustic_model(num_pdfs):
+    """Randomly initialized nnet3 acoustic model."""
+    nnet = Nnet()
+    nnet.read_config(istringstream.from_str(_NNET_CONFIG.format(
+        feat_dim=FEAT_DIM, input_dim=3 * FEAT_DIM, num_pdfs=num_pdfs)))
+    return AmNnetSimple.from_nnet(nnet)
+
+
+def write_model(filename):
+    """Writes a transition model and an nnet3 acoustic model."""
+    transition_model = make_transition_model()
+    acoustic_model = make_acoustic_model(transition_model.num_pdfs())
+    with xopen(filename, "w") as ko:
+        transition_model.write(ko.stream(), True)
+        acoustic_model.write(ko.stream(), True)
+    return transition_model
+
+
+def write_graph(transition_model, filename):
+    """Writes a single state graph looping over all transition ids.
+
+    Output labels are the phones of the transition ids.
+    """
+    fst = StdVectorFst()
+    state = fst.add_state()
+    fst.set_start(state)
+    for tid in range(1, transition_model.num_transition_ids() + 1):
+        phone = transition_model.transition_id_to_phone(tid)
+        fst.add_arc(state, StdArc(tid, phone, TropicalWeight.one(), state))
+    fst.set_final(state)
+    fst.write(filename)
+
+
+def make_feature_info():
+    """Online feature pipeline info for MFCC features with default options."""
+    config = OnlineNnetFeaturePipelineConfig()
+    config.feature_type = "mfcc"
+    return OnlineNnetFeaturePipelineInfo.from_config(config)
+
+
+def random_waves(num_waves, random, min_seconds=0.5, max_seconds=1.5):
+    """Random waveforms of different lengths."""
+    return [np.asarray(1000.0 * random.randn(int(SAMP_FREQ * seconds)),
+                       dtype=np.float32)
+            for seconds in np.linspace(min_seconds, max_seconds, num_waves)]
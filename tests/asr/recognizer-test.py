@@ -0,0 +1,491 @@
+import asyncio
+import os
+import threading
+import unittest
+
+import numpy as np
+
+from kaldi.asr import (AsyncOnlineSession, FasterRecognizer,
+                       LatticeBiglmFasterRecognizer, LatticeFasterRecognizer,
+                       NnetLatticeFasterBatchRecognizer,
+                       NnetLatticeFasterOnlineBatchRecognizer,
+                       NnetLatticeFasterOnlineRecognizer,
+                       NnetLatticeFasterRecognizer, NnetOnlineBatchScheduler,
+                       OnlineSession, RecognizerPool, TimingCollector,
+                       decode_sharded)
+from kaldi.decoder import (LatticeFasterDecoderOptions,
+                           LatticeFasterOnlineDecoder)
+from kaldi.fstext import (StdArc, StdVectorFst, TropicalWeight, equal,
+                          read_fst_kaldi)
+from kaldi.matrix import Matrix, Vector
+from kaldi.online2 import OnlineNnetFeaturePipeline
+from kaldi.util.table import MatrixWriter, SequentialCompactLatticeReader
+
+from .mixins import *
+
+
+def _loop_fst(num_labels):
+    """Single state FST with a self-loop for each label."""
+    fst = StdVectorFst()
+    state = fst.add_state()
+    fst.set_start(state)
+    for label in range(1, num_labels + 1):
+        fst.add_arc(state, StdArc(label, label, TropicalWeight.one(), state))
+    fst.set_final(state)
+    return fst
+
+
+class _TestDecodeBatch(object):
+
+    num_labels = 3
+
+    def setUp(self):
+        self.graph_filename = '/tmp/temp.graph.fst'
+        _loop_fst(self.num_labels).write(self.graph_filename)
+        random = np.random.RandomState(0)
+        self.inputs = [("utt{}".format(i),
+                        Matrix(random.randn(10 + i, self.num_labels)))
+                       for i in range(8)]
+
+    def tearDown(self):
+        if os.path.exists(self.graph_filename):
+            os.remove(self.graph_filename)
+
+    def testDecodeBatch(self):
+        recognizer = self.getRecognizer()
+        expected = [recognizer.decode(loglikes)["words"]
+                    for _, loglikes in self.inputs]
+        for num_threads in (1, 3):
+            results = list(recognizer.decode_batch(self.inputs, num_threads))
+            self.assertEqual([key for key, _ in self.inputs],
+                             [key for key, _ in results])
+            self.assertEqual(expected,
+                             [output["words"] for _, output in results])
+
+        # Decoders of the copies are reused in subsequent calls
+        results = list(recognizer.decode_batch(self.inputs, 2, ["words"]))
+        self.assertEqual(expected, [output["words"] for _, output in results])
+
+
+class TestFasterRecognizer(_TestDecodeBatch, unittest.TestCase):
+
+    def getRecognizer(self):
+        return FasterRecognizer.from_files(self.graph_filename)
+
+
+class TestLatticeBiglmFasterRecognizer(_TestDecodeBatch, unittest.TestCase):
+
+    def setUp(self):
+        super(TestLatticeBiglmFasterRecognizer, self).setUp()
+        self.lm_filename = '/tmp/temp.lm.fst'
+        _loop_fst(self.num_labels).write(self.lm_filename)
+
+    def tearDown(self):
+        super(TestLatticeBiglmFasterRecognizer, self).tearDown()
+        if os.path.exists(self.lm_filename):
+            os.remove(self.lm_filename)
+
+    def getRecognizer(self):
+        return LatticeBiglmFasterRecognizer.from_files(
+            self.graph_filename, self.lm_filename, self.lm_filename)
+
+
+class _RecordingTimingCollector(TimingCollector):
+    """Timing collector keeping the records it collects."""
+
+    def reset(self):
+        super(_RecordingTimingCollector, self).reset()
+        self.records = []
+
+    def collect(self, record):
+        super(_RecordingTimingCollector, self).collect(record)
+        self.records.append(record)
+
+
+class TestTimingCollector(unittest.TestCase):
+
+    num_labels = 3
+
+    def setUp(self):
+        self.graph_filename = '/tmp/temp.graph.fst'
+        self.lm_filename = '/tmp/temp.lm.fst'
+        _loop_fst(self.num_labels).write(self.graph_filename)
+        _loop_fst(self.num_labels).write(self.lm_filename)
+        random = np.random.RandomState(0)
+        self.inputs = [Matrix(random.randn(10 + i, self.num_labels))
+                       for i in range(3)]
+
+    def tearDown(self):
+        for filename in (self.graph_filename, self.lm_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def checkTiming(self, recognizer, has_lattice):
+        recognizer.timing = _RecordingTimingCollector()
+        for loglikes in self.inputs:
+            recognizer.decode(loglikes)
+
+        records = recognizer.timing.records
+        self.assertEqual([type(recognizer).__name__] * len(self.inputs),
+                         [record["recognizer"] for record in records])
+        self.assertEqual([loglikes.num_rows for loglikes in self.inputs],
+                         [record["num_frames"] for record in records])
+        for record in records:
+            self.assertEqual({"decodable", "search", "output", "determinize"},
+                             set(record["stages"]))
+            self.assertEqual(has_lattice,
+                             record["num_lattice_states"] is not None)
+
+        summary = recognizer.timing.as_dict()
+        num_frames = sum(loglikes.num_rows for loglikes in self.inputs)
+        self.assertEqual(len(self.inputs), summary["num_utterances"])
+        self.assertEqual(num_frames, summary["num_frames"])
+        self.assertAlmostEqual(num_frames * 0.01, summary["audio_seconds"])
+
+    def testFasterRecognizer(self):
+        self.checkTiming(FasterRecognizer.from_files(self.graph_filename),
+                         False)
+
+    def testLatticeBiglmFasterRecognizer(self):
+        self.checkTiming(LatticeBiglmFasterRecognizer.from_files(
+            self.graph_filename, self.lm_filename, self.lm_filename), True)
+
+
+class _CrashingRecognizer(LatticeFasterRecognizer):
+    """Recognizer killing the worker process decoding a given utterance."""
+
+    crash_frames = 13
+
+    def decode(self, input, outputs=None):
+        if input.num_rows == self.crash_frames:
+            os._exit(1)
+        return super(_CrashingRecognizer, self).decode(input, outputs)
+
+
+class TestDecodeSharded(unittest.TestCase):
+
+    num_labels = 3
+
+    def setUp(self):
+        self.graph_filename = '/tmp/temp.graph.fst'
+        _loop_fst(self.num_labels).write(self.graph_filename)
+        self.ark_filename = '/tmp/temp.loglikes.ark'
+        self.scp_filename = '/tmp/temp.loglikes.scp'
+        self.text_filename = '/tmp/temp.text'
+        self.lattice_filename = '/tmp/temp.lat.ark'
+        random = np.random.RandomState(0)
+        self.inputs = [("utt{}".format(i),
+                        Matrix(random.randn(10 + i, self.num_labels)))
+                       for i in range(7)]
+        with MatrixWriter('ark,scp:{},{}'.format(self.ark_filename,
+                                                 self.scp_filename)) as writer:
+            for key, loglikes in self.inputs:
+                writer[key] = loglikes
+
+    def tearDown(self):
+        for filename in (self.graph_filename, self.ark_filename,
+                         self.scp_filename, self.text_filename,
+                         self.lattice_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def testDecodeSharded(self):
+        recognizer = LatticeFasterRecognizer.from_files(self.graph_filename)
+        expected = [(key, recognizer.decode(loglikes))
+                    for key, loglikes in self.inputs]
+
+        stats = decode_sharded(recognizer, 'scp:' + self.scp_filename, 3,
+                               self.text_filename,
+                               'ark:' + self.lattice_filename)
+        self.assertEqual([0, 1, 2], [s["shard"] for s in stats])
+        self.assertEqual(len(self.inputs),
+                         sum(s["num_utterances"] for s in stats))
+
+        # Outputs of all shards are merged in script file order
+        with open(self.text_filename) as f:
+            self.assertEqual(["{} {}".format(key, output["text"])
+                              for key, output in expected],
+                             [line.rstrip("\n") for line in f])
+        with SequentialCompactLatticeReader(
+                'ark:' + self.lattice_filename) as reader:
+            lattices = [(key, lattice) for key, lattice in reader]
+        self.assertEqual([key for key, _ in expected],
+                         [key for key, _ in lattices])
+        for (_, output), (_, lattice) in zip(expected, lattices):
+            self.assertTrue(equal(output["lattice"], lattice))
+
+    def testWorkerCrash(self):
+        recognizer = _CrashingRecognizer.from_files(self.graph_filename)
+        with self.assertRaises(RuntimeError):
+            decode_sharded(recognizer, 'scp:' + self.scp_filename, 3,
+                           self.text_filename)
+
+
+class _TestNnet(object):
+
+    def setUp(self):
+        self.model_filename = '/tmp/temp.nnet.mdl'
+        self.graph_filename = '/tmp/temp.online.fst'
+        transition_model = write_model(self.model_filename)
+        write_graph(transition_model, self.graph_filename)
+        self.feature_info = make_feature_info()
+        self.waves = random_waves(3, np.random.RandomState(0))
+
+    def tearDown(self):
+        for filename in (self.model_filename, self.graph_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def decodeStream(self, recognizer, wave, chunk_size=1600):
+        """Decodes a wave chunk by chunk with advance_decoding."""
+        pipeline = OnlineNnetFeaturePipeline(self.feature_info)
+        recognizer.set_input_pipeline(pipeline)
+        recognizer.init_decoding()
+        for start in range(0, len(wave), chunk_size):
+            pipeline.accept_waveform(SAMP_FREQ,
+                                     Vector(wave[start:start + chunk_size]))
+            recognizer.advance_decoding()
+        pipeline.input_finished()
+        recognizer.advance_decoding()
+        recognizer.finalize_decoding()
+        return recognizer.get_output()
+
+    def decodeWave(self, recognizer, wave):
+        """Decodes a wave with decode."""
+        pipeline = OnlineNnetFeaturePipeline(self.feature_info)
+        recognizer.set_input_pipeline(pipeline)
+        pipeline.accept_waveform(SAMP_FREQ, Vector(wave))
+        pipeline.input_finished()
+        return recognizer.decode()
+
+    def assertOutputEqual(self, expected, output):
+        self.assertEqual(expected["text"], output["text"])
+        self.assertTrue(equal(expected["lattice"], output["lattice"], 1e-2))
+
+
+class TestNnetOnlineBatchScheduler(_TestNnet, unittest.TestCase):
+
+    def makeRecognizers(self, num_recognizers, max_wait=1.0):
+        transition_model, acoustic_model = (
+            NnetLatticeFasterOnlineBatchRecognizer.read_model(
+                self.model_filename))
+        scheduler = NnetOnlineBatchScheduler(transition_model, acoustic_model,
+                                             max_batch_size=num_recognizers,
+                                             max_wait=max_wait)
+        graph = read_fst_kaldi(self.graph_filename)
+        recognizers = [NnetLatticeFasterOnlineBatchRecognizer(
+                           transition_model, acoustic_model,
+                           LatticeFasterOnlineDecoder(
+                               graph, LatticeFasterDecoderOptions()),
+                           scheduler)
+                       for _ in range(num_recognizers)]
+        return scheduler, recognizers
+
+    def testBatchedStreams(self):
+        recognizer = NnetLatticeFasterOnlineRecognizer.from_files(
+            self.model_filename, self.graph_filename)
+        expected = [self.decodeStream(recognizer, wave)
+                    for wave in self.waves[:2]]
+
+        scheduler, recognizers = self.makeRecognizers(2)
+        outputs = [None, None]
+        def work(i):
+            outputs[i] = self.decodeStream(recognizers[i], self.waves[i])
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        scheduler.close()
+
+        for exp, output in zip(expected, outputs):
+            self.assertOutputEqual(exp, output)
+
+    def testDecodeAfterAdvanceDecoding(self):
+        recognizer = NnetLatticeFasterOnlineRecognizer.from_files(
+            self.model_filename, self.graph_filename)
+        expected = self.decodeWave(recognizer, self.waves[1])
+
+        scheduler, (recognizer,) = self.makeRecognizers(1)
+        # The decoder reports the frames of the previous utterance
+        self.decodeStream(recognizer, self.waves[0])
+        self.assertOutputEqual(expected,
+                               self.decodeWave(recognizer, self.waves[1]))
+        scheduler.close()
+
+    def testReleaseRemovesStream(self):
+        recognizer = NnetLatticeFasterOnlineBatchRecognizer.from_files(
+            self.model_filename, self.graph_filename, max_wait=60.0)
+        pool = RecognizerPool(recognizer, self.feature_info,
+                              endpointing=False)
+        session = pool.acquire()
+        session.accept_waveform(SAMP_FREQ, self.waves[0][:8000])
+        pool.release(session)
+
+        # Chunks would wait for the released stream otherwise
+        def work():
+            with pool.session() as session:
+                session.accept_waveform(SAMP_FREQ, self.waves[1])
+                session.input_finished()
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+        thread.join(30.0)
+        self.assertFalse(thread.is_alive())
+        recognizer.scheduler.close()
+
+
+class TestNnetLatticeFasterBatchRecognizer(_TestNnet, unittest.TestCase):
+
+    def testDecodeStream(self):
+        random = np.random.RandomState(0)
+        inputs = [("utt{}".format(i), Matrix(random.randn(20 + 7 * i,
+                                                          FEAT_DIM)))
+                  for i in range(6)]
+        recognizer = NnetLatticeFasterRecognizer.from_files(
+            self.model_filename, self.graph_filename)
+        expected = [(key, recognizer.decode(feats)["text"])
+                    for key, feats in inputs]
+
+        recognizer = NnetLatticeFasterBatchRecognizer.from_files(
+            self.model_filename, self.graph_filename, num_threads=2)
+        outputs = [(output["key"], output["text"])
+                   for output in recognizer.decode_stream(iter(inputs),
+                                                          queue_size=2)]
+        self.assertEqual(expected, outputs)
+        stats = recognizer.stream_stats
+        self.assertEqual(len(inputs), stats["num_inputs"])
+        self.assertEqual(len(inputs), stats["num_outputs"])
+        self.assertTrue(stats["max_queue_depth"] <= 2)
+        self.assertTrue(stats["elapsed"] > 0.0)
+
+
+class TestOnlineSession(_TestNnet, unittest.TestCase):
+
+    chunk_size = 1600
+
+    def makeSession(self):
+        recognizer = NnetLatticeFasterOnlineRecognizer.from_files(
+            self.model_filename, self.graph_filename)
+        return OnlineSession(recognizer, self.feature_info, endpointing=False)
+
+    def chunks(self, wave):
+        return [wave[start:start + self.chunk_size]
+                for start in range(0, len(wave), self.chunk_size)]
+
+    def decodeSession(self, session, wave):
+        outputs = []
+        for chunk in self.chunks(wave):
+            outputs.extend(session.accept_waveform(SAMP_FREQ, chunk))
+        outputs.extend(session.input_finished())
+        return outputs
+
+    def testAcceptWaveform(self):
+        recognizer = NnetLatticeFasterOnlineRecognizer.from_files(
+            self.model_filename, self.graph_filename)
+        expected = self.decodeStream(recognizer, self.waves[0],
+                                     self.chunk_size)
+
+        session = self.makeSession()
+        outputs = self.decodeSession(session, self.waves[0])
+        self.assertTrue(len(outputs) > 1)
+        self.assertEqual([False] * (len(outputs) - 1) + [True],
+                         [output["final"] for output in outputs])
+        self.assertEqual([0] * len(outputs),
+                         [output["segment"] for output in outputs])
+        self.assertOutputEqual(expected, outputs[-1])
+
+        with self.assertRaises(ValueError):
+            session.accept_waveform(SAMP_FREQ, self.waves[0])
+        with self.assertRaises(ValueError):
+            session.input_finished()
+
+    def testAsyncSession(self):
+        expected = self.decodeSession(self.makeSession(), self.waves[0])
+
+        session = AsyncOnlineSession(self.makeSession(), max_queue_size=2)
+        async def produce():
+            for chunk in self.chunks(self.waves[0]):
+                await session.accept_waveform(SAMP_FREQ, chunk)
+            await session.input_finished()
+        async def consume():
+            return [output async for output in session]
+        async def run():
+            _, outputs = await asyncio.gather(produce(), consume())
+            return outputs
+        outputs = asyncio.run(run())
+
+        self.assertEqual([(output["final"], output["text"])
+                          for output in expected],
+                         [(output["final"], output["text"])
+                          for output in outputs])
+        self.assertOutputEqual(expected[-1], outputs[-1])
+
+
+class TestRecognizerPool(_TestNnet, unittest.TestCase):
+
+    def makePool(self, max_sessions=2):
+        return RecognizerPool.from_files(self.model_filename,
+                                         self.graph_filename,
+                                         self.feature_info,
+                                         max_sessions=max_sessions,
+                                         endpointing=False)
+
+    def testMaxSessions(self):
+        pool = self.makePool()
+        sessions = [pool.acquire(), pool.acquire()]
+        self.assertEqual(2, pool.stats()["active"])
+        with self.assertRaises(RuntimeError):
+            pool.acquire(block=False)
+        with self.assertRaises(RuntimeError):
+            pool.acquire(timeout=0.1)
+
+        for session in sessions:
+            pool.release(session)
+        stats = pool.stats()
+        self.assertEqual(0, stats["active"])
+        self.assertEqual(2, stats["idle"])
+        self.assertEqual(2, stats["peak_active"])
+        with self.assertRaises(ValueError):
+            pool.release(sessions[0])
+
+        # Idle recognizers are reused
+        with pool.session() as session:
+            outputs = session.accept_waveform(SAMP_FREQ, self.waves[0])
+            outputs.extend(session.input_finished())
+        self.assertTrue(outputs[-1]["final"])
+        self.assertEqual(2, pool.stats()["created"])
+
+    def testBlockingAcquire(self):
+        pool = self.makePool(max_sessions=1)
+        session = pool.acquire()
+        acquired = threading.Event()
+        def work():
+            with pool.session():
+                acquired.set()
+        thread = threading.Thread(target=work)
+        thread.daemon = True
+        thread.start()
+        self.assertFalse(acquired.wait(0.2))
+        pool.release(session)
+        self.assertTrue(acquired.wait(30.0))
+        thread.join(30.0)
+        self.assertEqual(0, pool.stats()["active"])
+
+    def testReleaseOnException(self):
+        pool = self.makePool(max_sessions=1)
+        with self.assertRaises(ValueError):
+            with pool.session() as session:
+                session.input_finished()
+                session.input_finished()
+        stats = pool.stats()
+        self.assertEqual(0, stats["active"])
+        self.assertEqual(1, stats["idle"])
+
+        # The released session does not count towards the limit
+        session = pool.acquire(block=False)
+        pool.release(session)
+
+
+if __name__ == '__main__':
+    unittest.main()
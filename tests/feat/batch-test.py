@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+
+from kaldi.feat.batch import BatchFeatureComputer
+from kaldi.feat.fbank import Fbank, FbankOptions
+from kaldi.feat.mfcc import Mfcc, MfccOptions
+from kaldi.feat.spectrogram import Spectrogram, SpectrogramOptions
+from kaldi.matrix import Vector
+
+
+class _TestBatchFeatureComputer(object):
+
+    lengths = [1234, 400, 3000, 16000]
+
+    def setUp(self):
+        self.opts = self.getOptions()
+        frame_opts = self.opts.frame_opts
+        frame_opts.dither = 0.0
+        self.opts.frame_opts = frame_opts
+        self.samp_freq = frame_opts.samp_freq
+        random = np.random.RandomState(0)
+        self.waves = [np.asarray(1000.0 * random.randn(length),
+                                 dtype=np.float32)
+                      for length in self.lengths]
+
+    def assertFeaturesEqual(self, expected, actual):
+        self.assertEqual(len(expected), len(actual))
+        for exp, act in zip(expected, actual):
+            self.assertEqual((exp.num_rows, exp.num_cols),
+                             (act.num_rows, act.num_cols))
+            self.assertTrue(np.allclose(exp.numpy(), act.numpy(),
+                                        rtol=1e-3, atol=1e-3))
+
+    def expected(self):
+        computer = self.getComputer()
+        return [computer.compute_features(Vector(wave), self.samp_freq, 1.0)
+                for wave in self.waves]
+
+    def testCompute(self):
+        computer = BatchFeatureComputer(self.opts)
+        self.assertEqual(self.getComputer().dim(), computer.dim())
+        self.assertFeaturesEqual(self.expected(), computer.compute(self.waves))
+
+    def testComputePadded(self):
+        padded = np.zeros((len(self.waves), max(self.lengths)),
+                          dtype=np.float32)
+        for i, wave in enumerate(self.waves):
+            padded[i, :len(wave)] = wave
+        computer = BatchFeatureComputer(self.opts)
+        self.assertFeaturesEqual(self.expected(),
+                                 computer.compute(padded, self.lengths))
+
+
+class TestBatchMfcc(_TestBatchFeatureComputer, unittest.TestCase):
+
+    def getOptions(self):
+        return MfccOptions()
+
+    def getComputer(self):
+        return Mfcc(self.opts)
+
+
+class TestBatchFbank(_TestBatchFeatureComputer, unittest.TestCase):
+
+    def getOptions(self):
+        return FbankOptions()
+
+    def getComputer(self):
+        return Fbank(self.opts)
+
+
+class TestBatchSpectrogram(_TestBatchFeatureComputer, unittest.TestCase):
+
+    def getOptions(self):
+        return SpectrogramOptions()
+
+    def getComputer(self):
+        return Spectrogram(self.opts)
+
+    def testComputeLogEnergy(self):
+        # Silent frames exercise the floor of the windowed signal energy
+        self.opts.raw_energy = False
+        self.waves[1][:] = 0.0
+        self.testCompute()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import unittest
+
+import numpy as np
+
+from kaldi.feat.extract import extract_features
+from kaldi.feat.mfcc import Mfcc, MfccOptions
+from kaldi.feat.wave import WaveData
+from kaldi.matrix import Matrix, Vector
+from kaldi.util.table import (FloatWriter, SequentialMatrixReader,
+                              WaveWriter)
+
+
+class TestExtractFeatures(unittest.TestCase):
+
+    samp_freq = 16000.0
+    lengths = [4000, 800, 16000, 8000, 12000, 1600, 6000]
+
+    def setUp(self):
+        opts = MfccOptions()
+        frame_opts = opts.frame_opts
+        frame_opts.dither = 0.0
+        opts.frame_opts = frame_opts
+        self.computer = Mfcc(opts)
+        self.wav_filename = '/tmp/temp.wav.ark'
+        self.vtln_filename = '/tmp/temp.vtln.ark'
+        self.feats_filename = '/tmp/temp.feats.ark'
+        random = np.random.RandomState(0)
+        self.keys = ['utt{}'.format(i) for i in range(len(self.lengths))]
+        self.waves = [np.asarray(1000.0 * random.randn(length),
+                                 dtype=np.float32)
+                      for length in self.lengths]
+        with WaveWriter('ark:' + self.wav_filename) as writer:
+            for key, wave in zip(self.keys, self.waves):
+                writer[key] = WaveData.from_data(
+                    self.samp_freq, Matrix(wave.reshape(1, -1)))
+
+    def tearDown(self):
+        for filename in (self.wav_filename, self.vtln_filename,
+                         self.feats_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def readFeatures(self):
+        with SequentialMatrixReader('ark:' + self.feats_filename) as reader:
+            return [(key, Matrix(feats)) for key, feats in reader]
+
+    def assertFeaturesEqual(self, expected, actual):
+        self.assertEqual([key for key, _ in expected],
+                         [key for key, _ in actual])
+        for (_, exp), (_, act) in zip(expected, actual):
+            self.assertEqual((exp.num_rows, exp.num_cols),
+                             (act.num_rows, act.num_cols))
+            self.assertTrue(np.allclose(exp.numpy(), act.numpy(),
+                                        rtol=1e-3, atol=1e-3))
+
+    def testExtractFeatures(self):
+        expected = [(key, self.computer.compute_features(
+                        Vector(wave), self.samp_freq, 1.0))
+                    for key, wave in zip(self.keys, self.waves)]
+        for num_threads in (1, 3):
+            num_utts, num_success = extract_features(
+                self.computer, 'ark:' + self.wav_filename,
+                'ark:' + self.feats_filename, num_threads=num_threads)
+            self.assertEqual(len(self.keys), num_utts)
+            self.assertEqual(len(self.keys), num_success)
+            self.assertFeaturesEqual(expected, self.readFeatures())
+
+    def testSkippedUtterances(self):
+        # Utterances 1 and 5 are too short and utterance 3 has no warp factor.
+        warps = {key: 0.9 + 0.05 * i for i, key in enumerate(self.keys)
+                 if i != 3}
+        with FloatWriter('ark:' + self.vtln_filename) as writer:
+            for key, warp in warps.items():
+                writer[key] = warp
+        expected = [(key, self.computer.compute_features(
+                        Vector(wave), self.samp_freq, warps[key]))
+                    for i, (key, wave) in enumerate(zip(self.keys,
+                                                        self.waves))
+                    if i not in (1, 3, 5)]
+        num_utts, num_success = extract_features(
+            self.computer, 'ark:' + self.wav_filename,
+            'ark:' + self.feats_filename, num_threads=3,
+            vtln_map_rspecifier='ark:' + self.vtln_filename,
+            min_duration=0.2)
+        self.assertEqual(len(self.keys), num_utts)
+        self.assertEqual(len(expected), num_success)
+        self.assertFeaturesEqual(expected, self.readFeatures())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+
+import numpy as np
+
+from kaldi.feat.fbank import FbankOptions
+from kaldi.feat.mfcc import MfccOptions
+from kaldi.feat.online import OnlineFbank, OnlineMfcc, get_frames
+from kaldi.matrix import Matrix, SubMatrix, Vector
+
+
+class _TestGetFrames(object):
+
+    def setUp(self):
+        opts = self.getOptions()
+        frame_opts = opts.frame_opts
+        frame_opts.dither = 0.0
+        opts.frame_opts = frame_opts
+        self.samp_freq = frame_opts.samp_freq
+        self.feature = self.getFeature(opts)
+        random = np.random.RandomState(0)
+        self.wave = np.asarray(1000.0 * random.randn(12345), dtype=np.float32)
+
+    def expected(self, start, count):
+        frames = Matrix(count, self.feature.dim())
+        for i in range(count):
+            frame = Vector(self.feature.dim())
+            self.feature.get_frame(start + i, frame)
+            frames.numpy()[i] = frame.numpy()
+        return frames
+
+    def assertFramesEqual(self, expected, actual):
+        self.assertEqual((expected.num_rows, expected.num_cols),
+                         (actual.num_rows, actual.num_cols))
+        self.assertTrue(np.array_equal(expected.numpy(), actual.numpy()))
+
+    def testGetFrames(self):
+        self.feature.accept_waveform(self.samp_freq, Vector(self.wave[:5000]))
+        num_frames_ready = self.feature.num_frames_ready()
+        self.assertGreater(num_frames_ready, 2)
+        self.assertFramesEqual(self.expected(0, num_frames_ready),
+                               get_frames(self.feature))
+        self.assertFramesEqual(self.expected(2, num_frames_ready - 2),
+                               get_frames(self.feature, 2))
+        self.assertFramesEqual(self.expected(1, 2),
+                               get_frames(self.feature, 1, 2))
+        self.assertEqual(0, get_frames(self.feature, 1, 0).num_rows)
+
+        self.feature.accept_waveform(self.samp_freq, Vector(self.wave[5000:]))
+        self.feature.input_finished()
+        start = num_frames_ready - 1
+        num_frames_ready = self.feature.num_frames_ready()
+        self.assertFramesEqual(self.expected(start, num_frames_ready - start),
+                               get_frames(self.feature, start))
+
+    def testGetFramesOut(self):
+        self.feature.accept_waveform(self.samp_freq, Vector(self.wave))
+        num_frames_ready = self.feature.num_frames_ready()
+        buf = Matrix(num_frames_ready + 2, self.feature.dim())
+        out = SubMatrix(buf, 1, num_frames_ready - 1, 0, self.feature.dim())
+        self.assertIs(out, get_frames(self.feature, 1, out=out))
+        self.assertFramesEqual(self.expected(1, num_frames_ready - 1), out)
+        with self.assertRaises(ValueError):
+            get_frames(self.feature, 0, out=out)
+
+    def testFramesNotReady(self):
+        self.feature.accept_waveform(self.samp_freq, Vector(self.wave[:5000]))
+        num_frames_ready = self.feature.num_frames_ready()
+        with self.assertRaises(IndexError):
+            get_frames(self.feature, 0, num_frames_ready + 1)
+        with self.assertRaises(IndexError):
+            get_frames(self.feature, num_frames_ready - 1, 2)
+        with self.assertRaises(IndexError):
+            get_frames(self.feature, num_frames_ready + 1)
+        with self.assertRaises(IndexError):
+            get_frames(self.feature, -1, 1)
+
+
+class TestGetFramesMfcc(_TestGetFrames, unittest.TestCase):
+
+    def getOptions(self):
+        return MfccOptions()
+
+    def getFeature(self, opts):
+        return OnlineMfcc(opts)
+
+
+class TestGetFramesFbank(_TestGetFrames, unittest.TestCase):
+
+    def getOptions(self):
+        return FbankOptions()
+
+    def getFeature(self, opts):
+        return OnlineFbank(opts)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import unittest
+
+import numpy as np
+
+from kaldi.feat.functions import compute_deltas, splice_frames
+from kaldi.feat.mfcc import Mfcc
+from kaldi.feat.pipeline import FeaturePipeline, FeaturePipelineOptions
+from kaldi.matrix import Vector
+from kaldi.transform.cmvn import Cmvn
+
+
+class TestFeaturePipeline(unittest.TestCase):
+
+    lengths = [4000, 400, 16000]
+
+    def setUp(self):
+        self.opts = FeaturePipelineOptions()
+        frame_opts = self.opts.mfcc_opts.frame_opts
+        frame_opts.dither = 0.0
+        self.opts.mfcc_opts.frame_opts = frame_opts
+        self.samp_freq = frame_opts.samp_freq
+        random = np.random.RandomState(0)
+        self.waves = [Vector(np.asarray(1000.0 * random.randn(length),
+                                        dtype=np.float32))
+                      for length in self.lengths]
+        self.config_filename = '/tmp/temp.pipeline.conf'
+        self.feature_config_filename = '/tmp/temp.mfcc.conf'
+
+    def tearDown(self):
+        for filename in (self.config_filename, self.feature_config_filename):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def features(self, wave):
+        mfcc = Mfcc(self.opts.mfcc_opts)
+        return mfcc.compute_features(wave, self.samp_freq, 1.0)
+
+    def assertFeaturesEqual(self, expected, actual):
+        self.assertEqual((expected.num_rows, expected.num_cols),
+                         (actual.num_rows, actual.num_cols))
+        self.assertTrue(np.allclose(expected.numpy(), actual.numpy(),
+                                    rtol=1e-3, atol=1e-3))
+
+    def testDeltasAndSplicing(self):
+        for add_deltas, left_context, right_context in [(True, 0, 0),
+                                                        (False, 2, 1),
+                                                        (True, 3, 2)]:
+            self.opts.add_deltas = add_deltas
+            self.opts.left_context = left_context
+            self.opts.right_context = right_context
+            pipeline = FeaturePipeline(self.opts)
+            for wave in self.waves:
+                expected = self.features(wave)
+                if add_deltas:
+                    expected = compute_deltas(self.opts.delta_opts, expected)
+                expected = splice_frames(expected, left_context,
+                                         right_context)
+                actual = pipeline.compute(wave, self.samp_freq)
+                self.assertEqual(pipeline.dim(), actual.num_cols)
+                self.assertFeaturesEqual(expected, actual)
+
+    def testPerUtteranceCmvn(self):
+        self.opts.apply_cmvn = True
+        self.opts.norm_vars = True
+        self.opts.add_deltas = True
+        pipeline = FeaturePipeline(self.opts)
+        for wave in self.waves:
+            feats = self.features(wave)
+            cmvn = Cmvn(feats.num_cols)
+            cmvn.accumulate(feats)
+            cmvn.apply(feats, norm_vars=True)
+            expected = compute_deltas(self.opts.delta_opts, feats)
+            self.assertFeaturesEqual(expected,
+                                     pipeline.compute(wave, self.samp_freq))
+
+    def testPerSpeakerCmvn(self):
+        self.opts.apply_cmvn = True
+        self.opts.left_context = 1
+        self.opts.right_context = 1
+        pipeline = FeaturePipeline(self.opts)
+        cmvn = Cmvn(Mfcc(self.opts.mfcc_opts).dim())
+        for wave in self.waves:
+            cmvn.accumulate(self.features(wave))
+        for wave in self.waves:
+            feats = self.features(wave)
+            cmvn.apply(feats)
+            expected = splice_frames(feats, 1, 1)
+            actual = pipeline.compute(wave, self.samp_freq,
+                                      cmvn_stats=cmvn.stats)
+            self.assertFeaturesEqual(expected, actual)
+
+    def testFeatureConfig(self):
+        with open(self.feature_config_filename, 'w') as f:
+            f.write('--num-ceps=10\n--dither=0.0\n')
+        with open(self.config_filename, 'w') as f:
+            f.write('--feature-type=mfcc\n'
+                    '--feature-config={}\n'
+                    '--add-deltas=true\n'
+                    '--left-context=1\n'.format(self.feature_config_filename))
+        opts = FeaturePipelineOptions.from_config(self.config_filename)
+        self.assertEqual(self.feature_config_filename, opts.feature_config)
+        self.assertTrue(opts.add_deltas)
+        self.assertEqual(1, opts.left_context)
+        self.assertEqual(0, opts.right_context)
+        pipeline = FeaturePipeline(opts)
+        self.assertEqual(10, opts.mfcc_opts.num_ceps)
+        self.assertEqual(10 * 3 * 2, pipeline.dim())
+
+
+if __name__ == '__main__':
+    unittest.main()
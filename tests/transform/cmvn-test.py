@@ -0,0 +1,109 @@
+import os
+import unittest
+
+import numpy as np
+
+from kaldi.matrix import Matrix
+from kaldi.transform.cmvn import (Cmvn, apply_cmvn_stats, compute_cmvn_stats,
+                                  normalize_cmvn)
+from kaldi.util.table import SequentialMatrixReader, MatrixWriter
+
+
+class TestCmvnTables(unittest.TestCase):
+
+    dim = 3
+
+    def setUp(self):
+        self.utt2spk = {'utt1': 'spk1', 'utt2': 'spk2',
+                        'utt3': 'spk1', 'utt4': 'spk2'}
+        random = np.random.RandomState(0)
+        self.feats = {key: 5.0 * random.randn(10 + i, self.dim) + i
+                      for i, key in enumerate(sorted(self.utt2spk))}
+
+        self.utt2spk_filename = '/tmp/temp.utt2spk'
+        with open(self.utt2spk_filename, 'w') as f:
+            for key in sorted(self.utt2spk):
+                f.write('{} {}\n'.format(key, self.utt2spk[key]))
+        self.filenames = ['/tmp/temp.{}.ark'.format(i) for i in range(1, 3)]
+        for filename, keys in zip(self.filenames, [['utt1', 'utt2'],
+                                                   ['utt3', 'utt4']]):
+            with MatrixWriter('ark:' + filename) as writer:
+                for key in keys:
+                    writer[key] = Matrix(self.feats[key])
+        self.out_filename = '/tmp/temp.out.ark'
+
+    def tearDown(self):
+        for filename in (self.filenames + [self.utt2spk_filename,
+                                           self.out_filename]):
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def expectedStats(self):
+        cmvns = {}
+        for key in sorted(self.feats):
+            spk = self.utt2spk[key]
+            if spk not in cmvns:
+                cmvns[spk] = Cmvn(self.dim)
+            cmvns[spk].accumulate(Matrix(self.feats[key]))
+        return cmvns
+
+    def expectedFeats(self, norm_vars):
+        cmvns = self.expectedStats()
+        expected = {}
+        for key, feats in self.feats.items():
+            feats = Matrix(feats)
+            cmvns[self.utt2spk[key]].apply(feats, norm_vars=norm_vars)
+            expected[key] = feats.numpy()
+        return expected
+
+    def assertStatsEqual(self, stats):
+        expected = self.expectedStats()
+        self.assertEqual(sorted(expected), sorted(stats))
+        for spk, cmvn in expected.items():
+            self.assertTrue(np.allclose(cmvn.stats.numpy(),
+                                        stats[spk].numpy()))
+
+    def assertOutputEqual(self, norm_vars):
+        expected = self.expectedFeats(norm_vars)
+        with SequentialMatrixReader('ark:' + self.out_filename) as reader:
+            output = {key: feats.numpy() for key, feats in reader}
+        self.assertEqual(sorted(expected), sorted(output))
+        for key in expected:
+            self.assertTrue(np.allclose(expected[key], output[key],
+                                        atol=1e-4))
+
+    def testComputeStats(self):
+        rspecifiers = ['ark:' + filename for filename in self.filenames]
+        utt2spk_rspecifier = 'ark:' + self.utt2spk_filename
+        self.assertStatsEqual(compute_cmvn_stats(rspecifiers,
+                                                 utt2spk_rspecifier))
+        self.assertStatsEqual(compute_cmvn_stats(rspecifiers, self.utt2spk,
+                                                 num_threads=2))
+
+        with self.assertRaises(ValueError):
+            compute_cmvn_stats(rspecifiers, 'scp:' + self.utt2spk_filename)
+        with self.assertRaises(IOError):
+            compute_cmvn_stats(rspecifiers, 'ark:/tmp/nonexistent.utt2spk')
+
+    def testApplyStats(self):
+        rspecifier = 'ark:cat {} |'.format(' '.join(self.filenames))
+        stats = compute_cmvn_stats(rspecifier, self.utt2spk)
+        for norm_vars in (False, True):
+            num_done, num_err = apply_cmvn_stats(
+                rspecifier, 'ark:' + self.out_filename, stats,
+                'ark:' + self.utt2spk_filename, norm_vars)
+            self.assertEqual((4, 0), (num_done, num_err))
+            self.assertOutputEqual(norm_vars)
+
+    def testNormalize(self):
+        rspecifiers = ['ark:' + filename for filename in self.filenames]
+        for norm_vars in (False, True):
+            stats = normalize_cmvn(rspecifiers, 'ark:' + self.out_filename,
+                                   'ark:' + self.utt2spk_filename, norm_vars,
+                                   num_threads=2)
+            self.assertStatsEqual(stats)
+            self.assertOutputEqual(norm_vars)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from __future__ import print_function
 
+import gzip
 import os
 import unittest
 
@@ -72,6 +73,21 @@ class TestKaldiIO(unittest.TestCase):
                 self.assertEqual(line, lines[i])
         os.remove(filename)
 
+    def test_compressed_io(self):
+        filename = "tmpf.gz"
+        lines = [b"\t500\t600\n", b"700\td\n"]
+        with xopen(filename, "w", compression="infer") as ko:
+            ko.writelines(lines)
+        with gzip.open(filename) as f:
+            self.assertEqual(b"\0B" + b"".join(lines), f.read())
+        with xopen(filename, compression="gzip") as ki:
+            self.assertTrue(ki.binary)
+            for i, line in enumerate(ki):
+                self.assertEqual(line, lines[i])
+        with self.assertRaises(ValueError):
+            xopen("gzip -c tmpf |", compression="gzip")
+        os.remove(filename)
+
 
 if __name__ == '__main__':
     unittest.main()
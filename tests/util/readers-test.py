@@ -4,6 +4,7 @@ import os
 import unittest
 
 from kaldi.matrix import *
+from kaldi.matrix import compressed
 import kaldi.util
 
 from .mixins import *
@@ -85,6 +86,28 @@ class _TestSequentialReaders(AuxMixin):
         # Check iterator is closed
         self.assertFalse(reader.is_open())
 
+    def test__iter__read_ahead(self):
+        # Create a file and write an example to it
+        with open(self.filename, 'w') as outpt:
+            self.writeExample(outpt)
+
+        # Iterate over the file reading ahead on a background thread
+        cls = getattr(kaldi.util.table, self.classname)
+        with cls(self.rspecifier, read_ahead=2) as reader:
+            for idx, (k, v) in enumerate(reader):
+                self.checkRead(idx, (k, v))
+
+        # Check iterator is closed
+        self.assertFalse(reader.is_open())
+
+        # Stop iterating early and close the reader
+        with cls(self.rspecifier, read_ahead=1) as reader:
+            for idx, (k, v) in enumerate(reader):
+                self.checkRead(idx, (k, v))
+                break
+
+        self.assertFalse(reader.is_open())
+
 class TestSequentialVectorReader(_TestSequentialReaders, unittest.TestCase, VectorExampleMixin):
     def checkRead(self, idx, pair):
         k, v = pair
@@ -190,6 +213,76 @@ class TestSequentialFloatPairVectorReader(_TestSequentialReaders, unittest.TestC
         elif idx < 0 or idx > 2:
             self.fail("shouldn't happen")
 
+class TestShardedSequentialReader(unittest.TestCase):
+    def setUp(self):
+        self.filenames = ['/tmp/temp.{}.ark'.format(i) for i in range(1, 4)]
+        for i, filename in enumerate(self.filenames):
+            with open(filename, 'w') as outpt:
+                for j in range(i + 1):
+                    outpt.write("{}-{} {}\n".format(i, j, j))
+
+    def tearDown(self):
+        for filename in self.filenames:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def testRoundRobin(self):
+        reader = kaldi.util.table.ShardedSequentialReader(
+            kaldi.util.table.SequentialIntReader, 'ark:/tmp/temp.*.ark',
+            num_threads=2)
+        self.assertEqual([('0-0', 0), ('1-0', 0), ('1-1', 1), ('2-0', 0),
+                          ('2-1', 1), ('2-2', 2)], list(reader))
+
+    def testShuffle(self):
+        rspecifiers = ['ark:' + filename for filename in self.filenames]
+        reader = kaldi.util.table.ShardedSequentialReader(
+            kaldi.util.table.SequentialIntReader, rspecifiers,
+            shuffle=True, shuffle_buffer_size=2, seed=0)
+        self.assertEqual(['0-0', '1-0', '1-1', '2-0', '2-1', '2-2'],
+                         sorted(k for k, v in reader))
+
+    def testNoMatch(self):
+        with self.assertRaises(IOError):
+            kaldi.util.table.ShardedSequentialReader(
+                kaldi.util.table.SequentialIntReader, 'ark:/tmp/none.*.ark')
+
+class TestPaddedBatchReader(unittest.TestCase):
+    def setUp(self):
+        self.filename = '/tmp/temp.ark'
+        self.lengths = [3, 1, 2, 5, 4]
+        with kaldi.util.table.MatrixWriter('ark:' + self.filename) as writer:
+            for i, length in enumerate(self.lengths):
+                writer[str(i)] = Matrix(np.full((length, 2), i + 1))
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def testRead(self):
+        reader = kaldi.util.table.PaddedBatchReader('ark:' + self.filename, 2)
+        batches = list(reader)
+        self.assertEqual([['0', '1'], ['2', '3'], ['4']],
+                         [keys for keys, _, _ in batches])
+        keys, batch, lengths = batches[0]
+        self.assertEqual(np.float32, batch.dtype)
+        self.assertEqual((2, 3, 2), batch.shape)
+        self.assertTrue(np.array_equal([3, 1], lengths))
+        self.assertTrue(np.array_equal(np.full((3, 2), 1), batch[0]))
+        self.assertTrue(np.array_equal([[2, 2], [0, 0], [0, 0]], batch[1]))
+
+    def testBucketing(self):
+        with kaldi.util.table.SequentialMatrixReader(
+                'ark:' + self.filename) as table:
+            reader = kaldi.util.table.PaddedBatchReader(table, 2,
+                                                        bucket_size=4,
+                                                        pad_value=-1.0)
+            batches = list(reader)
+        self.assertEqual([['1', '2'], ['0', '3'], ['4']],
+                         [keys for keys, _, _ in batches])
+        self.assertTrue(np.array_equal([3, 5], batches[1][2]))
+        self.assertTrue(np.array_equal([[1, 1]] * 3 + [[-1, -1]] * 2,
+                                       batches[1][1][0]))
+
 ################################################################################################################
 # Random Access Readers
 ################################################################################################################
@@ -275,12 +368,65 @@ class _TestRandomAccessReaders(AuxMixin):
         with self.assertRaises(TypeError):
             self.getImpl(self.rspecifier)[1]
 
+    def testGetMany(self):
+        # Create a file and write an example to it
+        with open(self.filename, 'w') as outpt:
+            self.writeExample(outpt)
+
+        reader = self.getImpl(self.rspecifier)
+        self.assertEqual(2, len(reader.get_many(["two", "one"])))
+        self.assertEqual([], reader.get_many([]))
+
+        with self.assertRaises(KeyError):
+            reader.get_many([self.getValidKey(), self.getNotValidKey()])
+
 class TestRandomAccessVectorReader(_TestRandomAccessReaders, unittest.TestCase, VectorExampleMixin):
     def checkRead(self, reader):
         self.assertTrue(np.array_equal([3.0, 5.0, 7.0], reader["one"].numpy()))
         self.assertTrue(np.array_equal([1.0, 2.0, 3.0], reader["two"].numpy()))
         self.assertEqual(0, len(reader["three"].numpy()))
 
+    def testGetManyScript(self):
+        scp = self.filename + '.scp'
+        with kaldi.util.table.VectorWriter(
+                'ark,scp:{},{}'.format(self.filename, scp)) as writer:
+            writer['one'] = Vector([3.0, 5.0, 7.0])
+            writer['two'] = Vector([1.0, 2.0, 3.0])
+            writer['three'] = Vector()
+
+        try:
+            reader = self.getImpl('scp:' + scp)
+            two, three, one = reader.get_many(['two', 'three', 'one'])
+            self.assertTrue(np.array_equal([1.0, 2.0, 3.0], two.numpy()))
+            self.assertEqual(0, len(three.numpy()))
+            self.assertTrue(np.array_equal([3.0, 5.0, 7.0], one.numpy()))
+        finally:
+            os.remove(scp)
+
+    def testGetManyMappedScript(self):
+        scp = self.filename + '.scp'
+        utt2spk = self.filename + '.utt2spk'
+        with kaldi.util.table.VectorWriter(
+                'ark,scp:{},{}'.format(self.filename, scp)) as writer:
+            writer['spk1'] = Vector([3.0, 5.0, 7.0])
+            writer['spk2'] = Vector([1.0, 2.0, 3.0])
+        with open(utt2spk, 'w') as outpt:
+            outpt.write('utt1 spk2\nutt2 spk1\nutt3 spk2\n')
+
+        try:
+            reader = kaldi.util.table.RandomAccessVectorReaderMapped(
+                'scp:' + scp, 'ark:' + utt2spk)
+            utt3, utt2, utt1 = reader.get_many(['utt3', 'utt2', 'utt1'])
+            self.assertTrue(np.array_equal([1.0, 2.0, 3.0], utt3.numpy()))
+            self.assertTrue(np.array_equal([3.0, 5.0, 7.0], utt2.numpy()))
+            self.assertTrue(np.array_equal([1.0, 2.0, 3.0], utt1.numpy()))
+
+            with self.assertRaises(KeyError):
+                reader.get_many(['utt1', 'utt4'])
+        finally:
+            os.remove(scp)
+            os.remove(utt2spk)
+
 class TestRandomAccessMatrixReader(_TestRandomAccessReaders, unittest.TestCase, MatrixExampleMixin):
     def checkRead(self, reader):
         self.assertTrue(np.array_equal(np.arange(9).reshape((3, 3)), reader["one"].numpy()))
@@ -354,6 +500,175 @@ class TestRandomAccessFloatPairVectorReader(_TestRandomAccessReaders, unittest.T
         with self.assertRaises(KeyError):
             reader['four']
 
+################################################################################################################
+# Memory-mapped Archives
+################################################################################################################
+class TestMmapMatrixArchive(unittest.TestCase):
+    def setUp(self):
+        self.filename = '/tmp/temp.ark'
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def testRead(self):
+        with kaldi.util.table.MatrixWriter('ark:' + self.filename) as writer:
+            writer['one'] = Matrix(np.arange(9).reshape((3, 3)))
+            writer['two'] = Matrix([[1.0], [2.0], [3.0]])
+            writer['three'] = Matrix()
+
+        with kaldi.util.table.MmapMatrixArchive(self.filename) as archive:
+            self.assertEqual(3, len(archive))
+            self.assertEqual(['one', 'two', 'three'], archive.keys())
+            self.assertTrue('two' in archive)
+            self.assertFalse('four' in archive)
+            self.assertEqual((3, 1), archive.shape('two'))
+            self.assertTrue(np.array_equal(np.arange(9).reshape((3, 3)),
+                                           archive['one'].numpy()))
+            self.assertTrue(np.array_equal([[1.0], [2.0], [3.0]],
+                                           archive.numpy(1)))
+            self.assertEqual(0, len(archive['three'].numpy()))
+            self.assertEqual(['one', 'two', 'three'],
+                             [k for k, v in archive])
+
+            with self.assertRaises(KeyError):
+                archive['four']
+
+    def testReadUnaligned(self):
+        # Matrix data starts 16 bytes after the start of the key, hence the
+        # data of the first matrix is at byte offset 17.
+        keys = ['a', 'bb', 'ccc', 'dddd']
+        with kaldi.util.table.MatrixWriter('ark:' + self.filename) as writer:
+            for i, key in enumerate(keys):
+                writer[key] = Matrix(np.arange(6).reshape((2, 3)) + i)
+
+        with kaldi.util.table.MmapMatrixArchive(self.filename) as archive:
+            self.assertFalse(archive.numpy('a').flags.aligned)
+            for i, key in enumerate(keys):
+                expected = np.arange(6).reshape((2, 3)) + i
+                array = archive.numpy(key)
+                self.assertTrue(np.array_equal(expected, array))
+                value = archive[key].numpy()
+                self.assertTrue(np.array_equal(expected, value))
+                self.assertTrue(value.flags.aligned)
+                self.assertEqual(array.flags.aligned,
+                                 np.shares_memory(array, value))
+
+    def testReadCompressed(self):
+        m = Matrix(np.arange(40).reshape((10, 4)))
+        with kaldi.util.table.CompressedMatrixWriter('ark:' + self.filename) as writer:
+            for method in [compressed.CompressionMethod.SPEECH_FEATURE,
+                           compressed.CompressionMethod.TWO_BYTE_AUTO,
+                           compressed.CompressionMethod.ONE_BYTE_AUTO]:
+                writer[str(method)] = compressed.CompressedMatrix.new(m, method)
+
+        with kaldi.util.table.RandomAccessMatrixReader('ark:' + self.filename) as reader:
+            with kaldi.util.table.MmapMatrixArchive(self.filename) as archive:
+                self.assertEqual(3, len(archive))
+                for key in archive.keys():
+                    self.assertTrue(np.allclose(reader[key].numpy(),
+                                                archive[key].numpy(),
+                                                atol=1e-4))
+                    self.assertTrue(np.allclose(reader[key].numpy()[2:5],
+                                                archive.numpy(key, 2, 5),
+                                                atol=1e-4))
+
+    def testReadCompressedRows(self):
+        m = Matrix(np.arange(40).reshape((10, 4)))
+        with kaldi.util.table.CompressedMatrixWriter('ark:' + self.filename) as writer:
+            writer['one'] = compressed.CompressedMatrix.new(m)
+
+        with kaldi.util.table.SequentialCompressedMatrixReader('ark:' + self.filename) as reader:
+            for key, cmat in reader:
+                self.assertEqual((10, 4), (cmat.num_rows, cmat.num_cols))
+                full = compressed.decompress_rows(cmat).numpy()
+                self.assertTrue(np.allclose(m.numpy(), full, atol=1.0))
+                rows = compressed.decompress_rows(cmat, 2, 5)
+                self.assertTrue(np.array_equal(full[2:5], rows.numpy()))
+                out = Matrix(12, 4)
+                compressed.decompress_rows(cmat, 7, out=SubMatrix(out, 1, 3))
+                self.assertTrue(np.array_equal(full[7:], out.numpy()[1:4]))
+                with self.assertRaises(IndexError):
+                    compressed.decompress_rows(cmat, 8, 11)
+
+
+################################################################################################################
+# Archive Indexes
+################################################################################################################
+class TestIndexedArchiveReader(unittest.TestCase):
+    def setUp(self):
+        self.filename = '/tmp/temp.ark'
+        self.index_filename = self.filename + '.idx'
+
+    def tearDown(self):
+        for filename in [self.filename, self.index_filename]:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def writeExample(self, write_index):
+        with kaldi.util.table.MatrixWriter('ark:' + self.filename,
+                                           write_index) as writer:
+            writer['one'] = Matrix(np.arange(9).reshape((3, 3)))
+            writer['two'] = Matrix([[1.0], [2.0], [3.0]])
+            writer['three'] = Matrix()
+
+    def checkRead(self, reader):
+        self.assertEqual(3, len(reader))
+        self.assertEqual(['one', 'two', 'three'], reader.keys())
+        self.assertTrue('two' in reader)
+        self.assertFalse('four' in reader)
+        self.assertTrue(np.array_equal([[1.0], [2.0], [3.0]],
+                                       reader['two'].numpy()))
+        self.assertTrue(np.array_equal(np.arange(9).reshape((3, 3)),
+                                       reader['one'].numpy()))
+        self.assertEqual(0, len(reader['three'].numpy()))
+
+        with self.assertRaises(KeyError):
+            reader['four']
+
+        keys = [k for start, stop in reader.split(2)
+                for k, v in reader.read_range(start, stop)]
+        self.assertEqual(['one', 'two', 'three'], keys)
+
+    def testWriteIndex(self):
+        self.writeExample(True)
+        self.assertTrue(os.path.exists(self.index_filename))
+
+        index = kaldi.util.table.ArchiveIndex.read(self.index_filename)
+        self.assertEqual('FM', index.lookup('one')[2])
+        self.checkRead(kaldi.util.table.IndexedArchiveReader(
+            kaldi.util.table.SequentialMatrixReader, self.filename))
+
+    def testScan(self):
+        self.writeExample(False)
+        self.assertFalse(os.path.exists(self.index_filename))
+
+        index = kaldi.util.table.ArchiveIndex.scan(self.filename)
+        self.checkRead(kaldi.util.table.IndexedArchiveReader(
+            kaldi.util.table.SequentialMatrixReader, self.filename, index))
+
+    def testFromScript(self):
+        scp = self.filename + '.scp'
+        with kaldi.util.table.MatrixWriter(
+                'ark,scp:{},{}'.format(self.filename, scp)) as writer:
+            writer['one'] = Matrix(np.arange(9).reshape((3, 3)))
+            writer['two'] = Matrix([[1.0], [2.0], [3.0]])
+            writer['three'] = Matrix()
+
+        try:
+            index = kaldi.util.table.ArchiveIndex.from_script(self.filename,
+                                                              scp)
+            self.assertEqual('FM', index.lookup('two')[2])
+            self.checkRead(kaldi.util.table.IndexedArchiveReader(
+                kaldi.util.table.SequentialMatrixReader, self.filename,
+                index))
+
+            with self.assertRaises(ValueError):
+                kaldi.util.table.ArchiveIndex.from_script('/tmp/other.ark',
+                                                          scp)
+        finally:
+            os.remove(scp)
+
 
 if __name__ == '__main__':
     unittest.main()
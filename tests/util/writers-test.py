@@ -2,8 +2,13 @@ from __future__ import division
 import os
 import unittest
 
+import numpy as np
+
 from kaldi.matrix import Vector, Matrix, SubMatrix, SubVector
 from kaldi.util import *
+import kaldi.util.table
+from kaldi.util.table import (MatrixWriter, SequentialMatrixReader,
+                              SequentialVectorReader, VectorWriter)
 
 from .mixins import *
 
@@ -57,15 +62,84 @@ class _TestWriters(AuxMixin):
         # Check that the file exists after closing the writer
         self.assertTrue(os.path.exists(self.filename))
 
+    def testAsyncWrite(self):
+        obj = self.getExampleObj()
+        writer = getattr(kaldi.util.table, self.classname)(self.rspecifier,
+                                                           async_write=2)
+        keys = ["myobj{}".format(i) for i in range(10)]
+        for key in keys:
+            writer[key] = obj[0]
+        writer.flush()
+        self.assertTrue(writer.close())
+        self.assertFalse(writer.is_open())
+
+        # Check that the entries are written in order
+        reader_type = getattr(kaldi.util.table, "Sequential"
+                              + self.classname[:-len("Writer")] + "Reader")
+        with reader_type(self.rspecifier) as reader:
+            self.assertEqual(keys, [key for key, _ in reader])
+
+    def testCompression(self):
+        obj = self.getExampleObj()
+        filename = self.filename + '.gz'
+        try:
+            with getattr(kaldi.util.table, self.classname)(
+                    'ark:' + filename, compression='infer') as writer:
+                writer["myobj"] = obj[0]
+
+            reader_type = getattr(kaldi.util.table, "Sequential"
+                                  + self.classname[:-len("Writer")] + "Reader")
+            with reader_type('ark:' + filename,
+                             compression='gzip') as reader:
+                self.assertEqual(["myobj"], [key for key, _ in reader])
+
+            with self.assertRaises(ValueError):
+                getattr(kaldi.util.table, self.classname)(
+                    'ark,scp:{},{}.scp'.format(filename, self.filename),
+                    compression='gzip')
+        finally:
+            if os.path.exists(filename):
+                os.remove(filename)
+
 class TestVectorWriter(_TestWriters, unittest.TestCase):
     def getExampleObj(self):
         return [Vector([1, 2, 3, 4, 5]),
-                SubVector(Vector([1, 2, 3, 4, 5]))]
+                SubVector(Vector([1, 2, 3, 4, 5])),
+                np.array([1, 2, 3, 4, 5], dtype=np.float32)]
+
+    def testWriteViews(self):
+        array = np.arange(10, dtype=np.float32)
+        values = {"one": SubVector(array, 2, 5), "two": array[5:],
+                  "three": Vector([1, 2, 3])}
+        with VectorWriter('ark:' + self.filename) as writer:
+            for key in ["one", "two", "three"]:
+                writer[key] = values[key]
+
+        with SequentialVectorReader('ark:' + self.filename) as reader:
+            output = [(key, value.numpy()) for key, value in reader]
+        self.assertEqual(["one", "two", "three"], [key for key, _ in output])
+        for key, value in output:
+            self.assertTrue(np.array_equal(np.asarray(values[key]), value))
 
 class TestMatrixWriter(_TestWriters, unittest.TestCase):
     def getExampleObj(self):
         return [Matrix([[3, 5], [7, 11]]),
-                SubMatrix(Matrix([[3, 5], [7, 11]]))]
+                SubMatrix(Matrix([[3, 5], [7, 11]])),
+                np.array([[3, 5], [7, 11]], dtype=np.float32)]
+
+    def testWriteViews(self):
+        array = np.arange(24, dtype=np.float32).reshape((6, 4))
+        values = {"one": SubMatrix(array, 1, 3, 1, 2), "two": array[3:],
+                  "three": Matrix([[1, 2], [3, 4]])}
+        with MatrixWriter('ark:' + self.filename) as writer:
+            for key in ["one", "two", "three"]:
+                writer[key] = values[key]
+
+        with SequentialMatrixReader('ark:' + self.filename) as reader:
+            output = [(key, value.numpy()) for key, value in reader]
+        self.assertEqual(["one", "two", "three"], [key for key, _ in output])
+        for key, value in output:
+            self.assertTrue(np.array_equal(np.asarray(values[key]), value))
 
 class TestIntWriter(_TestWriters, unittest.TestCase):
     def getExampleObj(self):